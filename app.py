@@ -23,6 +23,7 @@ from models import db, User, Admin, init_db
 from auth import init_login_manager
 from routes import register_routes
 from tasks.order_processor import start_order_processor
+from tasks.risk_precompute import start_risk_precompute
 from routes.user.ai_analysis import ai_analysis
 
 # 设置环境变量，禁用兼容性警告
@@ -58,15 +59,20 @@ def create_app():
     # 注册路由
     register_routes(app)
     
-    # 启动订单处理器
+    # 启动订单处理器（多进程部署时由主节点锁保证只有一个进程实际处理订单）
     processor = start_order_processor(app)
     app.order_processor = processor  # 保存处理器实例以便后续使用
     
+    # 启动风险指标预计算任务（新行情写入后为常用股票和持仓股票预先计算风险指标）
+    app.risk_precompute = start_risk_precompute(app)
+    
     # 注册关闭处理器的函数
     def cleanup():
         if hasattr(app, 'order_processor'):
             app.order_processor.stop()
             app.logger.info("订单处理器已停止")
+        if hasattr(app, 'risk_precompute'):
+            app.risk_precompute.stop()
     
     atexit.register(cleanup)
     app.logger.info("订单处理器已启动")
@@ -46,6 +46,50 @@ ADMIN_LOCKOUT_DURATION = 2    # 管理员账户锁定时间（分钟）
 
 # 订单处理配置
 ORDER_CHECK_INTERVAL = 5  # 订单处理器检查间隔（秒）
+ORDER_BOOK_RESYNC_INTERVAL = 300  # 内存订单簿从数据库全量重建的间隔（秒），用于纠正与数据库的偏差
+ORDER_TRIGGER_MODE = 'event'  # 订单处理器触发模式: 'event' 由订单/行情变更唤醒，'poll' 按固定间隔轮询
+ORDER_FALLBACK_INTERVAL = 60  # 事件模式下的兜底轮询间隔（秒），用于处理其它进程中的撤单等变更
+ORDER_CHANGE_POLL_INTERVAL = 1  # 事件模式下主节点检查其它进程新订单/新行情的间隔（秒），其它进程无法直接唤醒处理器
+ORDER_WORKER_COUNT = 4  # 订单执行线程数，按 user_id 分片并行执行；设为1时在处理器线程中串行执行
+ORDER_BATCH_SIZE = 100  # 每个执行线程单次事务中批量执行的最大订单数，设为1时逐单提交
+ORDER_LEADER_LOCK_NAME = 'stock_data_v1.order_processor'  # 订单处理器主节点锁名称（MySQL GET_LOCK），多进程部署时只有持锁进程处理订单
+ORDER_LEADER_RETRY_INTERVAL = 3  # 非主节点进程重试获取主节点锁的间隔（秒），决定故障切换时间
+
+# 历史行情缓存配置
+HISTORY_CACHE_TTL = 900  # yfinance 历史行情缓存有效期（秒）
+HISTORY_CACHE_MAX_BYTES = 64 * 1024 * 1024  # 历史行情缓存占用内存上限（字节），超出时按最近最少使用淘汰
+
+# 基本面数据获取配置
+FUNDAMENTALS_MAX_WORKERS = 8  # 并发获取基本面数据的最大线程数
+FUNDAMENTALS_TIMEOUT = 10  # 每轮基本面请求（每个线程一个请求）的超时时间（秒），总等待时间按轮数放大，超时的数据按缺失处理
+
+# 行情数据导入配置
+STOCK_HISTORY_START = '2018-01-01'  # 数据库中没有某只股票的行情时，从该日期开始获取历史数据
+UPSERT_CHUNK_SIZE = 1000  # 增量写入时每条批量 INSERT ... ON DUPLICATE KEY UPDATE 语句包含的行数
+STOCK_FETCH_MAX_WORKERS = 8  # 并发获取股票数据的最大线程数
+STOCK_FETCH_RATE = 5  # 所有线程合计每秒最多发起的 yfinance 请求数
+STOCK_FETCH_RETRIES = 3  # yfinance 请求失败后的最大重试次数
+STOCK_FETCH_BACKOFF = 1.0  # 第一次重试前的等待时间（秒），之后每次翻倍并加随机抖动
+
+# 列式行情存储配置
+COLUMNAR_STORE_ENABLED = True  # 图表、风险分析和蒙特卡洛模拟是否从列式存储读取历史行情
+COLUMNAR_STORE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'columnar')  # 每只股票一个内存映射文件的存储目录
+
+# 风险指标预计算配置
+RISK_SNAPSHOT_WINDOWS = [365, 1095]  # 预计算的回看窗口（自然日），与分析页面日期范围相差不超过1天时直接返回预计算结果
+RISK_SNAPSHOT_CHECK_INTERVAL = 60  # 预计算任务检查新行情的间隔（秒）
+RISK_SNAPSHOT_LOCK_NAME = 'stock_data_v1.risk_snapshot'  # 预计算任务主节点锁名称（MySQL GET_LOCK），多进程部署时只有持锁进程计算
+
+# 蒙特卡洛模拟配置
+MONTE_CARLO_MAX_SIMULATIONS = 100000  # 单次模拟允许的最大路径数
+MONTE_CARLO_MAX_FULL_SIMULATIONS = 1000  # JSON 格式返回全部路径（mode=full）时允许的最大路径数，更多路径需使用二进制格式
+MONTE_CARLO_SAMPLE_PATHS = 10  # 摘要结果中返回的代表性路径数
+MONTE_CARLO_HISTOGRAM_BINS = 50  # 摘要结果中期末价格直方图的分箱数
+MONTE_CARLO_BAND_PATHS = 20000  # 计算每日百分位带时最多使用的路径数，超出时等间隔抽取
+MONTE_CARLO_STREAM_BATCH = 5000  # 二进制流式输出时每批模拟的路径数，决定输出时的内存峰值
+MONTE_CARLO_CACHE_TTL = 3600  # 模拟结果缓存有效期（秒），该股票写入新行情时立即失效
+MONTE_CARLO_CACHE_MAX_BYTES = 32 * 1024 * 1024  # 模拟结果缓存占用内存上限（字节），超出时按最近最少使用淘汰
+MONTE_CARLO_MAX_PORTFOLIO_ELEMENTS = 40000000  # 组合模拟的路径数 x 天数 x 股票数上限，限制一次向量化模拟的内存
 
 # 应用运行配置
 DEBUG = True
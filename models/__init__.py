@@ -18,7 +18,9 @@ db = SQLAlchemy()
 # 导入所有模型
 from .user import User
 from .admin import Admin, AdminError, AdminAuthError, AdminAccountLockedError, PasswordComplexityError
-from .market import MarketData, FundamentalData, BalanceSheet, IncomeStatement
+from .market import (
+    MarketData, LatestQuote, RiskMetrics, FundamentalData, BalanceSheet, IncomeStatement, IngestionCheckpoint
+)
 from .trade import Order, Transaction, Portfolio
 from .finance import AccountBalance, FundTransaction
 from .enums import OrderType, OrderExecutionType, OrderStatus, TransactionStatus, AccountStatus
@@ -78,10 +80,25 @@ def _check_and_create_tables(app):
         # 创建所有表
         db.create_all()
         logger.info("数据库表已创建/更新")
+        # create_all 不会修改已存在的表，需要单独补建模型中新增的索引
+        _ensure_indexes()
     except Exception as e:
         logger.error(f"创建/更新表时出错: {str(e)}", exc_info=True)
         raise
 
+def _ensure_indexes():
+    """为已存在的表补建模型中定义、但数据库中缺少的索引"""
+    inspector = sqlalchemy.inspect(db.engine)
+    tables = set(inspector.get_table_names())
+    for table in db.metadata.sorted_tables:
+        if table.name not in tables:
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                logger.info(f"为表 {table.name} 创建索引 {index.name}")
+                index.create(bind=db.engine)
+
 def _ensure_user_balances():
     """确保每个用户都有一个账户余额记录"""
     with session_scope() as session:
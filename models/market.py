@@ -1,6 +1,7 @@
 """
 Market data related model definitions
-Include stock market data, fundamental data, balance sheet and income statement
+Include stock market data, latest quotes, precomputed risk metrics, fundamental data, balance sheet, income statement
+and ingestion checkpoints
 """
 from . import db
 from datetime import datetime
@@ -40,6 +41,109 @@ class MarketData(db.Model):
         """
         return f'<MarketData {self.ticker} @ {self.date.strftime("%Y-%m-%d")}>'
 
+class LatestQuote(db.Model):
+    """
+    Latest quote model
+    Corresponds to the latest_quote table in the database
+    Keep one row per stock with the most recent market_data row, so quote lookups
+    read by primary key instead of searching the historical market_data table
+    
+    Attributes:
+        ticker (str): Stock code, e.g. 'AAPL', max 10 characters, primary key
+        date (datetime): Date of the latest market data row
+        open (NUMERIC): Opening price, accurate to 0.0001
+        high (NUMERIC): Highest price of the day, accurate to 0.0001
+        low (NUMERIC): Lowest price of the day, accurate to 0.0001
+        close (NUMERIC): Closing price, accurate to 0.0001
+        volume (BigInteger): Transaction volume (shares)
+        bar_count (int): Number of market_data rows of the stock
+        collected_at (datetime): Latest data_collected_at of the stock's market_data rows;
+            together with bar_count it changes whenever the loader adds or rewrites any row
+        updated_at (datetime): Time the quote was last refreshed
+    """
+    __tablename__ = 'latest_quote'
+    
+    ticker = db.Column(db.String(10), primary_key=True, nullable=False)
+    date = db.Column(db.DateTime, nullable=False)
+    open = db.Column(NUMERIC(12,4), nullable=True)
+    high = db.Column(NUMERIC(12,4), nullable=True)
+    low = db.Column(NUMERIC(12,4), nullable=True)
+    close = db.Column(NUMERIC(12,4), nullable=True)
+    volume = db.Column(db.BigInteger, nullable=True)
+    bar_count = db.Column(db.Integer, nullable=True)
+    collected_at = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+    
+    def __repr__(self):
+        """
+        Model string representation
+        """
+        return f'<LatestQuote {self.ticker} @ {self.date.strftime("%Y-%m-%d")}>'
+
+class RiskMetrics(db.Model):
+    """
+    Precomputed risk metrics model
+    Corresponds to the risk_metrics table in the database
+    Store the risk metrics of a stock over a lookback window ending at the latest market data date,
+    filled by the background risk precompute job so the analysis API does not recompute them per request
+    
+    Attributes:
+        ticker (str): Stock code, e.g. 'AAPL', max 10 characters, primary key
+        window_days (Integer): Lookback window in calendar days, primary key
+        as_of_date (Date): Last market data date included in the window, primary key
+        data_available (Boolean): Whether there was enough price data to calculate the metrics
+        error_message (str): Reason the metrics are unavailable
+        volatility ... downside_deviation (Float): Metrics, same keys as ValuationRiskMonitor.risk_metrics
+        computed_at (datetime): Time the metrics were calculated
+    """
+    __tablename__ = 'risk_metrics'
+    
+    # Metric columns, in the order of ValuationRiskMonitor.risk_metrics
+    METRIC_COLUMNS = (
+        'volatility', 'sharpe_ratio', 'max_drawdown', 'var_95', 'var_99', 'skewness', 'kurtosis',
+        'beta', 'r_squared', 'residual_risk', 'systematic_risk_pct', 'information_ratio',
+        'treynor_ratio', 'sortino_ratio', 'downside_deviation'
+    )
+    
+    ticker = db.Column(db.String(10), primary_key=True, nullable=False)
+    window_days = db.Column(db.Integer, primary_key=True, nullable=False)
+    as_of_date = db.Column(db.Date, primary_key=True, nullable=False)
+    data_available = db.Column(db.Boolean, nullable=False, default=True)
+    error_message = db.Column(db.String(255), nullable=True)
+    volatility = db.Column(db.Float, nullable=True)
+    sharpe_ratio = db.Column(db.Float, nullable=True)
+    max_drawdown = db.Column(db.Float, nullable=True)
+    var_95 = db.Column(db.Float, nullable=True)
+    var_99 = db.Column(db.Float, nullable=True)
+    skewness = db.Column(db.Float, nullable=True)
+    kurtosis = db.Column(db.Float, nullable=True)
+    beta = db.Column(db.Float, nullable=True)
+    r_squared = db.Column(db.Float, nullable=True)
+    residual_risk = db.Column(db.Float, nullable=True)
+    systematic_risk_pct = db.Column(db.Float, nullable=True)
+    information_ratio = db.Column(db.Float, nullable=True)
+    treynor_ratio = db.Column(db.Float, nullable=True)
+    sortino_ratio = db.Column(db.Float, nullable=True)
+    downside_deviation = db.Column(db.Float, nullable=True)
+    computed_at = db.Column(db.DateTime, default=datetime.now)
+    
+    def to_metrics(self):
+        """
+        Convert to a metrics dict in the format of ValuationRiskMonitor.risk_metrics
+        """
+        if not self.data_available:
+            return {'data_available': False, 'error_message': self.error_message}
+        metrics = {'data_available': True}
+        for column in self.METRIC_COLUMNS:
+            metrics[column] = getattr(self, column)
+        return metrics
+    
+    def __repr__(self):
+        """
+        Model string representation
+        """
+        return f'<RiskMetrics {self.ticker} {self.window_days}d @ {self.as_of_date}>'
+
 class FundamentalData(db.Model):
     """
     Stock fundamental data model
@@ -140,4 +244,30 @@ class IncomeStatement(db.Model):
         """
         Model string representation
         """
-        return f'<IncomeStatement {self.ticker} @ {self.date.strftime("%Y-%m-%d")}>'
\ No newline at end of file
+        return f'<IncomeStatement {self.ticker} @ {self.date.strftime("%Y-%m-%d")}>'
+
+class IngestionCheckpoint(db.Model):
+    """
+    Ingestion checkpoint model
+    Corresponds to the ingestion_checkpoint table in the database
+    Record each ticker written by a streaming data collection run, in the same transaction
+    as its data, so an interrupted run resumes with the tickers that did not finish
+    
+    Attributes:
+        run_id (str): Collection run identifier, primary key
+        ticker (str): Stock code, e.g. 'AAPL', max 10 characters, primary key
+        market_rows (Integer): Number of market data rows written for the ticker
+        completed_at (datetime): Time the ticker's data was committed
+    """
+    __tablename__ = 'ingestion_checkpoint'
+    
+    run_id = db.Column(db.String(64), primary_key=True, nullable=False)
+    ticker = db.Column(db.String(10), primary_key=True, nullable=False)
+    market_rows = db.Column(db.Integer, nullable=False, default=0)
+    completed_at = db.Column(db.DateTime, default=datetime.now)
+    
+    def __repr__(self):
+        """
+        Model string representation
+        """
+        return f'<IngestionCheckpoint {self.run_id} {self.ticker}>'
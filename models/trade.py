@@ -29,6 +29,14 @@ class Order(db.Model):
         remark (Text): Remark information, used to store rejection reasons
     """
     __tablename__ = 'orders'
+    __table_args__ = (
+        # Composite index for the order processor's pending order scans:
+        # equality on status/execution type, then ticker and price ranges.
+        # order_type and user_id are appended so the scans are covered by the index
+        # (InnoDB secondary indexes also carry the primary key order_id)
+        db.Index('ix_orders_pending_scan', 'order_status', 'order_execution_type', 'ticker', 'order_price',
+                 'order_type', 'user_id'),
+    )
     
     order_id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.user_id'), nullable=False)
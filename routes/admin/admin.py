@@ -10,6 +10,7 @@ from datetime import datetime, timedelta
 from sqlalchemy import func, desc, asc
 import pandas as pd
 from utils import create_safe_dict
+from utils.order_book import order_book
 
 from . import admin_bp
 
@@ -406,5 +407,7 @@ def reject_order(order_id):
              pass # Add actual unfreeze logic here
 
     db.session.commit()
+    # Remove the rejected order from the in-memory order book
+    order_book.remove_order(order.order_id)
     flash(f'Order #{order_id} has been rejected.', 'success')
     return redirect(url_for('admin.manage_orders', user_email=order.user.user_email)) 
\ No newline at end of file
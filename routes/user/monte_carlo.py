@@ -1,9 +1,16 @@
 """
 蒙特卡洛模拟API路由
 """
-from flask import Blueprint, jsonify, request
-from flask_login import login_required
-from utils.monte_carlo import monte_carlo_simulation
+from flask import Blueprint, jsonify, request, Response
+from flask_login import login_required, current_user
+import numpy as np
+from models import Portfolio
+from utils.monte_carlo import (
+    monte_carlo_simulation, stream_simulation_binary, portfolio_monte_carlo_simulation,
+    SIMULATION_MODELS, PORTFOLIO_MODELS
+)
+from utils.simulation_cache import simulation_cache
+from config import MONTE_CARLO_MAX_SIMULATIONS, MONTE_CARLO_MAX_FULL_SIMULATIONS, MONTE_CARLO_MAX_PORTFOLIO_ELEMENTS
 import traceback
 
 # 蒙特卡洛相关蓝图
@@ -20,11 +27,25 @@ def get_monte_carlo_simulation(ticker):
     查询参数:
         days (int): 可选，模拟天数，默认60天
         simulations (int): 可选，模拟次数，默认200次
+        precision (str): 可选，路径数值精度 'float64' 或 'float32'，JSON 默认 float64，二进制默认 float32
+        seed (int): 可选，随机数种子，相同种子和参数得到相同的模拟结果
+        model (str): 可选，收益模型 'gbm'（默认，固定漂移和波动率）、'bootstrap'（有放回抽取历史日收益）
+            或 'garch'（按历史数据拟合的 GARCH(1,1) 时变波动率）
+        mode (str): 可选，'summary'（默认）只返回每日百分位带、代表性路径和期末价格直方图，
+            'full' 额外返回全部路径 all_paths（JSON 格式最多 MONTE_CARLO_MAX_FULL_SIMULATIONS 条路径）
+        format (str): 可选，'json'（默认）或 'binary'
+            binary 按批次流式返回全部路径: 4字节小端长度 + JSON头（ticker、dates、simulations、days、dtype等）
+            + simulations x days 个小端浮点数（按路径逐行排列），服务端内存只保留一个批次
     """
     try:
         # 获取并验证参数
         days = request.args.get('days', default=60, type=int)
         simulations = request.args.get('simulations', default=200, type=int)
+        output_format = request.args.get('format', default='json')
+        precision = request.args.get('precision', default='float32' if output_format == 'binary' else 'float64')
+        seed = request.args.get('seed', default=None, type=int)
+        mode = request.args.get('mode', default='summary')
+        model = request.args.get('model', default='gbm')
         
         # 参数验证
         if days <= 0 or days > 365:
@@ -32,13 +53,51 @@ def get_monte_carlo_simulation(ticker):
                 'error': f'模拟天数必须在1-365之间，当前值: {days}'
             }), 400
             
-        if simulations <= 0 or simulations > 1000:
+        if simulations <= 0 or simulations > MONTE_CARLO_MAX_SIMULATIONS:
             return jsonify({
-                'error': f'模拟次数必须在1-1000之间，当前值: {simulations}'
+                'error': f'模拟次数必须在1-{MONTE_CARLO_MAX_SIMULATIONS}之间，当前值: {simulations}'
+            }), 400
+        
+        if precision not in ('float64', 'float32'):
+            return jsonify({
+                'error': f'数值精度必须是 float64 或 float32，当前值: {precision}'
+            }), 400
+            
+        if model not in SIMULATION_MODELS:
+            return jsonify({
+                'error': f'收益模型必须是 {"、".join(SIMULATION_MODELS)} 之一，当前值: {model}'
             }), 400
             
+        if mode not in ('summary', 'full'):
+            return jsonify({
+                'error': f'返回模式必须是 summary 或 full，当前值: {mode}'
+            }), 400
+        
+        if output_format not in ('json', 'binary'):
+            return jsonify({
+                'error': f'返回格式必须是 json 或 binary，当前值: {output_format}'
+            }), 400
+        
+        if mode == 'full' and output_format == 'json' and simulations > MONTE_CARLO_MAX_FULL_SIMULATIONS:
+            # 全部路径转成 Python 列表和 JSON 字符串的内存约为原始数组的数十倍
+            return jsonify({
+                'error': f'返回全部路径时模拟次数不能超过 {MONTE_CARLO_MAX_FULL_SIMULATIONS}，当前值: {simulations}，'
+                         f'更多路径请使用 format=binary'
+            }), 400
+        
+        if output_format == 'binary':
+            # 全部路径直接从 NumPy 缓冲区分批写出，不经过 Python 列表和 JSON 字符串
+            header, length, chunks = stream_simulation_binary(ticker, days, simulations, dtype=np.dtype(precision).type,
+                                                              seed=seed, model=model)
+            return Response(chunks, mimetype='application/octet-stream', headers={
+                'Content-Length': str(length),
+                'Content-Disposition': f'attachment; filename={ticker}_monte_carlo.bin'
+            })
+            
         # 直接调用模拟函数
-        result = monte_carlo_simulation(ticker, days, simulations)
+        # 相同参数且历史行情截止日期相同的模拟直接使用缓存结果
+        result = monte_carlo_simulation(ticker, days, simulations, dtype=np.dtype(precision).type, seed=seed,
+                                        include_paths=(mode == 'full'), cache=simulation_cache, model=model)
         
         # 直接返回结果，不再嵌套
         return jsonify(result)
@@ -52,4 +111,83 @@ def get_monte_carlo_simulation(ticker):
         # 返回友好的错误信息
         return jsonify({
             'error': f'模拟失败: {error_msg}'
-        }), 500 
\ No newline at end of file
+        }), 500 
+
+@monte_carlo_bp.route('/api/monte-carlo/cache-stats', methods=['GET'])
+@login_required
+def get_monte_carlo_cache_stats():
+    """
+    获取模拟结果缓存的统计信息（条目数、占用字节数、命中和未命中次数），用于调整缓存大小
+    """
+    stats = simulation_cache.stats()
+    stats['max_bytes'] = simulation_cache.max_bytes
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = stats['hits'] / lookups if lookups else None
+    return jsonify(stats)
+
+@monte_carlo_bp.route('/api/monte-carlo/portfolio', methods=['GET'])
+@login_required
+def get_portfolio_monte_carlo_simulation():
+    """
+    获取当前用户整个投资组合的蒙特卡洛模拟数据
+    所有持仓的历史行情一次批量读取，按收益协方差生成相关路径并在一个向量化批次中模拟，
+    不需要对每只股票分别请求
+    
+    查询参数:
+        days (int): 可选，模拟天数，默认60天
+        simulations (int): 可选，模拟次数，默认200次
+        precision (str): 可选，路径数值精度 'float64'（默认）或 'float32'
+        seed (int): 可选，随机数种子
+        model (str): 可选，'gbm'（默认，按收益协方差的 Cholesky 分解生成相关冲击）
+            或 'bootstrap'（按整日抽取所有持仓的历史收益，保留股票间的联动）
+    """
+    try:
+        days = request.args.get('days', default=60, type=int)
+        simulations = request.args.get('simulations', default=200, type=int)
+        precision = request.args.get('precision', default='float64')
+        seed = request.args.get('seed', default=None, type=int)
+        model = request.args.get('model', default='gbm')
+        
+        if days <= 0 or days > 365:
+            return jsonify({
+                'error': f'模拟天数必须在1-365之间，当前值: {days}'
+            }), 400
+            
+        if simulations <= 0 or simulations > MONTE_CARLO_MAX_SIMULATIONS:
+            return jsonify({
+                'error': f'模拟次数必须在1-{MONTE_CARLO_MAX_SIMULATIONS}之间，当前值: {simulations}'
+            }), 400
+        
+        if precision not in ('float64', 'float32'):
+            return jsonify({
+                'error': f'数值精度必须是 float64 或 float32，当前值: {precision}'
+            }), 400
+            
+        if model not in PORTFOLIO_MODELS:
+            return jsonify({
+                'error': f'组合模拟的收益模型必须是 {"、".join(PORTFOLIO_MODELS)} 之一，当前值: {model}'
+            }), 400
+        
+        holdings = {
+            item.ticker: item.quantity
+            for item in Portfolio.query.filter(Portfolio.user_id == current_user.user_id, Portfolio.quantity > 0)
+        }
+        if not holdings:
+            return jsonify({'error': '当前没有持仓，无法进行组合模拟'}), 400
+            
+        if simulations * days * len(holdings) > MONTE_CARLO_MAX_PORTFOLIO_ELEMENTS:
+            return jsonify({
+                'error': f'模拟次数 x 天数 x 持仓股票数不能超过 {MONTE_CARLO_MAX_PORTFOLIO_ELEMENTS}，请减少模拟次数或天数'
+            }), 400
+        
+        result = portfolio_monte_carlo_simulation(holdings, days, simulations, dtype=np.dtype(precision).type,
+                                                  seed=seed, model=model)
+        return jsonify(result)
+        
+    except Exception as e:
+        error_msg = str(e)
+        print(f"组合蒙特卡洛模拟API错误: {error_msg}")
+        print(traceback.format_exc())
+        return jsonify({
+            'error': f'模拟失败: {error_msg}'
+        }), 500
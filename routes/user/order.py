@@ -7,6 +7,7 @@ from flask_login import login_required, current_user
 from datetime import datetime
 from models import db, Order, AccountBalance
 from utils.order_utils import process_new_order, simplified_process_order
+from utils.order_book import order_book
 from models.enums import OrderStatus, OrderType, OrderExecutionType
 from decimal import Decimal
 
@@ -102,6 +103,9 @@ def cancel_order(order_id):
         
         db.session.commit()
         
+        # Remove the cancelled order from the in-memory order book
+        order_book.remove_order(order.order_id)
+        
         # Check if it's an AJAX request
         if request.headers.get('Content-Type') == 'application/json':
             return jsonify({
@@ -16,7 +16,17 @@ import traceback
 from werkzeug.datastructures import MultiDict
 
 from . import user_bp
-from utils.risk_monitor import run_analysis_text_only_simple
+from utils.risk_monitor import ValuationRiskMonitor, run_analysis_text_only_batch
+from utils.rolling_metrics import ROLLING_WINDOWS
+from utils.latest_quote import get_latest_quote
+from utils.risk_snapshot import get_precomputed_risk_assessments
+from utils.price_history import ColumnarHistoryProvider, DatabaseHistoryProvider, HISTORY_COLUMNS
+from config import COLUMNAR_STORE_ENABLED
+
+# 图表行情数据只读取本地存储的数据，没有数据时由接口单独从 Yahoo Finance 获取
+_chart_history_provider = (
+    ColumnarHistoryProvider(fallback=False) if COLUMNAR_STORE_ENABLED else DatabaseHistoryProvider(fallback=False)
+)
 
 @user_bp.route('/stock_chart')
 @login_required
@@ -78,29 +88,40 @@ def api_stock_analysis():
         except ValueError as e:
             return jsonify({'error': f'日期格式无效: {str(e)}'}), 400
         
-        # 存储所有股票的风险评估结果
-        results = []
+        tickers = [ticker.strip() for ticker in tickers if ticker and ticker.strip()]
         
-        # 对每个股票进行风险评估
-        for ticker in tickers:
+        # 日期范围与预计算窗口一致且截止到最新行情时，直接读取预计算的风险指标
+        try:
+            assessments = get_precomputed_risk_assessments(tickers, start_date, end_date)
+        except Exception as snapshot_e:
+            print(f"读取预计算风险指标失败，改为实时计算: {str(snapshot_e)}")
+            assessments = {}
+        
+        # 其余股票实时计算：一次性获取所有股票和基准指数的行情，基准数据在整个请求中共享
+        live_tickers = [ticker for ticker in tickers if ticker not in assessments]
+        risk_error = None
+        if live_tickers:
             try:
-                # 传递ticker字符串和日期范围
-                risk_assessment = run_analysis_text_only_simple(ticker, str(start_date.date()), str(end_date.date()))
-                
-                # 组装单个股票的结果
-                stock_result = {
-                    'ticker': ticker,
-                    'risk_assessment': risk_assessment,
-                }
-                results.append(stock_result)
+                assessments.update(run_analysis_text_only_batch(live_tickers, str(start_date.date()), str(end_date.date())))
             except Exception as risk_e:
-                print(f"股票 {ticker} 风险评估计算错误: {str(risk_e)}")
+                print(f"风险评估计算错误: {str(risk_e)}")
+                risk_error = str(risk_e)
+        
+        # 存储所有股票的风险评估结果
+        results = []
+        for ticker in tickers:
+            if ticker not in assessments:
                 # 添加错误信息到结果
-                stock_result = {
+                results.append({
                     'ticker': ticker,
-                    'error': f"无法计算风险: {str(risk_e)}"
-                }
-                results.append(stock_result)
+                    'error': f"无法计算风险: {risk_error}"
+                })
+            else:
+                # 组装单个股票的结果
+                results.append({
+                    'ticker': ticker,
+                    'risk_assessment': assessments[ticker],
+                })
         
         # 组装最终结果
         final_result = {
@@ -121,6 +142,57 @@ def api_stock_analysis():
         # 返回友好的错误信息
         return jsonify({'error': f'分析失败: {error_msg}'}), 500
         
+@user_bp.route('/api/rolling_metrics')
+@login_required
+def get_rolling_metrics():
+    """
+    滚动风险指标API
+    返回股票20/60/252日滚动波动率、夏普比率、VaR、回撤和贝塔的时间序列，用于图表展示
+    指标由进程内增量维护，只读取上次计算之后新增的行情
+    """
+    ticker = request.args.get('ticker', '').strip()
+    windows_param = request.args.get('windows', default=','.join(str(size) for size in ROLLING_WINDOWS))
+    range_param = request.args.get('range', default='365')
+    
+    if not ticker:
+        return jsonify({'error': '缺少股票代码参数'}), 400
+    
+    try:
+        windows = [int(size) for size in windows_param.split(',') if size.strip()]
+    except ValueError:
+        return jsonify({'error': f'窗口参数无效: {windows_param}'}), 400
+    unsupported = [size for size in windows if size not in ROLLING_WINDOWS]
+    if not windows or unsupported:
+        return jsonify({'error': f'不支持的窗口: {windows_param}，可选值: {list(ROLLING_WINDOWS)}'}), 400
+    
+    # 与 /api/market_data 相同的时间范围参数，'all' 表示全部已计算的序列
+    if range_param == 'all':
+        start_date = None
+    else:
+        try:
+            days = int(range_param)
+        except ValueError:
+            days = 365  # 默认为一年
+        start_date = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
+    
+    try:
+        monitor = ValuationRiskMonitor([ticker], start_date)
+        if start_date is None:
+            monitor.start_date = None  # 不截取开始日期
+        rolling_metrics = monitor.calculate_rolling_metrics(windows)
+        if ticker not in rolling_metrics:
+            return jsonify({'error': f'未找到{ticker}的市场数据'}), 404
+        
+        return jsonify({
+            'ticker': ticker,
+            'benchmark': monitor.benchmark_ticker,
+            'windows': {str(size): series for size, series in rolling_metrics[ticker].items()}
+        })
+    
+    except Exception as e:
+        print(f"获取滚动风险指标失败: {str(e)}")
+        return jsonify({'error': f'获取滚动风险指标失败: {str(e)}'}), 500
+        
 @user_bp.route('/api/market_data')
 @login_required
 def get_market_data():
@@ -139,8 +211,8 @@ def get_market_data():
         
         # 处理特殊情况 - 全部时间范围
         if range_param == 'all':
-            # 查询所有时间范围的数据
-            market_data = MarketData.query.filter_by(ticker=ticker).order_by(MarketData.date).all()
+            # 查询所有时间范围的数据（列式存储中按日期切片读取，不逐行创建ORM对象）
+            market_data = _chart_history_provider.get_history(ticker)
             print(f"为股票 {ticker} 查询到 {len(market_data)} 条全部时间范围的记录")
         else:
             # 尝试将范围参数转换为天数
@@ -154,12 +226,10 @@ def get_market_data():
             start_date = end_date - timedelta(days=days)
             
             # 查询指定日期范围的数据
-            market_data = MarketData.query.filter_by(ticker=ticker).filter(
-                MarketData.date >= start_date
-            ).order_by(MarketData.date).all()
+            market_data = _chart_history_provider.get_history(ticker, start=start_date.strftime('%Y-%m-%d'))
             print(f"为股票 {ticker} 查询到 {len(market_data)} 条记录，日期范围: {start_date.strftime('%Y-%m-%d')} 至 {end_date.strftime('%Y-%m-%d')}")
         
-        if not market_data:
+        if market_data.empty:
             # 如果没有数据，尝试从YFinance获取
             print(f"数据库中没有找到 {ticker} 的数据，尝试从Yahoo Finance获取")
             try:
@@ -189,14 +259,17 @@ def get_market_data():
                 return jsonify({'error': f'未找到{ticker}的市场数据'}), 404
         
         # 格式化结果
+        # 按列整体转换为Python数值，不逐个转换NUMERIC字段
         result = [{
-            'date': item.date.strftime('%Y-%m-%d'),
-            'open': float(item.open),
-            'high': float(item.high),
-            'low': float(item.low),
-            'close': float(item.close),
-            'volume': float(item.volume)
-        } for item in market_data]
+            'date': date,
+            'open': open_price,
+            'high': high,
+            'low': low,
+            'close': close,
+            'volume': volume
+        } for date, open_price, high, low, close, volume in zip(
+            market_data.index.strftime('%Y-%m-%d'), *(market_data[column].tolist() for column in HISTORY_COLUMNS)
+        )]
         
         print(f"成功格式化并返回 {len(result)} 条 {ticker} 的市场数据")
         return jsonify(result)
@@ -386,8 +459,8 @@ def get_real_time_stock_data():
         
         if 'Global Quote' not in data or not data['Global Quote']:
             print(f"Alpha Vantage API返回无数据，回退到数据库")
-            # 如果API调用失败或没有数据，回退到使用数据库的最新记录
-            latest_data = MarketData.query.filter_by(ticker=symbol).order_by(MarketData.date.desc()).first()
+            # 如果API调用失败或没有数据，回退到使用数据库的最新行情
+            latest_data = get_latest_quote(symbol)
             
             if not latest_data:
                 return jsonify({'error': f'未找到{symbol}的数据'}), 404
@@ -481,8 +554,8 @@ def get_realtime_quote():
         
         if 'Global Quote' not in data or not data['Global Quote']:
             print(f"Alpha Vantage API返回无数据，回退到数据库")
-            # 如果API调用失败或没有数据，回退到使用数据库的最新记录
-            latest_data = MarketData.query.filter_by(ticker=ticker).order_by(MarketData.date.desc()).first()
+            # 如果API调用失败或没有数据，回退到使用数据库的最新行情
+            latest_data = get_latest_quote(ticker)
             
             if not latest_data:
                 return jsonify({'error': f'未找到{ticker}的数据'}), 404
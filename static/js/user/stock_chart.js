@@ -515,7 +515,7 @@ async function runMonteCarloSimulation() {
         console.log("蒙特卡洛模拟数据:", data);
         
         // 检查数据格式
-        if (!data || !data.dates || !Array.isArray(data.dates) || !data.all_paths || !Array.isArray(data.all_paths)) {
+        if (!data || !data.dates || !Array.isArray(data.dates) || !data.sample_paths || !Array.isArray(data.sample_paths) || !data.percentile_bands) {
             throw new Error("Received data format invalid, missing required fields");
         }
         
@@ -548,7 +548,7 @@ function updateChartWithSimulation() {
 
     // 检查必要字段
     if (!monteCarloData.dates || !Array.isArray(monteCarloData.dates) || 
-        !monteCarloData.all_paths || !Array.isArray(monteCarloData.all_paths)) {
+        !monteCarloData.sample_paths || !Array.isArray(monteCarloData.sample_paths) || !monteCarloData.percentile_bands) {
         console.error("Simulation data format incorrect", monteCarloData);
         return;
     }
@@ -598,9 +598,9 @@ function updateChartWithSimulation() {
         yAxisID: 'y1'
     });
 
-    // 添加模拟路径 - 根据模式调整透明度和数量
+    // 添加代表性模拟路径（服务端按期末价格分位抽取） - 根据模式调整透明度
     const pathOpacity = viewMode === 'simulation' ? 0.4 : 0.1;
-    const pathsToShow = Math.min(monteCarloData.all_paths.length, viewMode === 'simulation' ? 500 : 30);
+    const pathsToShow = monteCarloData.sample_paths.length;
     
     // 颜色列表
     const colors = [
@@ -618,8 +618,8 @@ function updateChartWithSimulation() {
     
     // 添加所有路径
     for (let i = 0; i < pathsToShow; i++) {
-        if (i < monteCarloData.all_paths.length) {
-            const path = monteCarloData.all_paths[i];
+        if (i < monteCarloData.sample_paths.length) {
+            const path = monteCarloData.sample_paths[i];
             if (Array.isArray(path)) {
                 const colorIndex = i % colors.length;
                 datasets.push({
@@ -646,11 +646,9 @@ function updateChartWithSimulation() {
         'p5_p95': `rgba(54, 162, 235, ${viewMode === 'simulation' ? 1 : 0.4})`      // 5-95百分位 - 蓝色
     };
     
-    // 计算每个时间点的中位数（50百分位）
-    const medianLine = simulationDates.map((_, i) => {
-        const values = monteCarloData.all_paths.map(path => path[i]);
-        return values.sort((a, b) => a - b)[Math.floor(values.length / 2)];
-    });
+    // 每个时间点的百分位数由服务端基于全部路径计算
+    const bands = monteCarloData.percentile_bands;
+    const medianLine = bands['50'];
     
     // 添加中位数线
     datasets.push({
@@ -663,6 +661,20 @@ function updateChartWithSimulation() {
         tension: 0.1,
         yAxisID: 'y'
     });
+    
+    // 添加5%和95%百分位线
+    [['5', 'Forecast 5th Percentile'], ['95', 'Forecast 95th Percentile']].forEach(([percentile, label]) => {
+        datasets.push({
+            label: label,
+            data: [...Array(historicalPrices.length).fill(null), ...bands[percentile]],
+            borderColor: percentileColors.p5_p95,
+            borderWidth: 1,
+            pointRadius: 0,
+            borderDash: [5, 5],
+            tension: 0.1,
+            yAxisID: 'y'
+        });
+    });
 
     // 更新图表
     stockChart.data.labels = allDates;
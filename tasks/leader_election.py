@@ -0,0 +1,85 @@
+"""
+订单处理器主节点选举
+使用 MySQL 命名锁 (GET_LOCK) 保证同一部署中只有一个进程的订单处理器处于活动状态
+
+命名锁绑定在一个专用数据库连接上：主节点进程退出或连接断开时，MySQL 会自动释放锁，
+其它进程在下一次重试时即可接管
+"""
+import logging
+from sqlalchemy import text
+
+# 设置日志
+logger = logging.getLogger(__name__)
+
+
+class AdvisoryLockLeader:
+    """
+    基于 MySQL GET_LOCK 的主节点锁
+
+    非 MySQL 数据库（例如本地 SQLite）没有命名锁，此时视为单进程部署，总是成为主节点
+    """
+    def __init__(self, engine, lock_name):
+        self.engine = engine
+        self.lock_name = lock_name
+        self._connection = None
+        self.is_leader = False
+        self.supported = engine.dialect.name == 'mysql'
+
+    def acquire(self):
+        """
+        尝试获取或确认主节点身份（不阻塞）
+
+        返回:
+            bool: 当前进程是否为主节点
+        """
+        if not self.supported:
+            self.is_leader = True
+            return True
+
+        try:
+            if self._connection is None:
+                # 自动提交模式，避免专用连接长期处于未结束的事务中
+                self._connection = self.engine.connect().execution_options(isolation_level='AUTOCOMMIT')
+
+            if self.is_leader:
+                # 确认锁仍由本连接持有（连接断开后锁会被释放并可能被其它进程获取）
+                holder = self._connection.execute(
+                    text("SELECT IS_USED_LOCK(:name) = CONNECTION_ID()"), {'name': self.lock_name}
+                ).scalar()
+                if not holder:
+                    logger.warning(f"订单处理器主节点锁 {self.lock_name} 已丢失")
+                    self._reset()
+                return self.is_leader
+
+            acquired = self._connection.execute(
+                text("SELECT GET_LOCK(:name, 0)"), {'name': self.lock_name}
+            ).scalar()
+            self.is_leader = acquired == 1
+            if self.is_leader:
+                logger.info(f"已获取订单处理器主节点锁 {self.lock_name}")
+            return self.is_leader
+
+        except Exception as e:
+            logger.error(f"获取订单处理器主节点锁失败: {str(e)}")
+            self._reset()
+            return False
+
+    def release(self):
+        """释放主节点锁并关闭专用连接"""
+        if self._connection is not None and self.is_leader:
+            try:
+                self._connection.execute(text("SELECT RELEASE_LOCK(:name)"), {'name': self.lock_name})
+                logger.info(f"已释放订单处理器主节点锁 {self.lock_name}")
+            except Exception as e:
+                logger.error(f"释放订单处理器主节点锁失败: {str(e)}")
+        self._reset()
+
+    def _reset(self):
+        """关闭专用连接，连接关闭时 MySQL 会释放该连接持有的命名锁"""
+        self.is_leader = False
+        if self._connection is not None:
+            try:
+                self._connection.close()
+            except Exception:
+                pass
+            self._connection = None
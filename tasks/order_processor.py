@@ -1,11 +1,20 @@
 """
 订单处理任务
-定期检查和执行待处理的限价单和市价单
+检查和执行待处理的限价单和市价单
+默认由订单创建/撤销和新行情写入事件触发，并保留定时轮询作为兜底
 """
-from models import db, Order
-from utils.order_utils import get_market_price, can_execute_immediately, execute_order, scan_pending_limit_orders
+from sqlalchemy import func
+from models import db, Order, LatestQuote
+from utils.order_utils import get_market_price, get_market_prices, can_execute_immediately, execute_order, execute_orders_batch, scan_pending_limit_orders
+from utils.order_book import order_book
+from utils.order_events import notify_order_processor, clear_order_event, wait_for_order_event
+from tasks.leader_election import AdvisoryLockLeader
+from models.enums import OrderStatus, OrderExecutionType
+from config import (ORDER_BOOK_RESYNC_INTERVAL, ORDER_TRIGGER_MODE, ORDER_FALLBACK_INTERVAL, ORDER_CHANGE_POLL_INTERVAL, ORDER_WORKER_COUNT,
+                    ORDER_BATCH_SIZE, ORDER_LEADER_LOCK_NAME, ORDER_LEADER_RETRY_INTERVAL)
 import time
 import threading
+import queue
 import logging
 from flask import current_app
 
@@ -13,6 +22,112 @@ from flask import current_app
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class OrderExecutorPool:
+    """
+    按 user_id 分片的订单执行线程池
+    同一用户的订单总是进入同一个工作线程的队列，按提交顺序串行执行；
+    不同用户的订单在不同线程中并行执行，互不争用 AccountBalance/Portfolio 行锁；
+    工作线程每次取出队列中已有的多个订单，在同一个事务中批量执行
+    """
+    def __init__(self, app, worker_count, batch_size=1):
+        self.app = app
+        self.worker_count = max(1, int(worker_count))
+        self.batch_size = max(1, int(batch_size))
+        self._queues = []
+        self._threads = []
+        self._inflight = set()  # 已提交但尚未执行完成的订单ID，避免重复提交
+        self._lock = threading.Lock()
+
+    def start(self):
+        """启动所有工作线程"""
+        for i in range(self.worker_count):
+            job_queue = queue.Queue()
+            thread = threading.Thread(target=self._worker, args=(job_queue,), daemon=True, name=f"order-worker-{i}")
+            self._queues.append(job_queue)
+            self._threads.append(thread)
+            thread.start()
+        logger.info(f"订单执行线程池已启动，工作线程数：{self.worker_count}")
+
+    def submit(self, order, market_price):
+        """
+        提交订单执行任务
+
+        参数:
+            order (Order): 待执行的订单
+            market_price (float): 执行价格
+
+        返回:
+            bool: 是否提交成功（订单已在执行队列中时返回False）
+        """
+        with self._lock:
+            if order.order_id in self._inflight:
+                return False
+            self._inflight.add(order.order_id)
+        # 只传递订单ID，工作线程在自己的会话中重新加载订单
+        self._queues[order.user_id % self.worker_count].put((order.order_id, market_price))
+        return True
+
+    def wait_idle(self):
+        """等待所有已提交的订单执行完毕"""
+        for job_queue in self._queues:
+            job_queue.join()
+
+    def stop(self):
+        """停止所有工作线程"""
+        for job_queue in self._queues:
+            job_queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout=1)
+        self._queues = []
+        self._threads = []
+        logger.info("订单执行线程池已停止")
+
+    def _worker(self, job_queue):
+        """工作线程主循环"""
+        stopping = False
+        while not stopping:
+            # 阻塞等待第一个任务，再取出队列中已有的任务组成一批
+            jobs = [job_queue.get()]
+            while len(jobs) < self.batch_size:
+                try:
+                    jobs.append(job_queue.get_nowait())
+                except queue.Empty:
+                    break
+            taken = len(jobs)
+            try:
+                if None in jobs:
+                    stopping = True
+                    jobs = [job for job in jobs if job is not None]
+                if jobs:
+                    self._execute(jobs)
+            finally:
+                for _ in range(taken):
+                    job_queue.task_done()
+
+    def _execute(self, jobs):
+        """在独立的应用上下文（独立的数据库会话）中批量执行一组订单"""
+        order_ids = [order_id for order_id, _ in jobs]
+        try:
+            with self.app.app_context():
+                orders = {order.order_id: order for order in Order.query.filter(Order.order_id.in_(order_ids)).all()}
+                # 订单可能已被撤销或在其它地方处理
+                order_prices = [
+                    (orders[order_id], market_price) for order_id, market_price in jobs
+                    if order_id in orders and orders[order_id].order_status == OrderStatus.PENDING
+                ]
+                executed_ids = [order.order_id for order, _ in order_prices]
+                results = execute_orders_batch(order_prices)
+                for order_id, (exec_success, exec_message) in zip(executed_ids, results):
+                    if exec_success:
+                        logger.info(f"订单 #{order_id} 执行成功")
+                    else:
+                        logger.error(f"订单 #{order_id} 执行失败: {exec_message}")
+        except Exception as e:
+            logger.error(f"执行订单 {order_ids} 时发生错误: {str(e)}")
+        finally:
+            with self._lock:
+                self._inflight.difference_update(order_ids)
+
 class OrderProcessor:
     def __init__(self, app):
         self.app = app
@@ -20,55 +135,190 @@ class OrderProcessor:
         self.running = False
         # 使用配置的检查间隔或默认值
         self.check_interval = app.config.get('ORDER_CHECK_INTERVAL', 5)  # 默认每5秒检查一次
+        # 内存订单簿全量重建间隔
+        self.resync_interval = app.config.get('ORDER_BOOK_RESYNC_INTERVAL', ORDER_BOOK_RESYNC_INTERVAL)
+        self.last_resync = 0
+        # 触发模式: 'event' 在订单创建/撤销或新行情写入时立即唤醒，'poll' 按固定间隔轮询
+        self.trigger_mode = app.config.get('ORDER_TRIGGER_MODE', ORDER_TRIGGER_MODE)
+        # 事件模式下的兜底轮询间隔
+        self.fallback_interval = app.config.get('ORDER_FALLBACK_INTERVAL', ORDER_FALLBACK_INTERVAL)
+        # 事件模式下检查其它进程变更（新订单、新行情）的间隔
+        self.change_poll_interval = app.config.get('ORDER_CHANGE_POLL_INTERVAL', ORDER_CHANGE_POLL_INTERVAL)
+        self._change_marker = None
+        # 订单执行线程数，大于1时按 user_id 分片并行执行
+        self.worker_count = app.config.get('ORDER_WORKER_COUNT', ORDER_WORKER_COUNT)
+        # 每个工作线程单次事务中批量执行的最大订单数
+        self.batch_size = app.config.get('ORDER_BATCH_SIZE', ORDER_BATCH_SIZE)
+        self.executor = OrderExecutorPool(app, self.worker_count, self.batch_size) if self.worker_count > 1 else None
+        # 主节点选举：多进程部署（如 gunicorn 多 worker）时只有持锁进程处理订单
+        self.leader_lock_name = app.config.get('ORDER_LEADER_LOCK_NAME', ORDER_LEADER_LOCK_NAME)
+        self.leader_retry_interval = app.config.get('ORDER_LEADER_RETRY_INTERVAL', ORDER_LEADER_RETRY_INTERVAL)
+        self.leader = None
+        self._stop_event = threading.Event()
+
+    def _resync_order_book(self):
+        """
+        同步内存订单簿
+        定期从数据库全量重建，纠正因并发提交顺序、其它进程撤单等原因与数据库产生的偏差；
+        其余周期只增量加载新订单
+        """
+        now = time.time()
+        if not order_book.loaded or now - self.last_resync >= self.resync_interval:
+            order_book.load()
+            self.last_resync = now
+        else:
+            order_book.sync()
+
+    def _ensure_leader(self):
+        """
+        获取或确认主节点身份（需要在应用上下文中调用）
+        成为主节点时强制全量重建订单簿，失去主节点身份时清空订单簿
+        """
+        if self.leader is None:
+            self.leader = AdvisoryLockLeader(db.engine, self.leader_lock_name)
+
+        was_leader = self.leader.is_leader
+        is_leader = self.leader.acquire()
+        if is_leader and not was_leader:
+            logger.info("当前进程成为订单处理器主节点")
+            self.last_resync = 0
+            order_book.clear()
+        elif was_leader and not is_leader:
+            logger.warning("当前进程失去订单处理器主节点身份，停止处理订单")
+            order_book.clear()
+        return is_leader
+
+    def _read_change_marker(self):
+        """
+        读取其它进程可能产生的变更标记（需要在应用上下文中调用）
+        最大订单ID（新订单只会使其增大）和最新报价的最后刷新时间（新行情写入时更新），
+        两者都是索引上的 MAX 查询
+
+        返回:
+            tuple: (最大订单ID, 最新报价刷新时间)
+        """
+        return (
+            db.session.query(func.max(Order.order_id)).scalar(),
+            db.session.query(func.max(LatestQuote.updated_at)).scalar(),
+        )
+
+    def _external_change(self):
+        """
+        检查自本轮处理开始以来其它进程是否提交了新订单或新行情
+        其它进程的会话事件只能唤醒它自己的处理器，主节点通过短间隔查询变更标记发现这些变更
+
+        返回:
+            bool: 是否有变更
+        """
+        try:
+            with self.app.app_context():
+                marker = self._read_change_marker()
+                db.session.rollback()
+        except Exception as e:
+            logger.error(f"检查订单/行情变更时发生错误: {str(e)}")
+            return False
+        changed = marker != self._change_marker
+        self._change_marker = marker
+        return changed
+
+    def _wait_next_round(self):
+        """
+        等待下一轮处理
+        非主节点按重试间隔等待后再次尝试获取主节点锁；
+        事件模式下阻塞到有订单/行情变更或兜底超时：本进程的变更由事件直接唤醒，
+        其它进程的变更每隔 change_poll_interval 秒通过两个 MAX 查询发现
+        """
+        if self.leader is not None and not self.leader.is_leader:
+            self._stop_event.wait(self.leader_retry_interval)
+        elif self.trigger_mode == 'event':
+            deadline = time.monotonic() + self.fallback_interval
+            while self.running:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or wait_for_order_event(min(self.change_poll_interval, remaining)):
+                    return
+                if self._external_change():
+                    return
+        else:
+            time.sleep(self.check_interval)
+
+    def _process_round(self):
+        """
+        处理一轮待处理的订单（需要在应用上下文中调用）
+        包括限价单和市价单
+        """
+        # 同步内存订单簿
+        self._resync_order_book()
+        
+        # 获取所有待处理的市价单（只查询分发需要的列，由 ix_orders_pending_scan 索引覆盖）
+        pending_market_orders = db.session.query(Order.order_id, Order.user_id, Order.ticker).filter_by(
+            order_status=OrderStatus.PENDING,
+            order_execution_type=OrderExecutionType.MARKET
+        ).all()
+        
+        logger.info(f"检查 {len(pending_market_orders)} 个待处理的市价单")
+        
+        # 本周期的价格快照：一次查询获取所有相关股票的最新收盘价
+        tickers = {order.ticker for order in pending_market_orders}
+        tickers.update(order_book.tickers())
+        price_snapshot = get_market_prices(tickers)
+        
+        # 处理市价单
+        for order in pending_market_orders:
+            try:
+                # 从价格快照中获取当前市场价格
+                market_price = price_snapshot.get(order.ticker)
+                
+                if market_price is None:
+                    logger.warning(f"无法获取 {order.ticker} 的市场价格")
+                    continue
+                
+                # 市价单应该立即执行
+                if self.executor is not None:
+                    self.executor.submit(order, market_price)
+                    continue
+                exec_success, exec_message = execute_order(db.session.get(Order, order.order_id), market_price)
+                
+                if exec_success:
+                    logger.info(f"市价单 #{order.order_id} 执行成功")
+                else:
+                    logger.error(f"市价单 #{order.order_id} 执行失败: {exec_message}")
+            
+            except Exception as e:
+                logger.error(f"处理市价单 #{order.order_id} 时发生错误: {str(e)}")
+                continue
+        
+        # 使用专用函数扫描和执行限价单（基于内存订单簿，只处理被穿越的订单）
+        scan_pending_limit_orders(price_snapshot, self.executor.submit if self.executor is not None else None)
+        
+        # 等待本周期提交的订单全部执行完毕，下一周期再使用新的价格快照
+        if self.executor is not None:
+            self.executor.wait_idle()
 
     def process_orders(self):
         """
         处理所有待处理的订单
-        包括限价单和市价单
+        多进程部署时只有持有主节点锁的进程处理订单
         """
         while self.running:
+            # 先清除唤醒事件再处理，处理期间到达的唤醒会让下一次等待立即返回，不会丢失
+            clear_order_event()
             try:
                 with self.app.app_context():
-                    # 获取所有待处理的市价单
-                    pending_market_orders = Order.query.filter_by(
-                        order_status='pending',
-                        order_execution_type='market'
-                    ).all()
-                    
-                    logger.info(f"检查 {len(pending_market_orders)} 个待处理的市价单")
-                    
-                    # 处理市价单
-                    for order in pending_market_orders:
-                        try:
-                            # 获取当前市场价格
-                            price_success, price_result = get_market_price(order.ticker)
-                            
-                            if not price_success:
-                                logger.warning(f"无法获取 {order.ticker} 的市场价格: {price_result}")
-                                continue
-                                
-                            market_price = price_result
-                            
-                            # 市价单应该立即执行
-                            exec_success, exec_message = execute_order(order, market_price)
-                            
-                            if exec_success:
-                                logger.info(f"市价单 #{order.order_id} 执行成功")
-                            else:
-                                logger.error(f"市价单 #{order.order_id} 执行失败: {exec_message}")
-                        
-                        except Exception as e:
-                            logger.error(f"处理市价单 #{order.order_id} 时发生错误: {str(e)}")
-                            continue
-                    
-                    # 使用专用函数扫描和执行限价单
-                    scan_pending_limit_orders()
+                    if self._ensure_leader():
+                        if self.trigger_mode == 'event':
+                            # 处理前记录变更标记，处理期间其它进程提交的变更会在等待时被发现
+                            self._change_marker = self._read_change_marker()
+                        self._process_round()
                 
             except Exception as e:
                 logger.error(f"处理订单时发生错误: {str(e)}")
             
-            # 等待指定时间后再次检查
-            time.sleep(self.check_interval)
+            # 等待下一次触发（事件或超时）后再次检查
+            self._wait_next_round()
+        
+        # 处理线程退出时释放主节点锁，使其它进程可以立即接管
+        if self.leader is not None:
+            self.leader.release()
 
     def start(self):
         """
@@ -77,9 +327,15 @@ class OrderProcessor:
         """
         if not self.running:
             self.running = True
+            self._stop_event.clear()
+            if self.executor is not None:
+                self.executor.start()
             self.thread = threading.Thread(target=self.process_orders, daemon=True)
             self.thread.start()
-            logger.info(f"订单处理器已启动，检查间隔：{self.check_interval}秒")
+            if self.trigger_mode == 'event':
+                logger.info(f"订单处理器已启动，事件触发模式，兜底轮询间隔：{self.fallback_interval}秒")
+            else:
+                logger.info(f"订单处理器已启动，检查间隔：{self.check_interval}秒")
 
     def stop(self):
         """
@@ -87,8 +343,14 @@ class OrderProcessor:
         """
         if self.running:
             self.running = False
+            # 唤醒可能正在等待事件或主节点锁的处理线程，使其尽快退出
+            self._stop_event.set()
+            notify_order_processor()
             if self.thread:
                 self.thread.join(timeout=1)
+            if self.executor is not None:
+                self.executor.stop()
+            order_book.clear()
             logger.info("订单处理器已停止")
 
 def start_order_processor(app):
@@ -0,0 +1,95 @@
+"""
+风险指标预计算任务
+定期检查最新行情，为 TECH_TICKERS 和所有持仓股票计算风险指标并写入 risk_metrics 表，
+使股票分析 API 直接返回预计算结果，不必在每次请求时重新计算
+
+每次检查只比较 latest_quote 中的最新日期与已有快照，没有新行情时不会重新计算
+"""
+import threading
+import logging
+from models import db
+from utils.risk_snapshot import compute_risk_snapshots
+from tasks.leader_election import AdvisoryLockLeader
+from config import RISK_SNAPSHOT_CHECK_INTERVAL, RISK_SNAPSHOT_LOCK_NAME
+
+# 设置日志
+logger = logging.getLogger(__name__)
+
+
+class RiskPrecomputeJob:
+    """
+    风险指标预计算后台任务
+    多进程部署时只有持有主节点锁的进程计算，避免重复写入
+    """
+    def __init__(self, app):
+        self.app = app
+        self.thread = None
+        self.running = False
+        # 检查新行情的间隔
+        self.check_interval = app.config.get('RISK_SNAPSHOT_CHECK_INTERVAL', RISK_SNAPSHOT_CHECK_INTERVAL)
+        self.lock_name = app.config.get('RISK_SNAPSHOT_LOCK_NAME', RISK_SNAPSHOT_LOCK_NAME)
+        self.leader = None
+        self._stop_event = threading.Event()
+
+    def run_once(self):
+        """
+        执行一轮预计算（需要在应用上下文中调用）
+
+        返回:
+            int: 写入的快照行数，非主节点返回0
+        """
+        if self.leader is None:
+            self.leader = AdvisoryLockLeader(db.engine, self.lock_name)
+        if not self.leader.acquire():
+            return 0
+
+        count = compute_risk_snapshots()
+        if count:
+            logger.info(f"已预计算 {count} 条风险指标")
+        return count
+
+    def _run(self):
+        """后台线程主循环：启动后立即计算一次，之后按间隔检查新行情"""
+        while self.running:
+            try:
+                with self.app.app_context():
+                    self.run_once()
+            except Exception as e:
+                logger.error(f"预计算风险指标时发生错误: {str(e)}")
+
+            self._stop_event.wait(self.check_interval)
+
+        # 退出时释放主节点锁，使其它进程可以立即接管
+        if self.leader is not None:
+            self.leader.release()
+
+    def start(self):
+        """
+        启动预计算任务
+        """
+        if not self.running:
+            self.running = True
+            self._stop_event.clear()
+            self.thread = threading.Thread(target=self._run, daemon=True, name="risk-precompute")
+            self.thread.start()
+            logger.info(f"风险指标预计算任务已启动，检查间隔：{self.check_interval}秒")
+
+    def stop(self):
+        """
+        停止预计算任务
+        """
+        if self.running:
+            self.running = False
+            self._stop_event.set()
+            if self.thread:
+                self.thread.join(timeout=1)
+            logger.info("风险指标预计算任务已停止")
+
+
+def start_risk_precompute(app):
+    """
+    创建并启动风险指标预计算任务
+    """
+    job = RiskPrecomputeJob(app)
+    job.start()
+    return job
@@ -0,0 +1,103 @@
+import sys
+import os
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from flask import Flask
+from sqlalchemy import update
+
+# 添加项目根目录到Python路径，以便导入utils模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from models import db, MarketData
+from utils.columnar_store import ColumnarStore
+from utils.latest_quote import refresh_latest_quotes
+from utils.price_history import ColumnarHistoryProvider, DatabaseHistoryProvider
+
+
+def _bar_dates():
+    """测试行情的日期：截至昨天的 400 个工作日"""
+    return pd.bdate_range(end=pd.Timestamp.now().normalize() - pd.Timedelta(days=1), periods=400)
+
+
+def _make_app():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        rng = np.random.default_rng(3)
+        index = _bar_dates()
+        for ticker in ['AAPL', 'MSFT']:
+            closes = np.round(100 * np.exp(np.cumsum(rng.normal(0.0005, 0.02, len(index)))), 4)
+            for date, close in zip(index, closes):
+                db.session.add(MarketData(ticker=ticker, date=date.to_pydatetime(), open=close, high=close + 1,
+                                          low=close - 1, close=close, volume=1000))
+        db.session.commit()
+    return app
+
+
+def test_store_matches_database(tmp_path):
+    """测试列式存储读取的数据与数据库一致，日期范围为左闭右开的切片"""
+    app = _make_app()
+    store = ColumnarStore(str(tmp_path))
+    columnar = ColumnarHistoryProvider(fallback=False, store=store)
+    database = DatabaseHistoryProvider(fallback=False)
+    with app.app_context():
+        start = (pd.Timestamp.now() - pd.Timedelta(days=200)).strftime('%Y-%m-%d')
+        expected = database.get_histories(['AAPL', 'MSFT'], start=start)
+        actual = columnar.get_histories(['AAPL', 'MSFT'], start=start)
+        for ticker in ['AAPL', 'MSFT']:
+            pd.testing.assert_frame_equal(actual[ticker], expected[ticker], check_freq=False, check_index_type=False)
+
+        index = _bar_dates()
+        start, end = index[100].strftime('%Y-%m-%d'), index[105].strftime('%Y-%m-%d')
+        frame = store.read('AAPL', start, end)
+        assert len(frame) == 5
+        assert list(frame.index) == list(index[100:105])
+        assert sorted(os.listdir(tmp_path)) == ['AAPL.npy', 'AAPL.version.json', 'MSFT.npy', 'MSFT.version.json']
+
+
+def test_store_follows_new_and_corrected_bars(tmp_path):
+    """测试写入新行情或修正最后一根K线后，下一次读取自动增量同步"""
+    app = _make_app()
+    store = ColumnarStore(str(tmp_path))
+    provider = ColumnarHistoryProvider(fallback=False, store=store)
+    with app.app_context():
+        before = provider.get_history('AAPL')
+        assert store.sync_stale(['AAPL']) == []
+
+        last = MarketData.query.filter_by(ticker='AAPL').order_by(MarketData.date.desc()).first()
+        last.close = 1.5
+        today = pd.Timestamp.now().normalize().to_pydatetime()
+        db.session.add(MarketData(ticker='AAPL', date=today, open=2, high=2, low=2, close=2, volume=10))
+        db.session.commit()
+
+        after = provider.get_history('AAPL')
+        assert len(after) == len(before) + 1
+        assert after['Close'].iloc[-2] == 1.5 and after['Close'].iloc[-1] == 2
+        pd.testing.assert_frame_equal(after.iloc[:-2], before.iloc[:-1], check_freq=False, check_index_type=False)
+
+
+def test_store_rebuilt_when_older_bars_are_rewritten(tmp_path):
+    """测试较早的K线被改写（如拆股/分红后重新复权、全量重载）后，历史版本变化使文件整体重建"""
+    app = _make_app()
+    store = ColumnarStore(str(tmp_path))
+    provider = ColumnarHistoryProvider(fallback=False, store=store)
+    database = DatabaseHistoryProvider(fallback=False)
+    with app.app_context():
+        before = provider.get_histories(['AAPL', 'MSFT'])['AAPL']
+        assert store.sync_stale(['AAPL', 'MSFT']) == []
+
+        # 批量 upsert 改写全部历史K线（绕过会话事件），随后刷新最新行情
+        market_data = MarketData.__table__
+        with db.engine.begin() as connection:
+            connection.execute(update(market_data).where(market_data.c.ticker == 'AAPL').values(
+                close=market_data.c.close / 2, data_collected_at=datetime.now()
+            ))
+            refresh_latest_quotes(connection, ['AAPL'])
+        db.session.expire_all()
+
+        assert store.sync_stale(['AAPL', 'MSFT']) == ['AAPL']
+        after = provider.get_history('AAPL')
+        pd.testing.assert_frame_equal(after, database.get_history('AAPL'), check_freq=False, check_index_type=False)
+        assert np.allclose(after['Close'].to_numpy(), before['Close'].to_numpy() / 2, atol=1e-4)
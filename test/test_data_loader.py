@@ -0,0 +1,119 @@
+import sys
+import os
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, select, func, inspect, text
+
+# 添加项目根目录到Python路径，以便导入utils模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from models import MarketData, LatestQuote, FundamentalData
+from utils.data_loader import get_latest_dates, upsert_frame, reload_table
+from utils.stock_data import save_to_database, get_fetch_start_dates
+
+
+def _market_frame(ticker, start, periods, close=100.0):
+    """生成带时区日期的行情数据（与 yfinance 返回的格式相同）"""
+    index = pd.bdate_range(start=start, periods=periods, tz='America/New_York')
+    return pd.DataFrame({
+        'ticker': ticker, 'date': index, 'open': close, 'high': close, 'low': close,
+        'close': close + np.arange(periods), 'volume': 1000, 'data_collected_at': pd.Timestamp.now()
+    })
+
+
+def test_upsert_updates_existing_rows_in_chunks():
+    """测试分批写入时重复的 (ticker, date) 被更新而不是重复插入"""
+    engine = create_engine('sqlite://')
+    MarketData.__table__.create(engine)
+    with engine.begin() as connection:
+        assert upsert_frame(connection, MarketData.__table__, _market_frame('AAPL', '2024-01-01', 25), chunk_size=7) == 25
+        # 最后一天的数据被修正，并新增 5 天
+        assert upsert_frame(connection, MarketData.__table__, _market_frame('AAPL', '2024-02-02', 6, close=200.0),
+                            chunk_size=4) == 6
+
+    with engine.connect() as connection:
+        assert connection.execute(select(func.count()).select_from(MarketData.__table__)).scalar() == 30
+        latest = get_latest_dates(connection)
+        assert latest == {'AAPL': pd.Timestamp('2024-02-09').to_pydatetime()}
+        close = connection.execute(select(MarketData.close).where(MarketData.date == pd.Timestamp('2024-02-02'))).scalar()
+        assert float(close) == 200.0
+
+
+def test_save_keeps_schema_and_loads_incrementally():
+    """测试保存数据后表结构（主键）保留，最新行情被刷新，下次只从最新日期开始获取"""
+    engine = create_engine('sqlite://')
+    fundamentals = pd.DataFrame([{'ticker': 'AAPL', 'date': pd.Timestamp('2024-02-01'), 'market_cap': 1,
+                                  'pe_ratio': np.nan, 'revenue': 5}])
+    empty = pd.DataFrame()
+    save_to_database(_market_frame('AAPL', '2024-01-01', 10), fundamentals, empty, empty, engine=engine)
+    save_to_database(_market_frame('AAPL', '2024-01-12', 3), fundamentals, empty, empty, engine=engine)
+
+    assert inspect(engine).get_pk_constraint('market_data')['constrained_columns'] == ['ticker', 'date']
+    with engine.connect() as connection:
+        assert connection.execute(select(func.count()).select_from(MarketData.__table__)).scalar() == 12
+        assert connection.execute(select(func.count()).select_from(FundamentalData.__table__)).scalar() == 1
+        assert connection.execute(select(FundamentalData.pe_ratio)).scalar() is None
+        quote_date = connection.execute(select(LatestQuote.date).where(LatestQuote.ticker == 'AAPL')).scalar()
+        assert pd.Timestamp(quote_date) == pd.Timestamp('2024-01-16')
+
+    assert get_fetch_start_dates(engine, ['AAPL', 'MSFT']) == {'AAPL': '2024-01-16', 'MSFT': '2018-01-01'}
+
+
+def test_table_without_primary_key_rejected():
+    """测试没有主键的表（例如由 to_sql 重建的表）拒绝增量写入，避免重复行"""
+    engine = create_engine('sqlite://')
+    with engine.begin() as connection:
+        connection.execute(text('CREATE TABLE market_data (ticker TEXT, date DATETIME, open REAL, high REAL, low REAL, '
+                                'close REAL, volume INTEGER, data_collected_at DATETIME)'))
+        try:
+            upsert_frame(connection, MarketData.__table__, _market_frame('AAPL', '2024-01-01', 3))
+            assert False, '没有主键的表不应写入'
+        except RuntimeError:
+            pass
+
+
+def _count(engine, table=MarketData.__table__):
+    with engine.connect() as connection:
+        return connection.execute(select(func.count()).select_from(table)).scalar()
+
+
+def test_reload_swaps_in_staging_table():
+    """测试全量重载写入临时表后整体替换，加载过程中线上表始终完整可读"""
+    engine = create_engine('sqlite://')
+    MarketData.__table__.create(engine)
+    with engine.begin() as connection:
+        upsert_frame(connection, MarketData.__table__, _market_frame('AAPL', '2024-01-01', 10))
+
+    def frames(live_rows):
+        for ticker in ['AAPL', 'MSFT', 'NVDA']:
+            # 加载过程中读取到的仍是旧数据
+            assert _count(engine) == live_rows
+            yield _market_frame(ticker, '2023-01-02', 20)
+
+    for live_rows in (10, 60):
+        assert reload_table(engine, MarketData.__table__, frames(live_rows)) == 60
+        assert _count(engine) == 60
+
+    inspector = inspect(engine)
+    assert sorted(inspector.get_table_names()) == ['market_data']
+    assert inspector.get_pk_constraint('market_data')['constrained_columns'] == ['ticker', 'date']
+    assert len(inspector.get_indexes('market_data')) == 2
+
+
+def test_failed_reload_keeps_live_table():
+    """测试重载失败时线上表不变，临时表被清理"""
+    engine = create_engine('sqlite://')
+    MarketData.__table__.create(engine)
+    with engine.begin() as connection:
+        upsert_frame(connection, MarketData.__table__, _market_frame('AAPL', '2024-01-01', 10))
+
+    def frames():
+        yield _market_frame('AAPL', '2023-01-02', 20)
+        raise ConnectionError('download interrupted')
+
+    try:
+        reload_table(engine, MarketData.__table__, frames())
+        assert False, '重载应当失败'
+    except ConnectionError:
+        pass
+    assert _count(engine) == 10
+    assert inspect(engine).get_table_names() == ['market_data']
@@ -0,0 +1,85 @@
+import sys
+import os
+import time
+import threading
+import pandas as pd
+
+# 添加项目根目录到Python路径，以便导入utils模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import history_cache as history_cache_module
+from utils.history_cache import HistoryCache
+
+
+def _frame(rows=10):
+    return pd.DataFrame({'Close': [float(i) for i in range(rows)]})
+
+
+def test_ttl_expiry():
+    """测试缓存命中与过期后重新加载"""
+    cache = HistoryCache(ttl=0.05, max_bytes=1024 * 1024)
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return _frame()
+
+    cache.get(('AAPL', None, None, '1d'), loader)
+    cache.get(('AAPL', None, None, '1d'), loader)
+    assert len(calls) == 1
+    time.sleep(0.06)
+    cache.get(('AAPL', None, None, '1d'), loader)
+    assert len(calls) == 2
+    assert cache.stats()['hits'] == 1
+
+
+def test_lru_eviction_by_memory():
+    """测试超出内存上限时淘汰最近最少使用的条目"""
+    frame_bytes = int(_frame().memory_usage(deep=True).sum())
+    cache = HistoryCache(ttl=60, max_bytes=frame_bytes * 2)
+
+    cache.get('a', _frame)
+    cache.get('b', _frame)
+    cache.get('a', _frame)  # a 变为最近使用
+    cache.get('c', _frame)  # 淘汰 b
+
+    loaded = []
+    cache.get('a', lambda: loaded.append('a') or _frame())
+    cache.get('b', lambda: loaded.append('b') or _frame())
+    assert loaded == ['b']
+    assert cache.stats()['bytes'] <= frame_bytes * 2
+
+
+def test_concurrent_requests_share_download():
+    """测试同一键的并发请求只下载一次"""
+    cache = HistoryCache(ttl=60, max_bytes=1024 * 1024)
+    calls = []
+
+    def slow_loader():
+        calls.append(1)
+        time.sleep(0.1)
+        return _frame()
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get('AAPL', slow_loader))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert len(results) == 5
+    assert all(result is results[0] for result in results)
+
+
+def test_downloads_request_adjusted_prices(monkeypatch):
+    """测试单只和批量下载都显式请求复权价格，不依赖 yfinance 版本的默认值"""
+    requests = []
+
+    def fake_download(tickers, **kwargs):
+        requests.append(kwargs)
+        return pd.DataFrame()
+
+    monkeypatch.setattr(history_cache_module.yf, 'download', fake_download)
+    history_cache_module._download('AAPL', '2025-01-01', None, '1d')
+    history_cache_module._download_many(['AAPL', 'MSFT'], '2025-01-01', None, '1d')
+    assert [request['auto_adjust'] for request in requests] == [True, True]
@@ -0,0 +1,90 @@
+import sys
+import os
+from datetime import datetime
+import pandas as pd
+from flask import Flask
+from sqlalchemy import insert
+
+# 添加项目根目录到Python路径，以便导入utils模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from models import db, MarketData, LatestQuote
+from utils.data_loader import upsert_frame
+from utils.latest_quote import get_latest_quote, get_latest_quotes, refresh_latest_quotes
+
+
+def _make_app(tmp_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'quotes.db'}"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def _bar(ticker, day, close):
+    return {'ticker': ticker, 'date': datetime(2025, 1, day), 'open': close, 'high': close, 'low': close,
+            'close': close, 'volume': 100}
+
+
+def test_backfill_from_market_data(tmp_path):
+    """测试 latest_quote 为空而 market_data 已有数据时，首次查询从 market_data 回填每只股票最新的一行"""
+    app = _make_app(tmp_path)
+    with app.app_context():
+        # Core 插入不触发会话事件，模拟升级前已存在的行情数据
+        with db.engine.begin() as connection:
+            connection.execute(insert(MarketData.__table__), [
+                _bar('AAPL', 2, 10.0), _bar('AAPL', 3, 11.0), _bar('MSFT', 2, 20.0)
+            ])
+        assert db.session.query(LatestQuote).count() == 0
+
+        quote = get_latest_quote('AAPL')
+        assert quote.date == datetime(2025, 1, 3) and quote.close == 11.0
+        quotes = get_latest_quotes(['AAPL', 'MSFT', 'NVDA'])
+        assert set(quotes) == {'AAPL', 'MSFT'} and quotes['MSFT'].close == 20.0
+
+
+def test_refresh_after_orm_insert(tmp_path):
+    """测试通过 ORM 写入新行情后，在同一事务中刷新最新行情（after_flush 监听器）"""
+    app = _make_app(tmp_path)
+    with app.app_context():
+        db.session.add(MarketData(**_bar('AAPL', 2, 10.0)))
+        db.session.commit()
+        assert get_latest_quote('AAPL').close == 10.0
+
+        db.session.add(MarketData(**_bar('AAPL', 3, 12.0)))
+        # 更早日期的行情不改变最新行情
+        db.session.add(MarketData(**_bar('AAPL', 1, 9.0)))
+        db.session.commit()
+        db.session.expire_all()
+        quote = get_latest_quote('AAPL')
+        assert quote.date == datetime(2025, 1, 3) and quote.close == 12.0
+
+        # 修改最新一行也会刷新
+        row = db.session.get(MarketData, ('AAPL', datetime(2025, 1, 3)))
+        row.close = 12.5
+        db.session.commit()
+        db.session.expire_all()
+        assert get_latest_quote('AAPL').close == 12.5
+
+
+def test_refresh_after_core_upsert(tmp_path):
+    """测试批量 upsert 绕过会话事件，调用 refresh_latest_quotes 后只刷新指定股票"""
+    app = _make_app(tmp_path)
+    with app.app_context():
+        db.session.add_all([MarketData(**_bar('AAPL', 2, 10.0)), MarketData(**_bar('MSFT', 2, 20.0))])
+        db.session.commit()
+
+        frame = pd.DataFrame([_bar('AAPL', 2, 10.5), _bar('AAPL', 3, 11.0), _bar('MSFT', 3, 21.0)])
+        with db.engine.begin() as connection:
+            upsert_frame(connection, MarketData.__table__, frame)
+            assert refresh_latest_quotes(connection, ['AAPL']) == 1
+        db.session.expire_all()
+
+        assert get_latest_quote('AAPL').date == datetime(2025, 1, 3)
+        # MSFT 没有刷新，仍是旧的最新行情
+        assert get_latest_quote('MSFT').date == datetime(2025, 1, 2)
+
+        with db.engine.begin() as connection:
+            assert refresh_latest_quotes(connection) == 2
+        db.session.expire_all()
+        assert get_latest_quote('MSFT').close == 21.0
@@ -0,0 +1,97 @@
+import sys
+import os
+from types import SimpleNamespace
+from flask import Flask
+from sqlalchemy import create_engine
+
+# 添加项目根目录到Python路径，以便导入utils模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from models import db
+from models.enums import OrderType
+from tasks.leader_election import AdvisoryLockLeader
+from tasks.order_processor import OrderProcessor
+from utils.order_book import order_book
+
+
+class FakeLockConnection:
+    """模拟持有 MySQL 命名锁的专用连接：lock_held 为 False 时 IS_USED_LOCK 返回其它连接"""
+    def __init__(self, server):
+        self.server = server
+        self.closed = False
+
+    def execution_options(self, **options):
+        return self
+
+    def execute(self, statement, parameters=None):
+        sql = str(statement)
+        if 'GET_LOCK' in sql and 'RELEASE' not in sql:
+            value = 1 if self.server.lock_free else 0
+            self.server.lock_free = False
+        elif 'IS_USED_LOCK' in sql:
+            value = 1 if self.server.lock_held else 0
+        else:
+            value = 1
+        return SimpleNamespace(scalar=lambda: value)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeMySQLEngine:
+    """模拟 MySQL 引擎，记录创建的连接"""
+    def __init__(self):
+        self.dialect = SimpleNamespace(name='mysql')
+        self.lock_free = True
+        self.lock_held = True
+        self.connections = []
+
+    def connect(self):
+        connection = FakeLockConnection(self)
+        self.connections.append(connection)
+        return connection
+
+
+def test_non_mysql_backend_always_leads():
+    """测试没有命名锁的数据库（SQLite）视为单进程部署，总是主节点"""
+    leader = AdvisoryLockLeader(create_engine('sqlite://'), 'test.lock')
+    assert leader.supported is False
+    assert leader.acquire() is True
+    assert leader.acquire() is True and leader.is_leader
+
+
+def test_lost_lock_demotes_process():
+    """测试锁被其它连接持有后当前进程失去主节点身份并关闭专用连接，锁释放后可重新获取"""
+    engine = FakeMySQLEngine()
+    leader = AdvisoryLockLeader(engine, 'test.lock')
+    assert leader.acquire() is True
+    assert leader.acquire() is True
+
+    # 专用连接断开，锁被其它进程获取
+    engine.lock_held = False
+    assert leader.acquire() is False
+    assert not leader.is_leader and engine.connections[0].closed
+
+    # 锁仍被其它进程持有时不能成为主节点
+    assert leader.acquire() is False
+    engine.lock_free = True
+    engine.lock_held = True
+    assert leader.acquire() is True
+
+
+def test_processor_clears_order_book_on_demotion():
+    """测试处理器失去主节点身份时清空内存订单簿"""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    app.config['ORDER_WORKER_COUNT'] = 1
+    db.init_app(app)
+    processor = OrderProcessor(app)
+    processor.leader = AdvisoryLockLeader(FakeMySQLEngine(), 'test.lock')
+    with app.app_context():
+        db.create_all()
+        assert processor._ensure_leader() is True
+        order_book.load()
+        order_book._add(1, 'AAPL', OrderType.BUY, 100)
+
+        processor.leader.engine.lock_held = False
+        assert processor._ensure_leader() is False
+        assert not order_book.loaded and len(order_book) == 0
@@ -0,0 +1,181 @@
+import sys
+import os
+import json
+import struct
+import numpy as np
+import pandas as pd
+
+# 添加项目根目录到Python路径，以便导入utils模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.price_history import PriceHistoryProvider
+from utils.monte_carlo import (
+    simulate_price_paths, summarize_paths, monte_carlo_simulation, stream_simulation_binary,
+    portfolio_monte_carlo_simulation
+)
+from utils.simulation_models import fit_garch, fill_garch_paths, simulate_correlated_paths
+
+
+class FixedProvider(PriceHistoryProvider):
+    """返回固定随机行情的数据源"""
+    def get_history(self, ticker, start=None, end=None):
+        rng = np.random.default_rng(0)
+        index = pd.bdate_range(end=pd.Timestamp.now().normalize(), periods=250)
+        close = 100 * np.exp(np.cumsum(rng.normal(0.0005, 0.02, len(index))))
+        return pd.DataFrame({'Open': close, 'High': close, 'Low': close, 'Close': close, 'Volume': 1.0}, index=index)
+
+
+def test_paths_follow_geometric_brownian_motion():
+    """测试向量化路径的起点、形状和对数收益分布"""
+    mu, sigma, days = 0.0005, 0.02, 60
+    paths = simulate_price_paths(100.0, mu, sigma, days, 100000, seed=3)
+    assert paths.shape == (100000, days)
+    assert np.all(paths[:, 0] == 100.0)
+
+    log_returns = np.log(paths[:, -1] / 100.0)
+    steps = days - 1
+    assert abs(log_returns.mean() - (mu - 0.5 * sigma ** 2) * steps) < 0.003
+    assert abs(log_returns.std() - sigma * np.sqrt(steps)) < 0.003
+
+
+def test_seed_and_precision():
+    """测试相同种子结果可复现（float32 使用单精度随机数，序列与 float64 不同）"""
+    first = simulate_price_paths(100.0, 0.0005, 0.02, 30, 50, seed=7)
+    second = simulate_price_paths(100.0, 0.0005, 0.02, 30, 50, seed=7)
+    assert np.array_equal(first, second)
+
+    single = simulate_price_paths(100.0, 0.0005, 0.02, 30, 50, dtype=np.float32, seed=7)
+    assert single.dtype == np.float32
+    assert np.array_equal(single, simulate_price_paths(100.0, 0.0005, 0.02, 30, 50, dtype=np.float32, seed=7))
+    assert np.all(single[:, 0] == 100.0)
+
+
+def test_simulation_reproducible_with_seed():
+    """测试完整模拟流程在指定种子时结果一致"""
+    provider = FixedProvider()
+    first = monte_carlo_simulation('AAPL', days=20, simulations=100, provider=provider, seed=42, include_paths=True)
+    second = monte_carlo_simulation('AAPL', days=20, simulations=100, provider=provider, seed=42, include_paths=True)
+    assert first['all_paths'] == second['all_paths']
+    assert len(first['all_paths']) == 100 and len(first['dates']) == 20
+    assert first['all_paths'][0][0] == first['current_price']
+
+
+def test_summary_response_without_paths():
+    """测试默认只返回百分位带、代表性路径和直方图，且体积远小于全部路径"""
+    provider = FixedProvider()
+    summary = monte_carlo_simulation('AAPL', days=365, simulations=1000, provider=provider, seed=1)
+    full = monte_carlo_simulation('AAPL', days=365, simulations=1000, provider=provider, seed=1, include_paths=True)
+    assert 'all_paths' not in summary
+    assert len(json.dumps(full)) > 100 * len(json.dumps(summary))
+
+    assert sorted(summary['percentile_bands'], key=int) == ['5', '25', '50', '75', '95']
+    assert all(len(band) == 365 for band in summary['percentile_bands'].values())
+    assert sum(summary['terminal_histogram']['counts']) == 1000
+    assert summary['sample_paths'] == full['sample_paths']
+
+
+def test_summary_bands_and_samples():
+    """测试百分位带与全部路径计算一致，代表性路径按期末价格排序"""
+    paths = simulate_price_paths(100.0, 0.0005, 0.02, 30, 2000, seed=5)
+    summary = summarize_paths(paths, sample_paths=5, histogram_bins=10, band_paths=2000)
+    assert np.allclose(summary['percentile_bands']['50'], np.median(paths, axis=0), atol=1e-4)
+
+    finals = [path[-1] for path in summary['sample_paths']]
+    assert len(finals) == 5 and finals == sorted(finals)
+    assert finals[0] > paths[:, -1].min() and finals[-1] < paths[:, -1].max()
+
+    # 超过上限时按等间隔抽取的路径计算百分位带
+    strided = summarize_paths(paths, band_paths=500)
+    assert np.allclose(strided['percentile_bands']['50'], np.median(paths[::4], axis=0), atol=1e-4)
+
+
+def test_binary_stream_matches_simulation():
+    """测试二进制流按批次输出，内容与一次性模拟的 float32 路径一致"""
+    header, length, chunks = stream_simulation_binary('AAPL', days=30, simulations=2500, provider=FixedProvider(),
+                                                      seed=3, batch_size=1000)
+    chunks = list(chunks)
+    body = b''.join(chunks)
+    assert len(body) == length
+    # 头部 + 3 个批次
+    assert len(chunks) == 4
+
+    header_length = struct.unpack('<I', body[:4])[0]
+    assert json.loads(body[4:4 + header_length]) == header
+    paths = np.frombuffer(body[4 + header_length:], dtype=header['dtype']).reshape(header['simulations'], header['days'])
+    expected = simulate_price_paths(header['current_price'], header['mu'], header['sigma'], 30, 2500,
+                                    dtype=np.float32, seed=3)
+    assert np.array_equal(paths, expected)
+
+
+class CorrelatedProvider(PriceHistoryProvider):
+    """返回两只相关系数约 0.8 的股票行情的数据源"""
+    def get_histories(self, tickers, start=None, end=None):
+        rng = np.random.default_rng(1)
+        index = pd.bdate_range(end=pd.Timestamp.now().normalize(), periods=250)
+        shocks = rng.multivariate_normal([0.0005, 0.0003], [[4e-4, 2.4e-4], [2.4e-4, 2.25e-4]], len(index))
+        histories = {}
+        for column, ticker in enumerate(['AAPL', 'MSFT']):
+            close = 100 * np.exp(np.cumsum(shocks[:, column]))
+            histories[ticker] = pd.DataFrame({'Open': close, 'High': close, 'Low': close, 'Close': close,
+                                              'Volume': 1.0}, index=index)
+        return {ticker: histories.get(ticker, pd.DataFrame()) for ticker in tickers}
+
+    def get_history(self, ticker, start=None, end=None):
+        return self.get_histories([ticker], start, end)[ticker]
+
+
+def test_bootstrap_and_garch_models():
+    """测试历史自助抽样只使用历史日收益，GARCH 模型可复现且波动率为正"""
+    provider = FixedProvider()
+    history = np.log(provider.get_history('AAPL')['Close']).diff().dropna().to_numpy()
+    result = monte_carlo_simulation('AAPL', days=20, simulations=200, provider=provider, seed=4, model='bootstrap',
+                                    include_paths=True)
+    paths = np.array(result['all_paths'])
+    steps = np.diff(np.log(paths), axis=1)
+    assert result['model'] == 'bootstrap'
+    assert np.all(np.min(np.abs(steps[..., None] - history), axis=-1) < 1e-9)
+
+    garch = monte_carlo_simulation('AAPL', days=20, simulations=200, provider=provider, seed=4, model='garch')
+    assert garch == monte_carlo_simulation('AAPL', days=20, simulations=200, provider=provider, seed=4, model='garch')
+    assert garch['percentile_5'] < garch['median_price'] < garch['percentile_95']
+
+
+def test_garch_fit_recovers_volatility_clustering():
+    """测试 GARCH(1,1) 拟合能识别模拟序列的参数"""
+    params = {'mu': 0.0, 'omega': 2e-6, 'alpha': 0.1, 'beta': 0.85, 'last_variance': 4e-5, 'last_residual': 0.0}
+    series = fill_garch_paths(np.random.default_rng(0), np.empty((1, 3000)), 1.0, params)
+    fitted = fit_garch(np.diff(np.log(series[0])))
+    assert abs(fitted['alpha'] - 0.1) < 0.05
+    assert abs(fitted['alpha'] + fitted['beta'] - 0.95) < 0.03
+
+
+def test_correlated_paths_keep_covariance():
+    """测试多股票路径保持历史收益的相关性"""
+    rng = np.random.default_rng(2)
+    history = rng.multivariate_normal([0, 0, 0], [[4e-4, 2e-4, 0], [2e-4, 4e-4, -1e-4], [0, -1e-4, 1e-4]], 500)
+    paths = simulate_correlated_paths([100.0, 50.0, 20.0], history, 2, 100000, seed=1)
+    assert paths.shape == (100000, 2, 3)
+    assert np.allclose(paths[:, 0, :], [100.0, 50.0, 20.0])
+    simulated = np.corrcoef(np.log(paths[:, 1, :] / paths[:, 0, :]), rowvar=False)
+    assert np.allclose(simulated, np.corrcoef(history, rowvar=False), atol=0.02)
+
+    bootstrap = simulate_correlated_paths([100.0, 50.0, 20.0], history, 2, 20000, seed=1, bootstrap=True)
+    steps = np.log(bootstrap[:, 1, :] / bootstrap[:, 0, :])
+    assert np.all(np.min(np.abs(steps[:, None, :] - history).max(axis=-1), axis=1) < 1e-9)
+
+
+def test_portfolio_simulation():
+    """测试整个组合一次模拟，组合价值起点、权重和相关系数正确"""
+    provider = CorrelatedProvider()
+    result = portfolio_monte_carlo_simulation({'AAPL': 10, 'MSFT': 30, 'NVDA': 0}, days=30, simulations=2000,
+                                              provider=provider, seed=6)
+    assert result['tickers'] == ['AAPL', 'MSFT']
+    assert abs(sum(result['weights']) - 1) < 1e-9
+    assert abs(result['percentile_bands']['50'][0] - result['current_value']) < 1e-3
+    assert 0.7 < result['correlation'][0][1] < 0.9
+    assert result['percentile_5'] < result['median_value'] < result['percentile_95']
+
+    try:
+        portfolio_monte_carlo_simulation({'AAPL': 10}, provider=provider, model='garch')
+        assert False, '组合模拟不支持 GARCH 模型'
+    except ValueError:
+        pass
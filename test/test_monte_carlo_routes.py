@@ -0,0 +1,46 @@
+import sys
+import os
+import pytest
+from flask import Flask
+from flask_login import LoginManager
+
+# 添加项目根目录到Python路径，以便导入utils模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from routes.user.monte_carlo import monte_carlo_bp
+from utils.price_history import get_price_history_provider, set_price_history_provider
+from utils.simulation_cache import simulation_cache
+from config import MONTE_CARLO_MAX_FULL_SIMULATIONS
+from test_monte_carlo import FixedProvider
+
+
+@pytest.fixture
+def client():
+    previous = get_price_history_provider()
+    set_price_history_provider(FixedProvider())
+    app = Flask(__name__)
+    app.config['LOGIN_DISABLED'] = True
+    app.secret_key = 'test'
+    LoginManager(app)
+    app.register_blueprint(monte_carlo_bp, url_prefix='/user')
+    yield app.test_client()
+    set_price_history_provider(previous)
+    simulation_cache.clear()
+
+
+def test_full_mode_rejected_above_cap(client):
+    """测试 JSON 格式返回全部路径时超过路径数上限返回 400，二进制格式不受该上限限制"""
+    limit = MONTE_CARLO_MAX_FULL_SIMULATIONS
+    response = client.get(f'/user/api/monte-carlo/AAPL?days=30&simulations={limit + 1}&mode=full')
+    assert response.status_code == 400
+    assert 'format=binary' in response.get_json()['error']
+
+    response = client.get(f'/user/api/monte-carlo/AAPL?days=30&simulations={limit}&mode=full')
+    assert response.status_code == 200
+    assert len(response.get_json()['all_paths']) == limit
+
+    # 摘要模式和二进制格式可以使用更多路径
+    response = client.get(f'/user/api/monte-carlo/AAPL?days=30&simulations={limit + 1}')
+    assert response.status_code == 200 and 'all_paths' not in response.get_json()
+    response = client.get(f'/user/api/monte-carlo/AAPL?days=30&simulations={limit + 1}&mode=full&format=binary')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/octet-stream'
@@ -0,0 +1,42 @@
+import sys
+import os
+from decimal import Decimal
+
+# 添加项目根目录到Python路径，以便导入utils模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from models.enums import OrderType
+from utils.order_book import TickerOrderBook
+
+
+def test_crossed_orders_price_time_priority():
+    """测试被穿越订单按价格-时间优先级返回"""
+    book = TickerOrderBook("AAPL")
+
+    # 买单: 价格越高越优先，同价按订单ID（创建先后）
+    book.add(1, OrderType.BUY, Decimal('100.00'))
+    book.add(3, OrderType.BUY, Decimal('105.00'))
+    book.add(2, OrderType.BUY, Decimal('105.00'))
+    book.add(4, OrderType.BUY, 95.0)
+    # 卖单: 价格越低越优先
+    book.add(5, OrderType.SELL, Decimal('110.00'))
+    book.add(6, OrderType.SELL, Decimal('102.00'))
+
+    assert len(book) == 6
+    # 价格102: 买单限价>=102 的 2、3，卖单限价<=102 的 6
+    assert book.crossed(102) == [2, 3, 6]
+    # 价格100: 买单限价>=100 的 2、3、1，没有卖单被穿越
+    assert book.crossed(Decimal('100')) == [2, 3, 1]
+    # 价格120: 只有卖单被穿越
+    assert book.crossed(120.0) == [6, 5]
+
+
+def test_remove_order():
+    """测试撤单后订单不再被返回"""
+    book = TickerOrderBook("MSFT")
+    book.add(1, OrderType.BUY, Decimal('300'))
+    book.add(2, OrderType.BUY, Decimal('300'))
+
+    assert book.remove(1) is True
+    assert book.remove(1) is False
+    assert 1 not in book
+    assert book.crossed(250) == [2]
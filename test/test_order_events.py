@@ -0,0 +1,87 @@
+import sys
+import os
+from datetime import datetime
+import pandas as pd
+from flask import Flask
+from sqlalchemy import create_engine
+
+# 添加项目根目录到Python路径，以便导入utils模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from models import db, User, Order, MarketData, IngestionCheckpoint
+from models.enums import OrderType, OrderExecutionType
+from utils import stock_data
+from utils.order_events import notify_order_processor, clear_order_event, wait_for_order_event
+
+
+def _make_app():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(user_id=1, user_name='alice', user_email='alice@example.com', user_password='x'))
+        db.session.commit()
+    return app
+
+
+def _market_frame(ticker):
+    return pd.DataFrame({
+        'ticker': ticker, 'date': pd.bdate_range('2025-01-02', periods=3), 'open': 1.0, 'high': 1.0, 'low': 1.0,
+        'close': 1.0, 'volume': 10, 'data_collected_at': datetime(2025, 1, 6)
+    })
+
+
+def test_notify_during_round_is_not_lost():
+    """测试一轮处理开始（清除事件）之后到达的唤醒不会丢失，下一次等待立即返回"""
+    clear_order_event()
+    assert wait_for_order_event(0) is False
+
+    notify_order_processor()
+    # 等待返回后事件保持置位，直到下一轮处理开始时才清除
+    assert wait_for_order_event(0) is True
+    clear_order_event()
+    notify_order_processor()
+    assert wait_for_order_event(0) is True
+    clear_order_event()
+
+
+def test_orm_commit_wakes_processor():
+    """测试 ORM 新建待处理订单或写入行情并提交后唤醒处理器，回滚时不唤醒"""
+    app = _make_app()
+    with app.app_context():
+        clear_order_event()
+        db.session.add(Order(1, 'AAPL', OrderType.BUY, OrderExecutionType.LIMIT, 100, 10))
+        db.session.flush()
+        db.session.rollback()
+        assert wait_for_order_event(0) is False
+
+        db.session.add(Order(1, 'AAPL', OrderType.BUY, OrderExecutionType.LIMIT, 100, 10))
+        db.session.commit()
+        assert wait_for_order_event(0) is True
+
+        clear_order_event()
+        db.session.add(MarketData(ticker='AAPL', date=datetime(2025, 1, 2), open=1, high=1, low=1, close=1,
+                                  volume=10))
+        db.session.commit()
+        assert wait_for_order_event(0) is True
+        clear_order_event()
+
+
+def test_core_market_writes_wake_processor():
+    """测试绕过 ORM 会话的行情写入（批量保存、流式逐只保存）提交后同样唤醒处理器"""
+    engine = create_engine('sqlite://')
+    empty = pd.DataFrame()
+
+    clear_order_event()
+    stock_data.save_to_database(_market_frame('AAPL'), empty, empty, empty, engine=engine)
+    assert wait_for_order_event(0) is True
+
+    clear_order_event()
+    IngestionCheckpoint.__table__.create(engine)
+    assert stock_data._save_ticker(engine, 'MSFT', (_market_frame('MSFT'), None, None, None), 'run-1') == 3
+    assert wait_for_order_event(0) is True
+
+    # 没有写入行情时不唤醒
+    clear_order_event()
+    assert stock_data._save_ticker(engine, 'NVDA', None, 'run-1') == 0
+    assert wait_for_order_event(0) is False
@@ -0,0 +1,104 @@
+import sys
+import os
+from decimal import Decimal
+from flask import Flask
+
+# 添加项目根目录到Python路径，以便导入utils模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from models import db, User, Order, AccountBalance, Portfolio, Transaction
+from models.enums import OrderType, OrderExecutionType, OrderStatus
+import utils.order_utils as order_utils
+from utils.order_book import order_book
+
+
+def _make_app():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        for user_id, name in [(1, 'alice'), (2, 'bob')]:
+            db.session.add(User(user_id=user_id, user_name=name, user_email=f'{name}@example.com', user_password='x'))
+            db.session.add(AccountBalance(user_id=user_id, available_balance=10000.0, frozen_balance=0.0))
+        db.session.add(Portfolio(user_id=2, ticker='AAPL', quantity=5, average_price=80))
+        db.session.commit()
+    return app
+
+
+def _add_market_order(user_id, ticker, order_type, quantity):
+    order = Order(user_id, ticker, order_type, OrderExecutionType.MARKET, None, quantity)
+    db.session.add(order)
+    db.session.commit()
+    return order
+
+
+def _add_limit_order(user_id, ticker, order_type, price, quantity):
+    order = Order(user_id, ticker, order_type, OrderExecutionType.LIMIT, Decimal(str(price)), quantity)
+    db.session.add(order)
+    db.session.commit()
+    return order.order_id
+
+
+def test_scan_keeps_orders_that_are_still_pending(monkeypatch):
+    """测试执行抛出异常、订单仍为 PENDING 时留在订单簿中，离开 PENDING 后才被移除"""
+    app = _make_app()
+    with app.app_context():
+        order_id = _add_limit_order(1, 'AAPL', OrderType.BUY, 100, 10)
+        order_book.clear()
+        order_book.load()
+
+        def broken(order, market_price):
+            raise RuntimeError('数据库连接中断')
+
+        monkeypatch.setattr(order_utils, 'execute_order', broken)
+        order_utils.scan_pending_limit_orders({'AAPL': 99.0})
+        assert order_book.crossed_orders('AAPL', 99.0) == [order_id]
+
+        def rejected(order, market_price):
+            order.order_status = OrderStatus.FAILED
+            db.session.commit()
+            return False, '资金不足'
+
+        monkeypatch.setattr(order_utils, 'execute_order', rejected)
+        order_utils.scan_pending_limit_orders({'AAPL': 99.0})
+        assert order_book.crossed_orders('AAPL', 99.0) == []
+        order_book.clear()
+
+
+def _assert_executed_once(buy_id, sell_id):
+    """买单和卖单各执行一次：每个订单一条交易记录，余额和持仓只变动一次"""
+    transactions = Transaction.query.order_by(Transaction.order_id).all()
+    assert [t.order_id for t in transactions] == [buy_id, sell_id]
+    balances = {account.user_id: account.available_balance for account in AccountBalance.query.all()}
+    assert balances == {1: 9000.0, 2: 10300.0}
+    holdings = {(p.user_id, p.ticker): p.quantity for p in Portfolio.query.all()}
+    assert holdings == {(1, 'AAPL'): 10, (2, 'AAPL'): 2}
+    assert {o.order_status for o in Order.query.filter(Order.order_id.in_([buy_id, sell_id]))} == {OrderStatus.EXECUTED}
+
+
+def test_execute_orders_batch():
+    """测试多个用户的订单在一个事务中批量执行，交易记录批量插入"""
+    app = _make_app()
+    with app.app_context():
+        buy = _add_market_order(1, 'AAPL', OrderType.BUY, 10)
+        sell = _add_market_order(2, 'AAPL', OrderType.SELL, 3)
+        buy_id, sell_id = buy.order_id, sell.order_id
+
+        results = order_utils.execute_orders_batch([(buy, 100.0), (sell, 100.0)])
+        assert results == [(True, '订单执行成功')] * 2
+        _assert_executed_once(buy_id, sell_id)
+
+
+def test_execute_orders_batch_falls_back_on_rejected_order():
+    """测试批次中一个订单持仓不足时整批回滚并逐单执行，其余订单仍只执行一次，不足的订单标记为 FAILED"""
+    app = _make_app()
+    with app.app_context():
+        buy = _add_market_order(1, 'AAPL', OrderType.BUY, 10)
+        sell = _add_market_order(2, 'AAPL', OrderType.SELL, 3)
+        oversell = _add_market_order(2, 'AAPL', OrderType.SELL, 10)
+        buy_id, sell_id, oversell_id = buy.order_id, sell.order_id, oversell.order_id
+
+        results = order_utils.execute_orders_batch([(buy, 100.0), (sell, 100.0), (oversell, 100.0)])
+        assert [success for success, _ in results] == [True, True, False]
+        _assert_executed_once(buy_id, sell_id)
+        assert db.session.get(Order, oversell_id).order_status == OrderStatus.FAILED
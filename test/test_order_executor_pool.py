@@ -0,0 +1,114 @@
+import sys
+import os
+import time
+import threading
+from decimal import Decimal
+from flask import Flask
+
+# 添加项目根目录到Python路径，以便导入utils模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from models import db, User, Order
+from models.enums import OrderType, OrderExecutionType
+import tasks.order_processor as order_processor
+from tasks.order_processor import OrderExecutorPool
+
+
+def _make_app(tmp_path):
+    # 工作线程各自使用独立连接，因此使用文件数据库而不是内存数据库
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'orders.db'}"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        for user_id in (1, 2):
+            db.session.add(User(user_id=user_id, user_name=f'user{user_id}', user_email=f'user{user_id}@example.com',
+                                user_password='x'))
+        db.session.commit()
+    return app
+
+
+def _add_orders(app, user_id, count):
+    """创建 count 个待处理市价单，返回 [(订单ID, 用户ID), ...]"""
+    with app.app_context():
+        orders = [Order(user_id, 'AAPL', OrderType.BUY, OrderExecutionType.MARKET, None, 1) for _ in range(count)]
+        db.session.add_all(orders)
+        db.session.commit()
+        return [(order.order_id, order.user_id) for order in orders]
+
+
+class _Job:
+    """submit 只需要订单的 order_id 和 user_id"""
+    def __init__(self, order_id, user_id):
+        self.order_id = order_id
+        self.user_id = user_id
+
+
+class _RecordingBatch:
+    """替代 execute_orders_batch：记录执行顺序和每个用户同时执行的批次数，每批耗时 delay 秒"""
+    def __init__(self, delay):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.executed = []
+        self.active = {}
+        self.peak = {}
+        self.peak_total = 0
+
+    def __call__(self, order_prices):
+        users = {order.user_id for order, _ in order_prices}
+        with self.lock:
+            for user_id in users:
+                self.active[user_id] = self.active.get(user_id, 0) + 1
+                self.peak[user_id] = max(self.peak.get(user_id, 0), self.active[user_id])
+            self.peak_total = max(self.peak_total, sum(self.active.values()))
+        time.sleep(self.delay)
+        with self.lock:
+            for user_id in users:
+                self.active[user_id] -= 1
+            self.executed.extend(order.order_id for order, _ in order_prices)
+        return [(True, '订单执行成功')] * len(order_prices)
+
+
+def test_same_user_orders_run_serially_in_order(tmp_path, monkeypatch):
+    """测试同一用户的订单进入同一个工作线程，按提交顺序串行执行"""
+    app = _make_app(tmp_path)
+    jobs = _add_orders(app, 1, 6)
+    recorder = _RecordingBatch(0.02)
+    monkeypatch.setattr(order_processor, 'execute_orders_batch', recorder)
+
+    pool = OrderExecutorPool(app, worker_count=4, batch_size=1)
+    pool.start()
+    try:
+        for order_id, user_id in jobs:
+            assert pool.submit(_Job(order_id, user_id), 100.0)
+        # 已在队列中的订单不会被重复提交
+        assert not pool.submit(_Job(*jobs[-1]), 100.0)
+        pool.wait_idle()
+    finally:
+        pool.stop()
+
+    assert recorder.executed == [order_id for order_id, _ in jobs]
+    assert recorder.peak[1] == 1
+
+
+def test_different_users_run_in_parallel(tmp_path, monkeypatch):
+    """测试不同用户的订单在不同工作线程中并行执行"""
+    app = _make_app(tmp_path)
+    jobs = _add_orders(app, 1, 1) + _add_orders(app, 2, 1)
+    recorder = _RecordingBatch(0.3)
+    monkeypatch.setattr(order_processor, 'execute_orders_batch', recorder)
+
+    pool = OrderExecutorPool(app, worker_count=2, batch_size=1)
+    pool.start()
+    try:
+        started = time.monotonic()
+        for order_id, user_id in jobs:
+            pool.submit(_Job(order_id, user_id), 100.0)
+        pool.wait_idle()
+        elapsed = time.monotonic() - started
+    finally:
+        pool.stop()
+
+    assert sorted(recorder.executed) == sorted(order_id for order_id, _ in jobs)
+    assert recorder.peak_total == 2
+    # 串行执行需要 0.6 秒
+    assert elapsed < 0.55
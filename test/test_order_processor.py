@@ -0,0 +1,121 @@
+import sys
+import os
+import time
+import threading
+from datetime import datetime
+from decimal import Decimal
+from flask import Flask
+from sqlalchemy import create_engine, insert
+
+# 添加项目根目录到Python路径，以便导入utils模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from models import db, User, Order, MarketData
+from models.enums import OrderType, OrderExecutionType, OrderStatus
+import tasks.order_processor as order_processor
+from tasks.order_processor import OrderProcessor
+from utils.order_book import order_book
+from utils.order_events import clear_order_event
+
+
+def _make_app(tmp_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'orders.db'}"
+    app.config['ORDER_WORKER_COUNT'] = 1
+    app.config['ORDER_FALLBACK_INTERVAL'] = 30
+    app.config['ORDER_CHANGE_POLL_INTERVAL'] = 0.05
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(user_id=1, user_name='alice', user_email='alice@example.com', user_password='x'))
+        db.session.commit()
+    return app
+
+
+def _timed_wait(processor):
+    """在后台线程中等待下一轮，返回 (线程, 耗时列表)"""
+    elapsed = []
+
+    def run():
+        started = time.monotonic()
+        processor._wait_next_round()
+        elapsed.append(time.monotonic() - started)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread, elapsed
+
+
+def test_order_from_another_process_wakes_leader(tmp_path):
+    """测试另一个进程（独立连接、不触发本进程的会话事件）提交的新订单在兜底超时前唤醒主节点"""
+    app = _make_app(tmp_path)
+    processor = OrderProcessor(app)
+    processor.running = True
+    clear_order_event()
+    with app.app_context():
+        processor._change_marker = processor._read_change_marker()
+
+    thread, elapsed = _timed_wait(processor)
+    time.sleep(0.2)
+    # 模拟另一个 Web 进程：独立引擎的 Core 插入只在数据库中可见
+    other_process = create_engine(f"sqlite:///{tmp_path / 'orders.db'}")
+    with other_process.begin() as connection:
+        connection.execute(insert(Order.__table__).values(
+            user_id=1, ticker='AAPL', order_type=OrderType.BUY, order_execution_type=OrderExecutionType.MARKET,
+            order_quantity=1, order_status=OrderStatus.PENDING
+        ))
+    other_process.dispose()
+    thread.join(timeout=5)
+
+    assert not thread.is_alive()
+    assert 0.2 <= elapsed[0] < 1.0
+
+
+def test_no_change_waits_for_fallback(tmp_path):
+    """测试没有任何变更时一直等待到兜底超时"""
+    app = _make_app(tmp_path)
+    app.config['ORDER_FALLBACK_INTERVAL'] = 0.3
+    processor = OrderProcessor(app)
+    processor.running = True
+    clear_order_event()
+    with app.app_context():
+        processor._change_marker = processor._read_change_marker()
+
+    thread, elapsed = _timed_wait(processor)
+    thread.join(timeout=5)
+    assert elapsed[0] >= 0.3
+
+
+def test_failed_pool_execution_keeps_limit_order_in_book(tmp_path, monkeypatch):
+    """测试限价单交给执行线程池后执行失败、仍为 PENDING 时留在订单簿中，下一轮重新提交"""
+    app = _make_app(tmp_path)
+    app.config['ORDER_WORKER_COUNT'] = 2
+    processor = OrderProcessor(app)
+    attempts = []
+
+    def broken(order_prices):
+        attempts.append([order.order_id for order, _ in order_prices])
+        raise RuntimeError('数据库连接中断')
+
+    monkeypatch.setattr(order_processor, 'execute_orders_batch', broken)
+    processor.executor.start()
+    try:
+        with app.app_context():
+            db.session.add(MarketData(ticker='AAPL', date=datetime(2025, 1, 2), open=99.0, high=99.0, low=99.0,
+                                      close=99.0, volume=100))
+            order = Order(1, 'AAPL', OrderType.BUY, OrderExecutionType.LIMIT, Decimal('100'), 1)
+            db.session.add(order)
+            db.session.commit()
+            order_id = order.order_id
+            order_book.clear()
+
+            processor._process_round()
+            assert attempts == [[order_id]]
+            assert order_book.crossed_orders('AAPL', 99.0) == [order_id]
+            assert db.session.get(Order, order_id).order_status == OrderStatus.PENDING
+
+            processor._process_round()
+            assert attempts == [[order_id], [order_id]]
+            assert order_book.crossed_orders('AAPL', 99.0) == [order_id]
+    finally:
+        processor.executor.stop()
+        order_book.clear()
@@ -0,0 +1,88 @@
+import sys
+import os
+from datetime import datetime, timedelta
+import pandas as pd
+from flask import Flask
+
+# 添加项目根目录到Python路径，以便导入utils模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from models import db, MarketData
+from utils.price_history import PriceHistoryProvider, DatabaseHistoryProvider
+
+
+class RecordingProvider(PriceHistoryProvider):
+    """记录调用参数并返回固定数据的备用数据源"""
+    def __init__(self):
+        self.calls = []
+        self.batches = []
+
+    def get_history(self, ticker, start=None, end=None):
+        self.calls.append((ticker, start, end))
+        index = pd.date_range(start or '2024-01-01', periods=3, freq='D')
+        return pd.DataFrame({'Open': 1.0, 'High': 1.0, 'Low': 1.0, 'Close': 1.0, 'Volume': 1.0}, index=index)
+
+    def get_histories(self, tickers, start=None, end=None):
+        self.batches.append(list(tickers))
+        return super().get_histories(tickers, start=start, end=end)
+
+
+def _make_app():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        start = datetime(2024, 1, 1)
+        for i in range(30):
+            db.session.add(MarketData(ticker='AAPL', date=start + timedelta(days=i),
+                                      open=100 + i, high=101 + i, low=99 + i, close=100.5 + i, volume=1000 + i))
+        db.session.commit()
+    return app
+
+
+def test_reads_window_from_database():
+    """测试窗口完全被数据库覆盖时不访问备用数据源"""
+    app = _make_app()
+    fallback = RecordingProvider()
+    provider = DatabaseHistoryProvider(fallback=fallback)
+    with app.app_context():
+        frame = provider.get_history('AAPL', start='2024-01-03', end='2024-01-28')
+
+    assert fallback.calls == []
+    assert list(frame.columns) == ['Open', 'High', 'Low', 'Close', 'Volume']
+    assert len(frame) == 25
+    assert frame.index[0] == pd.Timestamp('2024-01-03')
+    assert frame['Close'].iloc[0] == 102.5
+
+
+def test_falls_back_for_missing_ticker_and_gaps():
+    """测试缺失股票和窗口两端的日期缺口使用备用数据源"""
+    app = _make_app()
+    fallback = RecordingProvider()
+    provider = DatabaseHistoryProvider(fallback=fallback)
+    with app.app_context():
+        missing = provider.get_history('MSFT', start='2024-01-01', end='2024-01-10')
+        gapped = provider.get_history('AAPL', start='2023-12-01', end='2024-03-01')
+
+    assert fallback.calls == [
+        ('MSFT', '2024-01-01', '2024-01-10'),
+        ('AAPL', '2023-12-01', '2024-01-01'),
+        ('AAPL', '2024-01-31', '2024-03-01'),
+    ]
+    assert len(missing) == 3
+    assert len(gapped) == 36
+    assert gapped.index.is_monotonic_increasing
+
+
+def test_batch_fetches_missing_tickers_together():
+    """测试批量获取时数据库中没有的股票合并为一次备用数据源请求"""
+    app = _make_app()
+    fallback = RecordingProvider()
+    provider = DatabaseHistoryProvider(fallback=fallback)
+    with app.app_context():
+        frames = provider.get_histories(['AAPL', 'MSFT', '^GSPC'], start='2024-01-01', end='2024-01-28')
+
+    assert fallback.batches == [['MSFT', '^GSPC']]
+    assert list(frames) == ['AAPL', 'MSFT', '^GSPC']
+    assert len(frames['AAPL']) == 27
+    assert len(frames['^GSPC']) == 3
@@ -0,0 +1,61 @@
+import sys
+import os
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+# 添加项目根目录到Python路径，以便导入utils模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.risk_engine import compute_risk_metrics
+
+
+def _prices(rng, index, drop=0):
+    series = pd.Series(100 * np.exp(np.cumsum(rng.normal(0.0005, 0.02, len(index)))), index=index)
+    if drop:
+        series = series.drop(series.index[rng.choice(len(index), drop, replace=False)])
+    return series
+
+
+def test_matches_per_ticker_calculation():
+    """测试矩阵计算结果与逐只股票单独计算一致（包括交易日不同的股票）"""
+    rng = np.random.default_rng(7)
+    index = pd.bdate_range('2022-01-03', periods=300)
+    closes = {'AAA': _prices(rng, index), 'BBB': _prices(rng, index, drop=25)}
+    benchmark = _prices(rng, index, drop=3)
+
+    results = compute_risk_metrics(pd.concat(closes, axis=1), benchmark)
+
+    bench_returns = benchmark.pct_change().dropna()
+    for ticker, close in closes.items():
+        returns = close.pct_change().dropna()
+        metrics = results[ticker]
+        assert np.isclose(metrics['volatility'], returns.std() * np.sqrt(252))
+        assert np.isclose(metrics['sharpe_ratio'], returns.mean() / returns.std() * np.sqrt(252))
+        assert np.isclose(metrics['max_drawdown'], (close / close.cummax() - 1).min())
+        assert np.isclose(metrics['var_95'], np.percentile(returns, 5))
+        assert np.isclose(metrics['skewness'], stats.skew(returns))
+        assert np.isclose(metrics['kurtosis'], stats.kurtosis(returns))
+
+        common = returns.index.intersection(bench_returns.index)
+        stock, bench = returns.loc[common].values, bench_returns.loc[common].values
+        beta = np.cov(stock, bench, ddof=1)[0, 1] / np.var(bench, ddof=1)
+        assert np.isclose(metrics['beta'], beta)
+        assert np.isclose(metrics['r_squared'], np.corrcoef(stock, bench)[0, 1] ** 2)
+        assert np.isclose(metrics['treynor_ratio'], returns.mean() * 252 / beta)
+        excess = stock - bench
+        assert np.isclose(metrics['information_ratio'], excess.mean() / np.std(excess, ddof=1) * np.sqrt(252))
+
+
+def test_without_benchmark_and_no_negative_returns():
+    """测试缺少基准数据时相对指标为None，没有负收益时Sortino比率为无穷大"""
+    index = pd.bdate_range('2022-01-03', periods=60)
+    prices = pd.DataFrame({'UP': np.linspace(100, 160, 60)}, index=index)
+
+    metrics = compute_risk_metrics(prices)['UP']
+
+    assert metrics['beta'] is None
+    assert metrics['information_ratio'] is None
+    assert metrics['treynor_ratio'] is None
+    assert metrics['sortino_ratio'] == float('inf')
+    assert metrics['downside_deviation'] == 0.0
+    assert metrics['max_drawdown'] == 0.0
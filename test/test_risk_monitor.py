@@ -0,0 +1,86 @@
+import sys
+import os
+import time
+import threading
+import pandas as pd
+
+# 添加项目根目录到Python路径，以便导入utils模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import risk_monitor
+from utils.risk_monitor import ValuationRiskMonitor, FUNDAMENTAL_ATTRIBUTES
+
+
+class StubFundamentalsMonitor(ValuationRiskMonitor):
+    """用固定数据代替 yfinance 请求，并记录并发请求数"""
+    def __init__(self, tickers, delay=0.05, slow=()):
+        super().__init__(tickers)
+        self.delay = delay
+        self.slow = set(slow)
+        self.requests = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def _fetch_fundamental(self, ticker, attribute):
+        with self._lock:
+            self.requests.append((ticker, attribute))
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(1.0 if ticker in self.slow else self.delay)
+            if attribute == 'info':
+                return {'symbol': ticker}
+            return pd.DataFrame({'2024': [1.0]}, index=['Net Income'])
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+def test_fundamentals_loaded_lazily_and_concurrently(monkeypatch):
+    """测试基本面数据在首次访问时才并发获取，且只获取一次"""
+    monkeypatch.setattr(risk_monitor, 'FUNDAMENTALS_MAX_WORKERS', 4)
+    tickers = ['AAA', 'BBB', 'CCC', 'DDD']
+    monitor = StubFundamentalsMonitor(tickers)
+    assert monitor.requests == []
+
+    start = time.perf_counter()
+    fundamentals = monitor.fundamentals
+    elapsed = time.perf_counter() - start
+
+    assert sorted(monitor.requests) == sorted((t, a) for t in tickers for a in FUNDAMENTAL_ATTRIBUTES)
+    assert monitor.max_active == 4
+    # 16 个请求在 4 个线程上运行，远小于逐个请求的 16 * 0.05 秒
+    assert elapsed < 0.5
+    assert fundamentals['AAA']['info'] == {'symbol': 'AAA'}
+    assert fundamentals['AAA']['net_income'].iloc[0] == 1.0
+
+    monitor.fundamentals
+    assert len(monitor.requests) == len(tickers) * len(FUNDAMENTAL_ATTRIBUTES)
+
+
+def test_fundamentals_timeout_returns_empty_structure(monkeypatch):
+    """测试超时的股票返回空的基本面数据结构，不阻塞其他股票"""
+    monkeypatch.setattr(risk_monitor, 'FUNDAMENTALS_TIMEOUT', 0.3)
+    monitor = StubFundamentalsMonitor(['AAA', 'SLOW'], slow=['SLOW'])
+
+    start = time.perf_counter()
+    fundamentals = monitor.fundamentals
+    assert time.perf_counter() - start < 0.9
+
+    assert fundamentals['AAA']['info'] == {'symbol': 'AAA'}
+    assert fundamentals['SLOW']['info'] == {}
+    assert fundamentals['SLOW']['balance_sheet'].empty
+    assert fundamentals['SLOW']['net_income'] is None
+
+
+def test_fundamentals_timeout_scales_with_batch_size(monkeypatch):
+    """测试请求数超过线程数时超时按轮数放大，排队的请求不会因整体超时被当作缺失"""
+    monkeypatch.setattr(risk_monitor, 'FUNDAMENTALS_MAX_WORKERS', 2)
+    monkeypatch.setattr(risk_monitor, 'FUNDAMENTALS_TIMEOUT', 0.3)
+    tickers = ['AAA', 'BBB', 'CCC']
+    # 12 个请求在 2 个线程上需要 6 轮，每轮 0.15 秒，总计超过单个超时时间
+    monitor = StubFundamentalsMonitor(tickers, delay=0.15)
+
+    fundamentals = monitor.fundamentals
+    assert all(fundamentals[ticker]['info'] == {'symbol': ticker} for ticker in tickers)
+    assert all(fundamentals[ticker]['net_income'] is not None for ticker in tickers)
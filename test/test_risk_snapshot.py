@@ -0,0 +1,61 @@
+import sys
+import os
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from flask import Flask
+
+# 添加项目根目录到Python路径，以便导入utils模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from models import db, MarketData, RiskMetrics
+from utils.price_history import DatabaseHistoryProvider
+from utils.risk_monitor import run_analysis_text_only_batch
+from utils.risk_snapshot import compute_risk_snapshots, get_precomputed_risk_assessments
+
+
+def _make_app():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        rng = np.random.default_rng(11)
+        index = pd.bdate_range(end=pd.Timestamp.now().normalize() - pd.Timedelta(days=1), periods=300)
+        for ticker in ['AAPL', 'MSFT', '^GSPC']:
+            closes = 100 * np.exp(np.cumsum(rng.normal(0.0005, 0.02, len(index))))
+            for date, close in zip(index, closes):
+                db.session.add(MarketData(ticker=ticker, date=date.to_pydatetime(), open=close, high=close,
+                                          low=close, close=close, volume=1000))
+        db.session.commit()
+    return app
+
+
+def test_precomputed_matches_live_calculation():
+    """测试预计算结果与同一窗口的实时计算一致，且没有新行情时不重复计算"""
+    app = _make_app()
+    provider = DatabaseHistoryProvider(fallback=False)
+    with app.app_context():
+        assert compute_risk_snapshots(['AAPL', 'MSFT'], windows=[365], provider=provider) == 2
+        assert compute_risk_snapshots(['AAPL', 'MSFT'], windows=[365], provider=provider) == 0
+        as_of = RiskMetrics.query.first().as_of_date
+
+        end = datetime.now()
+        precomputed = get_precomputed_risk_assessments(['AAPL', 'MSFT', 'NVDA'], end - timedelta(days=365), end)
+        assert set(precomputed) == {'AAPL', 'MSFT'}
+
+        live = run_analysis_text_only_batch(
+            ['AAPL'], str(as_of - timedelta(days=365)), str(as_of + timedelta(days=1)), provider=provider
+        )
+        assert precomputed['AAPL'] == live['AAPL']
+
+
+def test_unusual_range_not_served():
+    """测试与预计算窗口不一致或不以最新行情结束的日期范围不返回预计算结果"""
+    app = _make_app()
+    provider = DatabaseHistoryProvider(fallback=False)
+    with app.app_context():
+        compute_risk_snapshots(['AAPL'], windows=[365], provider=provider)
+        end = datetime.now()
+        assert get_precomputed_risk_assessments(['AAPL'], end - timedelta(days=180), end) == {}
+        old_end = end - timedelta(days=60)
+        assert get_precomputed_risk_assessments(['AAPL'], old_end - timedelta(days=365), old_end) == {}
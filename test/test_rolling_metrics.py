@@ -0,0 +1,108 @@
+import sys
+import os
+import numpy as np
+import pandas as pd
+
+# 添加项目根目录到Python路径，以便导入utils模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.price_history import PriceHistoryProvider
+from utils.rolling_metrics import RollingMetricsStore, TRADING_DAYS
+
+
+def _frame(close):
+    return pd.DataFrame({'Open': close, 'High': close, 'Low': close, 'Close': close, 'Volume': 1.0})
+
+
+class GrowingProvider(PriceHistoryProvider):
+    """按已“到达”的行情截止日期返回数据，并记录每次请求的开始日期"""
+    def __init__(self, closes):
+        self.closes = closes
+        self.available = None
+        self.cutoffs = {}  # 单只股票的行情截止日期，模拟基准指数晚于股票到达
+        self.requests = []
+
+    def get_history(self, ticker, start=None, end=None):
+        self.requests.append((ticker, start))
+        close = self.closes[ticker]
+        close = close[close.index >= pd.Timestamp(start)]
+        if self.available is not None:
+            close = close[close.index <= self.available]
+        if ticker in self.cutoffs:
+            close = close[close.index <= self.cutoffs[ticker]]
+        return _frame(close)
+
+
+def _closes(rng, index):
+    return pd.Series(100 * np.exp(np.cumsum(rng.normal(0.0005, 0.02, len(index)))), index=index)
+
+
+def test_incremental_update_matches_full_recalculation():
+    """测试新行情到达后只读取新增的一天，且结果与完整窗口重新计算一致"""
+    rng = np.random.default_rng(3)
+    index = pd.bdate_range(end=pd.Timestamp.now().normalize(), periods=400)
+    closes = {'AAA': _closes(rng, index), 'BENCH': _closes(rng, index)}
+    provider = GrowingProvider(closes)
+    provider.available = index[-2]
+    store = RollingMetricsStore('BENCH', provider=provider, refresh_interval=0)
+
+    series = store.get_series(['AAA'], windows=[20, 60])
+    assert series['AAA'][20]['date'][-1] == index[-2].strftime('%Y-%m-%d')
+
+    provider.available = index[-1]
+    provider.requests.clear()
+    series = store.get_series(['AAA'], windows=[20, 60])
+    next_day = (index[-2] + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+    assert provider.requests == [('BENCH', next_day), ('AAA', next_day)]
+
+    returns = closes['AAA'].pct_change()
+    bench_returns = closes['BENCH'].pct_change()
+    for window in (20, 60):
+        point = {name: values[-1] for name, values in series['AAA'][window].items()}
+        last = returns.iloc[-window:]
+        last_bench = bench_returns.iloc[-window:]
+        assert point['date'] == index[-1].strftime('%Y-%m-%d')
+        assert np.isclose(point['volatility'], last.std() * np.sqrt(TRADING_DAYS))
+        assert np.isclose(point['sharpe_ratio'], last.mean() / last.std() * np.sqrt(TRADING_DAYS))
+        assert np.isclose(point['beta'], last.cov(last_bench) / last_bench.var())
+        peak = closes['AAA'].iloc[-window:].max()
+        assert np.isclose(point['drawdown'], closes['AAA'].iloc[-1] / peak - 1)
+    # 252 日窗口在第 253 个交易日之后才有数据
+    assert len(series['AAA'][20]['date']) == len(index) - 20
+
+
+def test_no_read_without_new_bars():
+    """测试没有新行情时不重复读取历史数据"""
+    rng = np.random.default_rng(5)
+    index = pd.bdate_range(end=pd.Timestamp.now().normalize(), periods=100)
+    provider = GrowingProvider({'AAA': _closes(rng, index), 'BENCH': _closes(rng, index)})
+    store = RollingMetricsStore('BENCH', provider=provider)
+
+    first = store.get_series(['AAA'], windows=[20])
+    provider.requests.clear()
+    second = store.get_series(['AAA'], windows=[20])
+    assert provider.requests == []
+    assert first == second
+
+
+def test_bars_held_until_benchmark_has_them():
+    """测试股票行情早于基准指数到达时暂不计算，基准补齐后补算，beta 不会因缺少基准收益而永久缺失"""
+    rng = np.random.default_rng(7)
+    index = pd.bdate_range(end=pd.Timestamp.now().normalize(), periods=300)
+    closes = {'AAA': _closes(rng, index), 'BENCH': _closes(rng, index)}
+    provider = GrowingProvider(closes)
+    provider.cutoffs = {'BENCH': index[-3]}
+    store = RollingMetricsStore('BENCH', provider=provider, refresh_interval=0)
+
+    series = store.get_series(['AAA'], windows=[20])
+    assert series['AAA'][20]['date'][-1] == index[-3].strftime('%Y-%m-%d')
+
+    provider.cutoffs = {}
+    series = store.get_series(['AAA'], windows=[20])
+    assert series['AAA'][20]['date'][-2:] == [index[-2].strftime('%Y-%m-%d'), index[-1].strftime('%Y-%m-%d')]
+    last = closes['AAA'].pct_change().iloc[-20:]
+    last_bench = closes['BENCH'].pct_change().iloc[-20:]
+    assert np.isclose(series['AAA'][20]['beta'][-1], last.cov(last_bench) / last_bench.var())
+
+    # 股票只保留最长窗口的收益，基准保留整个回看期供新股票计算 beta
+    assert len(store._states['AAA'].returns) == 252
+    assert len(store._states['BENCH'].returns) == len(index) - 1
@@ -0,0 +1,100 @@
+import sys
+import os
+from datetime import datetime, timedelta
+import pandas as pd
+from flask import Flask
+from sqlalchemy import create_engine
+
+# 添加项目根目录到Python路径，以便导入utils模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from models import db, MarketData, IngestionCheckpoint
+from utils import stock_data
+from utils.monte_carlo import monte_carlo_simulation
+from utils.simulation_cache import SimulationCache, simulation_cache
+from test_monte_carlo import FixedProvider
+
+
+def test_identical_simulation_served_from_cache():
+    """测试相同参数的模拟命中缓存，不同参数或需要全部路径时重新模拟"""
+    cache = SimulationCache(ttl=60, max_bytes=10 * 1024 * 1024)
+    provider = FixedProvider()
+
+    first = monte_carlo_simulation('AAPL', days=30, simulations=500, provider=provider, cache=cache)
+    second = monte_carlo_simulation('AAPL', days=30, simulations=500, provider=provider, cache=cache)
+    assert first == second
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+    monte_carlo_simulation('AAPL', days=30, simulations=600, provider=provider, cache=cache)
+    full = monte_carlo_simulation('AAPL', days=30, simulations=500, provider=provider, cache=cache, include_paths=True)
+    assert 'all_paths' in full
+    stats = cache.stats()
+    assert stats['entries'] == 2 and stats['misses'] == 2
+    assert 0 < stats['bytes'] <= cache.max_bytes
+
+
+def test_lru_eviction_by_bytes():
+    """测试超出内存上限时淘汰最久未使用的结果"""
+    provider = FixedProvider()
+    probe = SimulationCache(ttl=60, max_bytes=10 * 1024 * 1024)
+    monte_carlo_simulation('AAPL', days=30, simulations=100, provider=provider, cache=probe)
+    size = probe.stats()['bytes']
+
+    cache = SimulationCache(ttl=60, max_bytes=int(size * 2.5))
+    for seed in (1, 2, 3):
+        monte_carlo_simulation('AAPL', days=30, simulations=100, provider=provider, cache=cache, seed=seed)
+    assert cache.stats()['entries'] == 2
+    monte_carlo_simulation('AAPL', days=30, simulations=100, provider=provider, cache=cache, seed=1)
+    assert cache.stats()['hits'] == 0
+
+
+def test_new_market_data_invalidates_ticker():
+    """测试提交某只股票的新行情后，只清除该股票的缓存结果"""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    provider = FixedProvider()
+    simulation_cache.clear()
+    monte_carlo_simulation('AAPL', days=30, simulations=100, provider=provider, cache=simulation_cache)
+    monte_carlo_simulation('MSFT', days=30, simulations=100, provider=provider, cache=simulation_cache)
+    assert simulation_cache.stats()['entries'] == 2
+
+    with app.app_context():
+        db.create_all()
+        db.session.add(MarketData(ticker='AAPL', date=datetime.now() - timedelta(days=1),
+                                  open=1, high=1, low=1, close=1, volume=1))
+        db.session.flush()
+        assert simulation_cache.stats()['entries'] == 2
+        db.session.commit()
+    assert simulation_cache.stats()['entries'] == 1
+    simulation_cache.clear()
+
+
+def test_core_market_writes_invalidate_cache():
+    """测试绕过 ORM 会话的行情写入（增量 upsert、流式逐只保存、全量重载）同样清除缓存结果"""
+    engine = create_engine('sqlite://')
+    IngestionCheckpoint.__table__.create(engine)
+    provider = FixedProvider()
+    empty = pd.DataFrame()
+
+    def market_frame(ticker):
+        return pd.DataFrame({'ticker': ticker, 'date': pd.bdate_range('2025-01-02', periods=3), 'open': 1.0,
+                             'high': 1.0, 'low': 1.0, 'close': 1.0, 'volume': 10,
+                             'data_collected_at': datetime(2025, 1, 6)})
+
+    def simulate_all():
+        simulation_cache.clear()
+        for ticker in ('AAPL', 'MSFT', 'NVDA'):
+            monte_carlo_simulation(ticker, days=30, simulations=100, provider=provider, cache=simulation_cache)
+
+    simulate_all()
+    stock_data.save_to_database(market_frame('AAPL'), empty, empty, empty, engine=engine)
+    assert simulation_cache.stats()['entries'] == 2
+
+    simulate_all()
+    stock_data._save_ticker(engine, 'MSFT', (market_frame('MSFT'), None, None, None), 'run-1')
+    assert simulation_cache.stats()['entries'] == 2
+
+    simulate_all()
+    frame = pd.concat([market_frame('AAPL'), market_frame('MSFT')], ignore_index=True)
+    stock_data.save_to_database(frame, empty, empty, empty, engine=engine, full_reload=True)
+    assert simulation_cache.stats()['entries'] == 0
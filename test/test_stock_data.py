@@ -0,0 +1,174 @@
+import sys
+import os
+import time
+import threading
+import pandas as pd
+from sqlalchemy import create_engine, select, func
+
+# 添加项目根目录到Python路径，以便导入utils模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import stock_data
+from models import MarketData, IngestionCheckpoint
+from utils.stock_data import fetch_stock_data, stream_stock_data_collection, RateLimiter
+
+
+class FakeTicker:
+    """模拟 yfinance.Ticker：每次请求耗时 50ms，记录并发数，指定的股票第一次请求历史数据时失败"""
+    lock = threading.Lock()
+    active = 0
+    peak = 0
+    failures = {}
+
+    created = []
+
+    def __init__(self, ticker):
+        self.ticker = ticker
+        FakeTicker.created.append(ticker)
+
+    def _request(self):
+        with FakeTicker.lock:
+            FakeTicker.active += 1
+            FakeTicker.peak = max(FakeTicker.peak, FakeTicker.active)
+        time.sleep(0.05)
+        with FakeTicker.lock:
+            FakeTicker.active -= 1
+
+    def history(self, start=None, **kwargs):
+        self._request()
+        with FakeTicker.lock:
+            if FakeTicker.failures.get(self.ticker, 0) > 0:
+                FakeTicker.failures[self.ticker] -= 1
+                raise ConnectionError('rate limited')
+        index = pd.bdate_range(start=start, periods=3, tz='America/New_York')
+        return pd.DataFrame({'Open': 1.0, 'High': 1.0, 'Low': 1.0, 'Close': 1.0, 'Volume': 10}, index=index)
+
+    @property
+    def info(self):
+        self._request()
+        return {'marketCap': 100}
+
+    @property
+    def financials(self):
+        self._request()
+        return pd.DataFrame({pd.Timestamp('2024-09-30'): [10, 2]}, index=['Total Revenue', 'Net Income'])
+
+    @property
+    def balance_sheet(self):
+        self._request()
+        return pd.DataFrame()
+
+    @property
+    def cashflow(self):
+        self._request()
+        return pd.DataFrame()
+
+
+def test_concurrent_fetch_with_retry(monkeypatch):
+    """测试多只股票在有限线程池中并发获取，失败的请求重试后成功，结果按股票顺序合并"""
+    monkeypatch.setattr(stock_data.yf, 'Ticker', FakeTicker)
+    FakeTicker.peak = 0
+    FakeTicker.failures = {'T03': 2}
+    tickers = [f'T{i:02d}' for i in range(12)]
+
+    started = time.monotonic()
+    market, fundamentals, balance_sheets, income_statements = fetch_stock_data(
+        tickers, {'T00': '2024-01-02'}, max_workers=4, rate=1000, backoff=0.01
+    )
+    elapsed = time.monotonic() - started
+
+    # 12 只股票 x 5 次请求 x 50ms 串行需要 3 秒
+    assert elapsed < 1.5
+    assert 1 < FakeTicker.peak <= 4
+    assert list(fundamentals['ticker']) == tickers
+    assert list(market['ticker'].unique()) == tickers and len(market) == 36
+    assert market[market['ticker'] == 'T00']['date'].min() == pd.Timestamp('2024-01-02', tz='America/New_York')
+    assert balance_sheets.empty and len(income_statements) == 12
+
+
+def test_rate_limiter_spaces_calls():
+    """测试限流器在多线程下按固定间隔放行请求"""
+    limiter = RateLimiter(50)
+    times = []
+
+    def worker():
+        for _ in range(5):
+            limiter.acquire()
+            times.append(time.monotonic())
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    times.sort()
+    # 20 次请求，每秒 50 次，至少需要 19 个间隔
+    assert times[-1] - times[0] >= 19 / 50 - 0.01
+
+
+def test_streaming_collection_resumes_from_checkpoint(monkeypatch):
+    """测试流式采集逐只股票写入并记录检查点，中断后重新运行只处理未完成的股票"""
+    monkeypatch.setattr(stock_data.yf, 'Ticker', FakeTicker)
+    engine = create_engine('sqlite://')
+    tickers = [f'T{i:02d}' for i in range(6)]
+    FakeTicker.failures = {'T02': 1}
+    FakeTicker.created = []
+
+    first = stream_stock_data_collection(tickers, engine=engine, run_id='run-1', max_workers=2, rate=1000, retries=0)
+    assert first['failed'] == ['T02']
+    assert sorted(first['written']) == [t for t in tickers if t != 'T02'] and first['market_rows'] == 15
+
+    FakeTicker.created = []
+    second = stream_stock_data_collection(tickers, engine=engine, run_id='run-1', max_workers=2, rate=1000, retries=0)
+    assert FakeTicker.created == ['T02']
+    assert second['written'] == ['T02'] and len(second['skipped']) == 5 and not second['failed']
+
+    with engine.connect() as connection:
+        assert connection.execute(select(func.count()).select_from(MarketData.__table__)).scalar() == 18
+        # 全部股票保存后检查点被删除
+        assert connection.execute(select(func.count()).select_from(IngestionCheckpoint.__table__)).scalar() == 0
+
+
+def test_second_run_on_same_day_fetches_again(monkeypatch):
+    """测试同一天再次运行（默认 run_id 相同）时，上一次已完成的运行不会导致所有股票被跳过"""
+    monkeypatch.setattr(stock_data.yf, 'Ticker', FakeTicker)
+    engine = create_engine('sqlite://')
+    tickers = ['T00', 'T01', 'T02']
+    FakeTicker.failures = {}
+
+    first = stream_stock_data_collection(tickers, engine=engine, max_workers=2, rate=1000, retries=0)
+    assert sorted(first['written']) == tickers
+
+    FakeTicker.created = []
+    second = stream_stock_data_collection(tickers, engine=engine, max_workers=2, rate=1000, retries=0)
+    assert second['run_id'] == first['run_id']
+    assert sorted(second['written']) == tickers and second['skipped'] == []
+    assert sorted(FakeTicker.created) == tickers
+
+
+class DividendTicker(FakeTicker):
+    """增量请求的行情中包含分红，记录每次请求历史数据的开始日期"""
+    starts = []
+
+    def history(self, start=None, **kwargs):
+        DividendTicker.starts.append(start)
+        hist = super().history(start=start, **kwargs)
+        hist['Dividends'] = 0.0
+        if start != stock_data.STOCK_HISTORY_START:
+            hist.iloc[-1, hist.columns.get_loc('Dividends')] = 0.25
+        return hist
+
+
+def test_corporate_action_refetches_full_history(monkeypatch):
+    """测试增量获取的行情包含分红或拆股时重新获取完整历史，使之前保存的复权价格被覆盖"""
+    call = stock_data._make_call(1000, 0, 0)
+    now = pd.Timestamp('2025-01-10').to_pydatetime()
+
+    monkeypatch.setattr(stock_data.yf, 'Ticker', FakeTicker)
+    market = stock_data._fetch_ticker('AAA', '2025-01-06', now, call)[0]
+    assert market['date'].min().strftime('%Y-%m-%d') == '2025-01-06'
+
+    monkeypatch.setattr(stock_data.yf, 'Ticker', DividendTicker)
+    DividendTicker.starts = []
+    market = stock_data._fetch_ticker('AAA', '2025-01-06', now, call)[0]
+    assert DividendTicker.starts == ['2025-01-06', stock_data.STOCK_HISTORY_START]
+    assert market['date'].min() == pd.Timestamp(stock_data.STOCK_HISTORY_START, tz='America/New_York')
@@ -9,22 +9,59 @@ __version__ = '0.1.1'
 
 # Export all modules
 from . import stock_data
+from . import data_loader
 from . import monte_carlo
 from . import risk_monitor
 from . import chat_ai
 from . import number_utils
 from . import datetime_utils
 from . import order_utils
+from . import order_book
+from . import order_events
+from . import latest_quote
+from . import history_cache
+from . import simulation_cache
+from . import simulation_models
+from . import price_history
+from . import columnar_store
+from . import risk_engine
+from . import rolling_metrics
+from . import risk_snapshot
 
 # Export common functions
 # Stock data module
-from .stock_data import fetch_stock_data, save_to_database, print_data_samples, run_stock_data_collection
+from .stock_data import (
+    fetch_stock_data, save_to_database, print_data_samples, run_stock_data_collection, stream_stock_data_collection
+)
+from .data_loader import get_latest_dates, upsert_frame, reload_table
+from .columnar_store import ColumnarStore
 
 # Monte Carlo simulation module
-from .monte_carlo import monte_carlo_simulation, get_simulation_data, test_monte_carlo
+from .monte_carlo import (
+    monte_carlo_simulation,
+    simulate_price_paths,
+    iter_price_path_batches,
+    summarize_paths,
+    stream_simulation_binary,
+    portfolio_monte_carlo_simulation,
+    get_simulation_data,
+    test_monte_carlo
+)
+
+# Simulation models module
+from .simulation_models import fit_garch, simulate_correlated_paths
 
 # Risk monitoring module
-from .risk_monitor import ValuationRiskMonitor, run_analysis, run_analysis_text_only_simple, test_risk_analysis
+from .risk_monitor import (
+    ValuationRiskMonitor,
+    run_analysis,
+    run_analysis_text_only_simple,
+    run_analysis_text_only_batch,
+    test_risk_analysis
+)
+from .risk_engine import compute_risk_metrics
+from .rolling_metrics import RollingWindow, RollingMetricsStore, get_rolling_metrics_store
+from .risk_snapshot import compute_risk_snapshots, get_precomputed_risk_assessments
 
 # AI chat module
 from .chat_ai import print_markdown, chat_with_gemini, run_chat
@@ -39,21 +76,55 @@ from .datetime_utils import safe_date_format, create_safe_dict
 from .order_utils import (
     process_new_order,
     execute_order,
+    execute_orders_batch,
     validate_order_params,
     get_market_price,
+    get_market_prices,
     check_account_balance,
     can_execute_immediately,
     order_transaction_scope
 )
 
+# Order book module
+from .order_book import OrderBook, TickerOrderBook
+
+# Order processor wake-up events
+from .order_events import notify_order_processor, clear_order_event, wait_for_order_event
+
+# Latest quote module
+from .latest_quote import get_latest_quote, get_latest_quotes, refresh_latest_quotes
+
+# Historical price cache module
+from .history_cache import HistoryCache, download_history, download_histories
+
+# Monte Carlo result cache module
+from .simulation_cache import SimulationCache
+
+# Price history provider module
+from .price_history import (
+    PriceHistoryProvider,
+    YFinanceHistoryProvider,
+    DatabaseHistoryProvider,
+    get_price_history,
+    get_price_histories,
+    get_price_history_provider,
+    set_price_history_provider
+)
+
 # Define __all__ to control behavior of 'from utils import *' (optional but recommended)
 __all__ = [
     # Stock data
     'fetch_stock_data', 'save_to_database', 'print_data_samples', 'run_stock_data_collection',
+    'stream_stock_data_collection', 'get_latest_dates', 'upsert_frame', 'reload_table', 'ColumnarStore',
     # Monte Carlo
-    'monte_carlo_simulation', 'get_simulation_data', 'test_monte_carlo',
+    'monte_carlo_simulation', 'simulate_price_paths', 'iter_price_path_batches', 'summarize_paths',
+    'stream_simulation_binary', 'portfolio_monte_carlo_simulation', 'get_simulation_data', 'test_monte_carlo',
+    'fit_garch', 'simulate_correlated_paths',
     # Risk monitoring
-    'ValuationRiskMonitor', 'run_analysis', 'run_analysis_text_only_simple', 'test_risk_analysis',
+    'ValuationRiskMonitor', 'run_analysis', 'run_analysis_text_only_simple', 'run_analysis_text_only_batch',
+    'test_risk_analysis',
+    'compute_risk_metrics', 'RollingWindow', 'RollingMetricsStore', 'get_rolling_metrics_store',
+    'compute_risk_snapshots', 'get_precomputed_risk_assessments',
     # AI chat
     'print_markdown', 'chat_with_gemini', 'run_chat',
     # Number processing
@@ -61,9 +132,23 @@ __all__ = [
     # Date and time
     'safe_date_format', 'create_safe_dict',
     # Order processing
-    'process_new_order', 'execute_order', 'validate_order_params', 'get_market_price',
-    'check_account_balance', 'can_execute_immediately', 'order_transaction_scope',
+    'process_new_order', 'execute_order', 'execute_orders_batch', 'validate_order_params', 'get_market_price',
+    'get_market_prices', 'check_account_balance', 'can_execute_immediately', 'order_transaction_scope',
+    # Order book
+    'OrderBook', 'TickerOrderBook',
+    # Order events
+    'notify_order_processor', 'clear_order_event', 'wait_for_order_event',
+    # Latest quotes
+    'get_latest_quote', 'get_latest_quotes', 'refresh_latest_quotes',
+    # Historical price cache
+    'HistoryCache', 'download_history', 'download_histories',
+    # Monte Carlo result cache
+    'SimulationCache',
+    # Price history providers
+    'PriceHistoryProvider', 'YFinanceHistoryProvider', 'DatabaseHistoryProvider', 'get_price_history', 'get_price_histories',
+    'get_price_history_provider', 'set_price_history_provider',
     # Modules themselves (if direct module access is needed)
     'stock_data', 'monte_carlo', 'risk_monitor', 'chat_ai', 'number_utils',
-    'datetime_utils', 'order_utils'
+    'datetime_utils', 'order_utils', 'order_book', 'order_events', 'latest_quote', 'history_cache', 'simulation_cache', 'price_history', 'risk_engine',
+    'rolling_metrics', 'risk_snapshot'
 ] 
\ No newline at end of file
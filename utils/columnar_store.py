@@ -0,0 +1,239 @@
+"""
+Columnar OHLCV store module
+Mirror of market_data in one memory-mapped NumPy file per ticker, used as the read path
+for charts, risk analysis and Monte Carlo simulation
+
+Layout: <root>/<TICKER>.npy holds a float64 array of shape (6, bars); row 0 is the bar date
+(days since 1970-01-01) and rows 1-5 are open, high, low, close and volume, each row contiguous.
+A date range is located with a binary search on row 0 and read as a slice of the memory map,
+so no Python object is created per row
+
+Features:
+1. Incremental sync from market_data: only bars from the last stored date onwards are read
+2. Stale tickers are detected by comparing the last stored bar with latest_quote
+3. Each file has a <TICKER>.version.json sidecar with the row count and latest data_collected_at
+   of the ticker's market_data rows; when latest_quote shows another version (older bars were
+   rewritten, e.g. by a full reload or a split/dividend re-adjustment) the file is rebuilt fully
+4. Files are replaced atomically, so concurrent readers (threads or processes) see either
+   the old or the new file
+"""
+import os
+import json
+import threading
+import tempfile
+import numpy as np
+import pandas as pd
+from sqlalchemy import select, func
+from models import db, MarketData
+from utils.latest_quote import get_latest_quotes
+from config import COLUMNAR_STORE_DIR
+
+# Column names of the returned frames, in the order of rows 1-5 of the stored array
+FRAME_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+
+def _to_day(value):
+    """Convert a date/datetime/'YYYY-MM-DD' to days since 1970-01-01"""
+    return float(np.datetime64(pd.Timestamp(value).tz_localize(None).date(), 'D').astype(np.int64))
+
+
+def _history_version(bar_count, collected_at):
+    """
+    Version of a ticker's market_data history
+
+    Returns:
+    list: [row count, latest data_collected_at in ISO format], None if unknown
+    """
+    if bar_count is None:
+        return None
+    return [int(bar_count), collected_at.isoformat() if collected_at is not None else None]
+
+
+class ColumnarStore:
+    """
+    Per-ticker memory-mapped OHLCV files
+    """
+    def __init__(self, root=COLUMNAR_STORE_DIR):
+        self.root = root
+        self._lock = threading.Lock()
+        # {ticker: ((file inode, mtime_ns), memory-mapped array)}; a replaced file has a new inode
+        self._arrays = {}
+        # {ticker: ((file inode, mtime_ns), history version)}
+        self._versions = {}
+
+    def _path(self, ticker, suffix='.npy'):
+        return os.path.join(self.root, f"{ticker.replace(os.sep, '_')}{suffix}")
+
+    def load(self, ticker):
+        """
+        Get the memory-mapped array of a ticker
+
+        Returns:
+        ndarray: read-only array of shape (6, bars), None if the ticker is not stored
+        """
+        path = self._path(ticker)
+        try:
+            status = os.stat(path)
+        except FileNotFoundError:
+            return None
+        version = (status.st_ino, status.st_mtime_ns)
+        cached = self._arrays.get(ticker)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        array = np.load(path, mmap_mode='r')
+        self._arrays[ticker] = (version, array)
+        return array
+
+    def version(self, ticker):
+        """
+        Returns:
+        list: history version the ticker's file was built from (see _history_version), None if unknown
+        """
+        path = self._path(ticker, '.version.json')
+        try:
+            status = os.stat(path)
+        except FileNotFoundError:
+            return None
+        key = (status.st_ino, status.st_mtime_ns)
+        cached = self._versions.get(ticker)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        with open(path) as file:
+            version = json.load(file)
+        self._versions[ticker] = (key, version)
+        return version
+
+    def read(self, ticker, start=None, end=None):
+        """
+        Read the bars of a date range
+
+        Parameters:
+        ticker (str): stock code
+        start (str): start date, format 'YYYY-MM-DD', inclusive
+        end (str): end date, format 'YYYY-MM-DD', exclusive, None means up to the last bar
+
+        Returns:
+        DataFrame: Open/High/Low/Close/Volume columns indexed by date, empty if no bars
+        """
+        array = self.load(ticker)
+        if array is None:
+            return pd.DataFrame(columns=FRAME_COLUMNS)
+        days = array[0]
+        lo = 0 if start is None else int(np.searchsorted(days, _to_day(start), side='left'))
+        hi = len(days) if end is None else int(np.searchsorted(days, _to_day(end), side='left'))
+        index = pd.DatetimeIndex(days[lo:hi].astype(np.int64).astype('datetime64[D]'), name='Date')
+        return pd.DataFrame(np.asarray(array[1:, lo:hi]).T, columns=FRAME_COLUMNS, index=index)
+
+    def last_bar(self, ticker):
+        """
+        Returns:
+        tuple: (last stored day, close of that day), None if the ticker is not stored
+        """
+        array = self.load(ticker)
+        if array is None or array.shape[1] == 0:
+            return None
+        return float(array[0, -1]), float(array[4, -1])
+
+    def _replace(self, path, save, mode='wb'):
+        """Replace a file atomically (write a temporary file with save(file), then rename it)"""
+        os.makedirs(self.root, exist_ok=True)
+        handle, temporary = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+        try:
+            with os.fdopen(handle, mode) as file:
+                save(file)
+            os.replace(temporary, path)
+        except Exception:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+
+    def write(self, ticker, array, version=None):
+        """
+        Replace the file of a ticker atomically, then its version sidecar
+        A reader between the two renames sees the new bars with the old version and at worst
+        rebuilds the file once more
+        """
+        self._replace(self._path(ticker), lambda file: np.save(file, np.ascontiguousarray(array, dtype=np.float64)))
+        version_path = self._path(ticker, '.version.json')
+        if version is not None:
+            self._replace(version_path, lambda file: json.dump(version, file), mode='w')
+        elif os.path.exists(version_path):
+            os.remove(version_path)
+
+    def sync(self, tickers, full=False):
+        """
+        Bring tickers up to date with market_data (must be called inside a Flask application context)
+        Bars from the last stored day onwards are re-read, so a corrected last bar is updated too
+
+        Parameters:
+        tickers (iterable): stock codes
+        full (bool): rebuild the files from all bars instead of re-reading from the last stored day
+
+        Returns:
+        int: number of bars read from market_data
+        """
+        total = 0
+        with self._lock:
+            for ticker in dict.fromkeys(tickers):
+                # Read before the bars: a write committed in between leaves an older version,
+                # which only causes one more rebuild
+                version = _history_version(*db.session.execute(
+                    select(func.count(), func.max(MarketData.data_collected_at)).where(MarketData.ticker == ticker)
+                ).one())
+                stored = None if full else self.load(ticker)
+                stmt = select(
+                    MarketData.date, MarketData.open, MarketData.high, MarketData.low, MarketData.close,
+                    MarketData.volume
+                ).where(MarketData.ticker == ticker)
+                last = None if full else self.last_bar(ticker)
+                if last is not None:
+                    last_day = np.datetime64(int(last[0]), 'D').astype('datetime64[us]').item()
+                    stmt = stmt.where(MarketData.date >= last_day)
+                rows = db.session.execute(stmt.order_by(MarketData.date)).all()
+                if not rows:
+                    continue
+
+                new = np.empty((6, len(rows)), dtype=np.float64)
+                new[0] = [_to_day(row[0]) for row in rows]
+                new[1:] = np.array([row[1:] for row in rows], dtype=np.float64).T
+                if stored is not None:
+                    new = np.concatenate([stored[:, stored[0] < new[0, 0]], new], axis=1)
+                # Bars stored with a time of day can repeat a date; keep the last of each day
+                keep = np.append(new[0, 1:] != new[0, :-1], True)
+                self.write(ticker, new[:, keep], version)
+                total += len(rows)
+        return total
+
+    def sync_stale(self, tickers):
+        """
+        Rebuild the tickers whose history version differs from latest_quote, and sync the
+        tickers whose last stored bar differs from latest_quote (date or close)
+
+        Returns:
+        list: tickers that were rebuilt or synced
+        """
+        quotes = get_latest_quotes(tickers)
+        rebuild, stale = [], []
+        for ticker, quote in quotes.items():
+            version = _history_version(quote.bar_count, quote.collected_at)
+            if version is not None and version != self.version(ticker):
+                rebuild.append(ticker)
+                continue
+            last = self.last_bar(ticker)
+            close = float(quote.close) if quote.close is not None else None
+            if last is None or last[0] != _to_day(quote.date) or (close is not None and last[1] != close):
+                stale.append(ticker)
+        if rebuild:
+            self.sync(rebuild, full=True)
+        if stale:
+            self.sync(stale)
+        return rebuild + stale
+
+    def clear(self):
+        """Forget the cached memory maps and versions (files are kept)"""
+        self._arrays.clear()
+        self._versions.clear()
+
+
+# Process-wide store instance
+columnar_store = ColumnarStore()
@@ -0,0 +1,176 @@
+"""
+Incremental data loader module
+Write collected stock data into the ORM-defined tables without rebuilding them
+
+Features:
+1. Latest stored date per ticker, so only newer bars need to be fetched
+2. Batched upserts (INSERT ... ON DUPLICATE KEY UPDATE on MySQL, ON CONFLICT DO UPDATE
+   on SQLite/PostgreSQL) in chunks, keyed by the table's (ticker, date) primary key
+3. Full reloads into a staging table that is swapped in with one atomic RENAME TABLE,
+   so readers never see a missing, empty or half-written table
+"""
+import uuid
+import numpy as np
+import pandas as pd
+from sqlalchemy import select, func, inspect, text, MetaData, Table, Index
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from models import MarketData
+from config import UPSERT_CHUNK_SIZE
+
+# Dialects whose insert construct supports ON CONFLICT DO UPDATE
+_ON_CONFLICT_DIALECTS = {'sqlite': sqlite, 'postgresql': postgresql}
+
+
+def get_latest_dates(connection, table=MarketData.__table__, tickers=None):
+    """
+    Get the latest stored date of each ticker
+
+    Parameters:
+    connection (Connection): SQLAlchemy connection
+    table (Table): table with ticker and date columns, default market_data
+    tickers (iterable): stock codes, None for all tickers in the table
+
+    Returns:
+    dict: {ticker: datetime}, tickers without rows are not included
+    """
+    query = select(table.c.ticker, func.max(table.c.date)).group_by(table.c.ticker)
+    if tickers is not None:
+        tickers = list(set(tickers))
+        if not tickers:
+            return {}
+        query = query.where(table.c.ticker.in_(tickers))
+    return {ticker: pd.Timestamp(latest).to_pydatetime() for ticker, latest in connection.execute(query)}
+
+
+def _upsert_statement(connection, table):
+    """Build an insert statement of the connection's dialect that updates rows with an existing primary key"""
+    dialect = connection.dialect.name
+    primary_key = [column.name for column in table.primary_key.columns]
+    updated = [column.name for column in table.columns if column.name not in primary_key]
+    if dialect == 'mysql':
+        statement = mysql.insert(table)
+        return statement.on_duplicate_key_update({name: statement.inserted[name] for name in updated})
+    if dialect in _ON_CONFLICT_DIALECTS:
+        statement = _ON_CONFLICT_DIALECTS[dialect].insert(table)
+        return statement.on_conflict_do_update(
+            index_elements=primary_key, set_={name: statement.excluded[name] for name in updated}
+        )
+    raise NotImplementedError(f"Upsert is not supported for the {dialect} dialect")
+
+
+def _to_records(frame, table):
+    """Convert a DataFrame to row dicts of the table's columns, with NaN/NaT as None and naive datetimes"""
+    frame = frame[[column.name for column in table.columns if column.name in frame.columns]].copy()
+    for name in frame.columns:
+        if isinstance(frame[name].dtype, pd.DatetimeTZDtype):
+            frame[name] = frame[name].dt.tz_localize(None)
+    frame = frame.astype(object).where(frame.notna(), None)
+    records = frame.to_dict('records')
+    # NumPy scalars are not understood by every DB driver
+    for record in records:
+        for name, value in record.items():
+            if isinstance(value, np.generic):
+                record[name] = value.item()
+            elif isinstance(value, pd.Timestamp):
+                record[name] = value.to_pydatetime()
+    return records
+
+
+def upsert_frame(connection, table, frame, chunk_size=UPSERT_CHUNK_SIZE):
+    """
+    Insert the rows of a DataFrame, updating rows whose primary key already exists
+
+    Parameters:
+    connection (Connection): SQLAlchemy connection, rows are written in its current transaction
+    table (Table): target table, must have its primary key in the database
+    frame (DataFrame): rows to write, columns named like the table columns (others are ignored)
+    chunk_size (int): rows per batched statement
+
+    Returns:
+    int: number of rows written
+    """
+    if frame is None or frame.empty:
+        return 0
+    if not inspect(connection).get_pk_constraint(table.name).get('constrained_columns'):
+        # A table rebuilt by DataFrame.to_sql has no primary key, so upserts would duplicate rows
+        raise RuntimeError(f"Table {table.name} has no primary key; recreate it from the models before loading")
+    statement = _upsert_statement(connection, table)
+    records = _to_records(frame, table)
+    for start in range(0, len(records), chunk_size):
+        connection.execute(statement, records[start:start + chunk_size])
+    return len(records)
+
+
+def _staging_table(table, name, keep_index_names):
+    """
+    Copy the schema of table (columns, primary key, indexes) under another name
+
+    Parameters:
+    table (Table): table to copy
+    name (str): name of the copy
+    keep_index_names (bool): keep the index names, possible where they are per table (MySQL);
+        elsewhere index names are schema-wide and get a unique suffix
+    """
+    columns = [column._copy() for column in table.columns]
+    # Indexes are copied below under the live table's names, not generated from index=True
+    for column in columns:
+        column.index = None
+    staging = Table(name, MetaData(), *columns)
+    suffix = '' if keep_index_names else f"_{uuid.uuid4().hex[:8]}"
+    for index in table.indexes:
+        Index(f"{index.name}{suffix}", *[staging.c[column.name] for column in index.columns], unique=index.unique)
+    return staging
+
+
+def reload_table(engine, table, frames, chunk_size=UPSERT_CHUNK_SIZE):
+    """
+    Replace all rows of a table without ever exposing it empty or partially loaded
+    The rows are loaded into <table>_staging, which then replaces the live table in one
+    atomic RENAME TABLE (on other dialects, renames inside one transaction); readers and
+    writers of the live table keep working on the old rows until the swap
+
+    Parameters:
+    engine (Engine): database engine
+    table (Table): live table to replace
+    frames (iterable): DataFrames with the new rows, each loaded in its own transaction
+    chunk_size (int): rows per batched statement
+
+    Returns:
+    int: number of rows loaded
+    """
+    staging_name, old_name = f"{table.name}_staging", f"{table.name}_old"
+    is_mysql = engine.dialect.name == 'mysql'
+    quote = engine.dialect.identifier_preparer.quote
+    staging = _staging_table(table, staging_name, keep_index_names=is_mysql)
+
+    # Leftovers of an interrupted reload
+    with engine.begin() as connection:
+        connection.execute(text(f"DROP TABLE IF EXISTS {quote(staging_name)}"))
+        connection.execute(text(f"DROP TABLE IF EXISTS {quote(old_name)}"))
+    staging.create(engine)
+
+    count = 0
+    try:
+        for frame in frames:
+            with engine.begin() as connection:
+                count += upsert_frame(connection, staging, frame, chunk_size)
+
+        live_exists = inspect(engine).has_table(table.name)
+        with engine.begin() as connection:
+            if is_mysql:
+                renames = f"{quote(staging_name)} TO {quote(table.name)}"
+                if live_exists:
+                    renames = f"{quote(table.name)} TO {quote(old_name)}, " + renames
+                connection.execute(text(f"RENAME TABLE {renames}"))
+            else:
+                if live_exists:
+                    connection.execute(text(f"ALTER TABLE {quote(table.name)} RENAME TO {quote(old_name)}"))
+                connection.execute(text(f"ALTER TABLE {quote(staging_name)} RENAME TO {quote(table.name)}"))
+    except Exception:
+        with engine.begin() as connection:
+            connection.execute(text(f"DROP TABLE IF EXISTS {quote(staging_name)}"))
+        raise
+
+    with engine.begin() as connection:
+        connection.execute(text(f"DROP TABLE IF EXISTS {quote(old_name)}"))
+    return count
@@ -0,0 +1,284 @@
+"""
+Historical price cache module
+Process-wide cache for yfinance history downloads, shared by Monte Carlo simulation and risk analysis
+
+Features:
+1. Entries keyed by (ticker, start, end, interval) expire after a TTL
+2. Least recently used entries are evicted once the cached frames exceed a memory bound
+3. Concurrent requests for the same key share a single download
+"""
+import threading
+import time
+from collections import OrderedDict
+import pandas as pd
+import yfinance as yf
+from config import HISTORY_CACHE_TTL, HISTORY_CACHE_MAX_BYTES
+
+
+class _Flight:
+    """A download in progress that other requests for the same key wait on"""
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class HistoryCache:
+    """
+    TTL + LRU cache bounded by the memory used by the cached DataFrames
+    """
+    def __init__(self, ttl=HISTORY_CACHE_TTL, max_bytes=HISTORY_CACHE_MAX_BYTES):
+        """
+        Initialize the cache
+
+        Parameters:
+        ttl (float): seconds an entry stays valid
+        max_bytes (int): upper bound of the memory used by cached frames
+        """
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (expires_at, frame, nbytes)
+        self._inflight = {}  # key -> _Flight
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, loader):
+        """
+        Return the cached frame for key, calling loader() on a miss
+
+        Only one loader runs per key at a time; other callers wait for its result.
+        Empty frames are returned but not cached, so failed downloads are retried.
+
+        Parameters:
+        key (tuple): cache key
+        loader (callable): function returning a DataFrame
+
+        Returns:
+        DataFrame: cached or freshly loaded frame (shared, do not modify in place)
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                self._discard(key)
+            flight = self._inflight.get(key)
+            is_loader = flight is None
+            if is_loader:
+                flight = self._inflight[key] = _Flight()
+                self.misses += 1
+
+        if not is_loader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = loader()
+            self._store(key, flight.result)
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.done.set()
+
+    def get_many(self, keys, loader):
+        """
+        Return cached frames for several keys, loading all missing keys with one loader call
+
+        Keys already being loaded by another request are waited on instead of loaded again.
+
+        Parameters:
+        keys (list): cache keys
+        loader (callable): function taking the list of missing keys and returning {key: DataFrame}
+
+        Returns:
+        dict: {key: DataFrame} (shared, do not modify in place)
+        """
+        results = {}
+        waiting = {}
+        owned = {}
+        with self._lock:
+            now = time.monotonic()
+            for key in dict.fromkeys(keys):
+                entry = self._entries.get(key)
+                if entry is not None:
+                    if entry[0] > now:
+                        self._entries.move_to_end(key)
+                        self.hits += 1
+                        results[key] = entry[1]
+                        continue
+                    self._discard(key)
+                flight = self._inflight.get(key)
+                if flight is not None:
+                    waiting[key] = flight
+                else:
+                    owned[key] = self._inflight[key] = _Flight()
+                    self.misses += 1
+
+        if owned:
+            try:
+                loaded = loader(list(owned))
+                for key, flight in owned.items():
+                    flight.result = loaded.get(key, pd.DataFrame())
+                    self._store(key, flight.result)
+                    results[key] = flight.result
+            except Exception as e:
+                for flight in owned.values():
+                    flight.error = e
+                raise
+            finally:
+                with self._lock:
+                    for key in owned:
+                        self._inflight.pop(key, None)
+                for flight in owned.values():
+                    flight.done.set()
+
+        for key, flight in waiting.items():
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            results[key] = flight.result
+        return results
+
+    def clear(self):
+        """Remove all cached entries"""
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        """Return cache statistics"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+    def invalidate(self, predicate):
+        """
+        Remove the entries whose key matches a predicate
+
+        Parameters:
+        predicate (callable): function taking a key and returning True to remove the entry
+
+        Returns:
+        int: number of removed entries
+        """
+        with self._lock:
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                self._discard(key)
+            return len(keys)
+
+    def _cacheable(self, value):
+        """Whether a loaded value is cached (subclasses caching other types override this)"""
+        return value is not None and not value.empty
+
+    def _nbytes(self, value):
+        """Memory used by a cached value (subclasses caching other types override this)"""
+        return int(value.memory_usage(deep=True).sum())
+
+    def _store(self, key, frame):
+        """Insert a loaded frame and evict least recently used entries beyond the memory bound"""
+        if not self._cacheable(frame):
+            return
+        nbytes = self._nbytes(frame)
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = (time.monotonic() + self.ttl, frame, nbytes)
+            self.current_bytes += nbytes
+            while self.current_bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._discard(oldest)
+
+    def _discard(self, key):
+        """Remove an entry (caller holds the lock)"""
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.current_bytes -= entry[2]
+
+
+# Process-wide cache instance
+history_cache = HistoryCache()
+
+
+def _download(ticker, start, end, interval):
+    """Download history for a single ticker with flat OHLCV columns, split and dividend adjusted"""
+    # The auto_adjust default has changed between yfinance versions, so it is always passed
+    data = yf.download(ticker, start=start, end=end, interval=interval, auto_adjust=True, progress=False)
+    if data is None:
+        return pd.DataFrame()
+    # Newer yfinance versions return (field, ticker) columns even for a single ticker
+    if isinstance(data.columns, pd.MultiIndex):
+        data.columns = data.columns.get_level_values(0)
+    return data
+
+
+def _download_many(tickers, start, end, interval):
+    """Download history for several tickers in one multi-symbol request, adjusted like _download"""
+    data = yf.download(tickers, start=start, end=end, interval=interval, group_by='ticker', auto_adjust=True,
+                       progress=False)
+    if data is None or data.empty:
+        return {ticker: pd.DataFrame() for ticker in tickers}
+    if not isinstance(data.columns, pd.MultiIndex):
+        # Older yfinance versions return flat columns when only one ticker is requested
+        return {tickers[0]: data}
+    available = set(data.columns.get_level_values(0))
+    # Rows are the union of all tickers' trading days; drop the ones a ticker has no data for
+    return {
+        ticker: data[ticker].dropna(how='all') if ticker in available else pd.DataFrame()
+        for ticker in tickers
+    }
+
+
+def download_histories(tickers, start=None, end=None, interval='1d'):
+    """
+    Get historical price data for several tickers, downloading all uncached ones in a single request
+
+    Parameters:
+    tickers (list): stock codes
+    start (str): start date, format 'YYYY-MM-DD'
+    end (str): end date, format 'YYYY-MM-DD', None means up to today
+    interval (str): data interval, default is daily
+
+    Returns:
+    dict: {ticker: DataFrame}, empty frames for tickers that could not be downloaded
+    """
+    keys = [(ticker, start, end, interval) for ticker in tickers]
+
+    def loader(missing_keys):
+        frames = _download_many([key[0] for key in missing_keys], start, end, interval)
+        return {key: frames.get(key[0], pd.DataFrame()) for key in missing_keys}
+
+    frames = history_cache.get_many(keys, loader)
+    return {key[0]: frames[key].copy() for key in keys}
+
+
+def download_history(ticker, start=None, end=None, interval='1d'):
+    """
+    Get historical price data for a ticker through the process-wide cache
+
+    Parameters:
+    ticker (str): stock code
+    start (str): start date, format 'YYYY-MM-DD'
+    end (str): end date, format 'YYYY-MM-DD', None means up to today
+    interval (str): data interval, default is daily
+
+    Returns:
+    DataFrame: OHLCV data indexed by date, empty if the download failed
+    """
+    key = (ticker, start, end, interval)
+    return history_cache.get(key, lambda: _download(ticker, start, end, interval)).copy()
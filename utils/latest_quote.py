@@ -0,0 +1,125 @@
+"""
+最新行情表维护与查询
+latest_quote 表为每只股票保存 market_data 中日期最新的一行，以及该股票的行数和最新采集时间
+（历史行情的版本，列式存储据此发现较早K线的改写）
+
+包含：
+1. 通过 SQLAlchemy 会话事件，在 market_data 写入的同一事务中刷新受影响股票的最新行情
+2. 批量写入（如 pandas.to_sql）后手动调用的刷新函数
+3. 按主键读取单只或多只股票最新行情的查询接口，报价查询不再访问历史行情表
+"""
+import logging
+from datetime import datetime
+from sqlalchemy import event, select, insert, delete, func, and_, literal
+from sqlalchemy.orm import Session
+from models import db, MarketData, LatestQuote
+
+# 设置日志
+logger = logging.getLogger(__name__)
+
+# 已检查过是否需要从 market_data 回填的数据库引擎
+_backfilled_engines = set()
+
+
+def refresh_latest_quotes(connection, tickers=None):
+    """
+    根据 market_data 重建最新行情（删除后按每只股票的最大日期重新插入）
+
+    参数:
+        connection (Connection): SQLAlchemy 连接，刷新在该连接当前的事务中执行
+        tickers (iterable, optional): 需要刷新的股票代码，None 表示全部股票
+
+    返回:
+        int: 写入的最新行情行数
+    """
+    market_data = MarketData.__table__
+    latest_quote = LatestQuote.__table__
+
+    # Row count and latest collection time form the version of the ticker's history
+    latest_dates = select(
+        market_data.c.ticker.label('ticker'),
+        func.max(market_data.c.date).label('max_date'),
+        func.count().label('bar_count'),
+        func.max(market_data.c.data_collected_at).label('collected_at')
+    ).group_by(market_data.c.ticker)
+    clear = delete(latest_quote)
+    if tickers is not None:
+        tickers = list(set(tickers))
+        if not tickers:
+            return 0
+        latest_dates = latest_dates.where(market_data.c.ticker.in_(tickers))
+        clear = clear.where(latest_quote.c.ticker.in_(tickers))
+    latest_dates = latest_dates.subquery()
+
+    rows = select(
+        market_data.c.ticker, market_data.c.date, market_data.c.open, market_data.c.high,
+        market_data.c.low, market_data.c.close, market_data.c.volume, latest_dates.c.bar_count,
+        latest_dates.c.collected_at, literal(datetime.now())
+    ).join(
+        latest_dates,
+        and_(market_data.c.ticker == latest_dates.c.ticker, market_data.c.date == latest_dates.c.max_date)
+    )
+
+    connection.execute(clear)
+    result = connection.execute(insert(latest_quote).from_select(
+        ['ticker', 'date', 'open', 'high', 'low', 'close', 'volume', 'bar_count', 'collected_at', 'updated_at'], rows
+    ))
+    return result.rowcount
+
+
+def _ensure_backfilled():
+    """
+    latest_quote 表为空而 market_data 已有数据时（例如升级后首次运行），从 market_data 回填
+    每个进程、每个数据库只检查一次
+    """
+    engine = db.engine
+    if engine in _backfilled_engines:
+        return
+    if db.session.query(LatestQuote.ticker).first() is None and db.session.query(MarketData.ticker).first() is not None:
+        with engine.begin() as connection:
+            count = refresh_latest_quotes(connection)
+        logger.info(f"已从 market_data 回填 {count} 只股票的最新行情")
+    _backfilled_engines.add(engine)
+
+
+def get_latest_quote(ticker):
+    """
+    获取单只股票的最新行情（按主键查询）
+
+    参数:
+        ticker (str): 股票代码
+
+    返回:
+        LatestQuote: 最新行情，没有数据时返回None
+    """
+    _ensure_backfilled()
+    return db.session.get(LatestQuote, ticker)
+
+
+def get_latest_quotes(tickers):
+    """
+    批量获取多只股票的最新行情（一次主键 IN 查询）
+
+    参数:
+        tickers (iterable): 股票代码集合
+
+    返回:
+        dict: {股票代码: LatestQuote}，没有数据的股票不包含在结果中
+    """
+    tickers = list(set(tickers))
+    if not tickers:
+        return {}
+    _ensure_backfilled()
+    quotes = LatestQuote.query.filter(LatestQuote.ticker.in_(tickers)).all()
+    return {quote.ticker: quote for quote in quotes}
+
+
+@event.listens_for(Session, 'after_flush')
+def _refresh_after_flush(session, flush_context):
+    """market_data 行被新增、修改或删除时，在同一事务中刷新对应股票的最新行情"""
+    tickers = {
+        obj.ticker for obj in list(session.new) + list(session.dirty) + list(session.deleted)
+        if isinstance(obj, MarketData)
+    }
+    if tickers:
+        refresh_latest_quotes(session.connection(), tickers)
@@ -1,13 +1,170 @@
 """
 Monte Carlo simulation module
 """
+import json
+import struct
 import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
-import yfinance as yf
 import traceback
+from utils.price_history import get_price_history, get_price_histories
+from utils.simulation_models import (
+    fill_gbm_paths, fill_bootstrap_paths, fill_garch_paths, fit_garch, simulate_correlated_paths
+)
+from config import MONTE_CARLO_SAMPLE_PATHS, MONTE_CARLO_HISTOGRAM_BINS, MONTE_CARLO_BAND_PATHS, MONTE_CARLO_STREAM_BATCH
 
-def monte_carlo_simulation(ticker, days=60, simulations=200):
+# Percentiles of the per-day bands in the summary response
+BAND_PERCENTILES = (5, 25, 50, 75, 95)
+
+# Decimal places of prices in the summary response (same precision as market_data)
+PRICE_DECIMALS = 4
+
+# Models of the daily log returns: constant-parameter GBM, historical bootstrap, GARCH(1,1) volatility
+SIMULATION_MODELS = ('gbm', 'bootstrap', 'garch')
+
+# Models available for correlated multi-ticker (portfolio) simulation
+PORTFOLIO_MODELS = ('gbm', 'bootstrap')
+
+def _path_filler(model, current_price, mu, sigma, log_returns):
+    """
+    Return fill(rng, paths) that writes price paths of the given model into a preallocated array
+    
+    Parameters:
+        model (str): one of SIMULATION_MODELS
+        log_returns (ndarray): historical daily log returns, used by 'bootstrap' and 'garch'
+    """
+    if model == 'gbm':
+        return lambda rng, paths: fill_gbm_paths(rng, paths, current_price, mu, sigma)
+    if model == 'bootstrap':
+        return lambda rng, paths: fill_bootstrap_paths(rng, paths, current_price, log_returns)
+    if model == 'garch':
+        garch = fit_garch(log_returns)
+        return lambda rng, paths: fill_garch_paths(rng, paths, current_price, garch)
+    raise ValueError(f"Unknown simulation model: {model}, expected one of {', '.join(SIMULATION_MODELS)}")
+
+def _iter_batches(fill, days, simulations, batch_size, dtype, seed):
+    """Fill reused batch buffers one after another with the same random generator"""
+    rng = np.random.default_rng(seed)
+    buffer = np.empty((min(batch_size, simulations), days), dtype=dtype)
+    for start in range(0, simulations, batch_size):
+        batch = buffer[:min(batch_size, simulations - start)]
+        yield fill(rng, batch)
+
+def simulate_price_paths(current_price, mu, sigma, days, simulations, dtype=np.float64, seed=None):
+    """
+    Simulate price paths with geometric Brownian motion
+    All shocks are drawn in one call and each path is the exponential of the
+    cumulative sum of its daily log returns, computed in place
+    
+    Parameters:
+        current_price (float): price on the first day of every path
+        mu (float): mean daily log return
+        sigma (float): daily volatility of log returns
+        days (int): number of days in each path, including the first day
+        simulations (int): number of paths
+        dtype: np.float64, or np.float32 to halve memory and speed up large simulations
+        seed (int): seed of the random generator, None for a random seed
+        
+    Returns:
+        ndarray: price paths, shape (simulations, days)
+    """
+    rng = np.random.default_rng(seed)
+    return fill_gbm_paths(rng, np.empty((simulations, days), dtype=dtype), current_price, mu, sigma)
+
+def iter_price_path_batches(current_price, mu, sigma, days, simulations, batch_size=MONTE_CARLO_STREAM_BATCH,
+                            dtype=np.float64, seed=None):
+    """
+    Simulate price paths batch by batch so only one batch is held in memory
+    The generator draws shocks in the same order as simulate_price_paths, so with the
+    same seed the concatenated batches equal the paths simulated at once
+    
+    Parameters:
+        batch_size (int): maximum number of paths per batch
+        other parameters: same as simulate_price_paths
+        
+    Yields:
+        ndarray: price paths of one batch, shape (paths in batch, days); the buffer is
+            reused for the next batch, so copy it if it must be kept
+    """
+    fill = _path_filler('gbm', current_price, mu, sigma, None)
+    return _iter_batches(fill, days, simulations, batch_size, dtype, seed)
+
+def summarize_paths(paths, sample_paths=MONTE_CARLO_SAMPLE_PATHS, histogram_bins=MONTE_CARLO_HISTOGRAM_BINS,
+                    band_paths=MONTE_CARLO_BAND_PATHS):
+    """
+    Summarize simulated paths for charts instead of returning every path
+    
+    Parameters:
+        paths (ndarray): price paths, shape (simulations, days)
+        sample_paths (int): number of representative paths to return
+        histogram_bins (int): number of bins of the terminal price histogram
+        band_paths (int): maximum number of paths used for the per-day bands; larger runs use
+            evenly strided paths, which are an unbiased sample because all paths are independent
+        
+    Returns:
+        dict: percentile_bands {percentile: [price per day]}, sample_paths (paths whose terminal
+            prices sit at evenly spaced quantiles, the same for the same paths) and
+            terminal_histogram {bin_edges, counts}
+    """
+    simulations = paths.shape[0]
+    step = -(-simulations // band_paths)  # ceiling division, keeps at most band_paths paths
+    bands = np.percentile(paths[::step], BAND_PERCENTILES, axis=0)
+    
+    final_prices = paths[:, -1]
+    order = np.argsort(final_prices, kind='stable')
+    count = min(sample_paths, simulations)
+    positions = ((np.arange(count) + 0.5) / count * simulations).astype(int)
+    samples = paths[order[positions]]
+    
+    counts, bin_edges = np.histogram(final_prices, bins=histogram_bins)
+    return {
+        "percentile_bands": {
+            str(percentile): np.round(band, PRICE_DECIMALS).tolist()
+            for percentile, band in zip(BAND_PERCENTILES, bands)
+        },
+        "sample_paths": np.round(samples.astype(np.float64), PRICE_DECIMALS).tolist(),
+        "terminal_histogram": {
+            "bin_edges": np.round(bin_edges.astype(np.float64), PRICE_DECIMALS).tolist(),
+            "counts": counts.tolist()
+        }
+    }
+
+def _estimate_parameters(ticker, provider=None):
+    """
+    Estimate the simulation inputs from one year of history
+    
+    Returns:
+        tuple: (current price, mean daily log return, daily volatility of log returns,
+            as-of date 'YYYY-MM-DD' of the last price, ndarray of the daily log returns)
+    """
+    # Get one year of historical data
+    start_date = (datetime.now() - timedelta(days=365)).strftime('%Y-%m-%d')
+    hist_data = get_price_history(ticker, start=start_date, provider=provider)
+    
+    if hist_data.empty:
+        raise ValueError(f"Cannot get historical data for {ticker}")
+    
+    # Get current price
+    current_price = float(hist_data['Close'].iloc[-1])
+    
+    # Calculate daily returns and volatility
+    returns = np.log(1 + hist_data['Close'].pct_change())
+    mu = float(returns.mean())  # daily return
+    sigma = float(returns.std())  # daily volatility
+    as_of = pd.Timestamp(hist_data.index[-1]).strftime('%Y-%m-%d')
+    return current_price, mu, sigma, as_of, returns.dropna().to_numpy()
+
+def _simulation_dates(days):
+    """Generate simulation dates, starting today"""
+    date_strings = []
+    current_date = datetime.now()
+    for i in range(days):
+        future_date = current_date + timedelta(days=i)
+        date_strings.append(future_date.strftime('%Y-%m-%d'))
+    return date_strings
+
+def monte_carlo_simulation(ticker, days=60, simulations=200, provider=None, dtype=np.float64, seed=None,
+                           include_paths=False, cache=None, model='gbm'):
     """
     Execute the complete Monte Carlo simulation process
     
@@ -15,86 +172,208 @@ def monte_carlo_simulation(ticker, days=60, simulations=200):
         ticker (str): stock code
         days (int): simulation days, default 60 days
         simulations (int): simulation times, default 200 times
+        provider (PriceHistoryProvider): price history source, default reads market_data with yfinance fallback
+        dtype: floating point type of the simulated paths, np.float64 or np.float32
+        seed (int): seed of the random generator, the same seed and inputs give the same paths
+        include_paths (bool): also return every path under all_paths (large, only on explicit request)
+        cache (SimulationCache): result cache, None to always simulate; results with all_paths are never cached
+        model (str): 'gbm' (constant drift and volatility), 'bootstrap' (resampled historical daily
+            returns) or 'garch' (GARCH(1,1) volatility fitted to the history)
         
     Returns:
-        dict: dictionary containing simulation results
+        dict: dictionary containing simulation results, with per-day percentile bands,
+            representative sample paths and the terminal price histogram
     """
     try:
-        # Get historical data
-        stock = yf.Ticker(ticker)
-        hist_data = stock.history(period="1y")
+        if model not in SIMULATION_MODELS:
+            raise ValueError(f"Unknown simulation model: {model}, expected one of {', '.join(SIMULATION_MODELS)}")
+        current_price, mu, sigma, as_of, log_returns = _estimate_parameters(ticker, provider)
+        date_strings = _simulation_dates(days)
         
-        if hist_data.empty:
-            raise ValueError(f"Cannot get historical data for {ticker}")
+        def simulate():
+            return _run_simulation(ticker, current_price, mu, sigma, log_returns, as_of, date_strings, days,
+                                   simulations, dtype, seed, include_paths, model)
         
-        # Get current price
-        current_price = float(hist_data['Close'].iloc[-1])
-        
-        # Calculate daily returns and volatility
-        returns = np.log(1 + hist_data['Close'].pct_change())
-        mu = float(returns.mean())  # daily return
-        sigma = float(returns.std())  # daily volatility
-        
-        # Generate simulation dates
-        date_strings = []
-        current_date = datetime.now()
-        for i in range(days):
-            future_date = current_date + timedelta(days=i)
-            date_strings.append(future_date.strftime('%Y-%m-%d'))
-            
-        # Create array to store all paths
-        paths = np.zeros((simulations, days))
-        paths[:, 0] = current_price
-        
-        # Use geometric Brownian motion model for simulation
-        dt = 1  # time step is 1 day
-        for t in range(1, days):
-            brownian = np.random.standard_normal(simulations)
-            paths[:, t] = paths[:, t-1] * np.exp((mu - 0.5 * sigma**2) * dt + sigma * np.sqrt(dt) * brownian)
-        
-        # Convert Numpy array to Python list
-        paths_list = paths.tolist()
-        
-        # Calculate final prices and statistics
-        final_prices = paths[:, -1]
-        mean_price = float(np.mean(final_prices))
-        median_price = float(np.median(final_prices))
-        percentile_5 = float(np.percentile(final_prices, 5))
-        percentile_25 = float(np.percentile(final_prices, 25))
-        percentile_75 = float(np.percentile(final_prices, 75))
-        percentile_95 = float(np.percentile(final_prices, 95))
-        
-        # Calculate annual return and volatility
-        annual_return = float((mean_price / current_price) ** (365 / days) - 1) * 100
-        annual_volatility = float(sigma * np.sqrt(252) * 100)  # 252个交易日/年
-        
-        # Return results
-        result = {
-            "mean_price": mean_price,
-            "median_price": median_price,
-            "percentile_5": percentile_5,
-            "percentile_25": percentile_25,
-            "percentile_75": percentile_75,
-            "percentile_95": percentile_95,
-            "annual_return": annual_return,
-            "annual_volatility": annual_volatility,
-            "current_price": current_price,
-            "ticker": ticker,
-            "dates": date_strings,
-            "all_paths": paths_list
-        }
-        
-        return result
+        if cache is None or include_paths:
+            return simulate()
+        # The estimated parameters are part of the key, so a moved history window never reuses a stale result
+        key = (ticker, as_of, date_strings[0], days, simulations, np.dtype(dtype).name, seed, current_price, mu, sigma,
+               model)
+        # Shallow copy: callers may add keys without changing the cached result
+        return dict(cache.get(key, simulate))
     
     except Exception as e:
         print(f"Monte Carlo simulation failed: {str(e)}")
         print(traceback.format_exc())
         raise Exception(f"Error occurred during simulation: {str(e)}")
 
+def _run_simulation(ticker, current_price, mu, sigma, log_returns, as_of, date_strings, days, simulations, dtype,
+                    seed, include_paths, model):
+    """Simulate the paths and build the result dict of monte_carlo_simulation"""
+    # Simulate all paths at once with the chosen model
+    fill = _path_filler(model, current_price, mu, sigma, log_returns)
+    paths = fill(np.random.default_rng(seed), np.empty((simulations, days), dtype=dtype))
+    
+    # Calculate final prices and statistics
+    final_prices = paths[:, -1]
+    mean_price = float(np.mean(final_prices, dtype=np.float64))
+    median_price = float(np.median(final_prices))
+    percentile_5 = float(np.percentile(final_prices, 5))
+    percentile_25 = float(np.percentile(final_prices, 25))
+    percentile_75 = float(np.percentile(final_prices, 75))
+    percentile_95 = float(np.percentile(final_prices, 95))
+    
+    # Calculate annual return and volatility
+    annual_return = float((mean_price / current_price) ** (365 / days) - 1) * 100
+    annual_volatility = float(sigma * np.sqrt(252) * 100)  # 252个交易日/年
+    
+    # Return results
+    result = {
+        "mean_price": mean_price,
+        "median_price": median_price,
+        "percentile_5": percentile_5,
+        "percentile_25": percentile_25,
+        "percentile_75": percentile_75,
+        "percentile_95": percentile_95,
+        "annual_return": annual_return,
+        "annual_volatility": annual_volatility,
+        "current_price": current_price,
+        "ticker": ticker,
+        "model": model,
+        "as_of": as_of,
+        "dates": date_strings,
+        "simulations": simulations
+    }
+    result.update(summarize_paths(paths))
+    
+    if include_paths:
+        # Convert Numpy array to Python list
+        result["all_paths"] = paths.tolist()
+    
+    return result
+
+def portfolio_monte_carlo_simulation(holdings, days=60, simulations=200, provider=None, dtype=np.float64, seed=None,
+                                     model='gbm'):
+    """
+    Simulate the value of a whole portfolio with correlated paths of all its tickers
+    The histories are read in one batch and every ticker is simulated in one vectorized
+    array, so the correlation between holdings carries into the portfolio value
+
+    Parameters:
+        holdings (dict): {ticker: quantity held}
+        days (int): simulation days, default 60 days
+        simulations (int): simulation times, default 200 times
+        provider (PriceHistoryProvider): price history source, default reads market_data with yfinance fallback
+        dtype: floating point type of the simulated paths, np.float64 or np.float32
+        seed (int): seed of the random generator
+        model (str): 'gbm' (correlated normal shocks from the Cholesky factor of the returns
+            covariance) or 'bootstrap' (whole historical days resampled for all tickers)
+
+    Returns:
+        dict: portfolio value statistics, per-ticker weights and terminal prices, the returns
+            correlation matrix and the summary (bands, sample paths, histogram) of the value paths
+    """
+    if model not in PORTFOLIO_MODELS:
+        raise ValueError(f"Model {model} is not available for portfolios, expected one of {', '.join(PORTFOLIO_MODELS)}")
+    holdings = {ticker: quantity for ticker, quantity in holdings.items() if quantity > 0}
+    if not holdings:
+        raise ValueError("Portfolio has no holdings to simulate")
+    tickers = sorted(holdings)
+
+    start_date = (datetime.now() - timedelta(days=365)).strftime('%Y-%m-%d')
+    histories = get_price_histories(tickers, start=start_date, provider=provider)
+    missing = [ticker for ticker in tickers if histories.get(ticker) is None or histories[ticker].empty]
+    if missing:
+        raise ValueError(f"Cannot get historical data for {', '.join(missing)}")
+
+    # Align closes on the dates all tickers traded so the returns of each day are joint observations
+    closes = pd.concat({ticker: histories[ticker]['Close'] for ticker in tickers}, axis=1).dropna()
+    log_returns = np.log(closes).diff().dropna()
+    if len(log_returns) < 2:
+        raise ValueError("Not enough common trading days to estimate the correlation of the holdings")
+
+    current_prices = closes.iloc[-1].to_numpy(dtype=float)
+    quantities = np.array([holdings[ticker] for ticker in tickers], dtype=float)
+    paths = simulate_correlated_paths(current_prices, log_returns.to_numpy(), days, simulations, dtype=dtype,
+                                      seed=seed, bootstrap=(model == 'bootstrap'))
+    # Portfolio value of every path and day: (simulations, days, tickers) @ (tickers,)
+    values = paths @ quantities.astype(dtype)
+
+    current_value = float(current_prices @ quantities)
+    final_values = values[:, -1]
+    mean_value = float(np.mean(final_values, dtype=np.float64))
+    result = {
+        "tickers": tickers,
+        "quantities": [holdings[ticker] for ticker in tickers],
+        "weights": (current_prices * quantities / current_value).tolist(),
+        "current_prices": current_prices.tolist(),
+        "mean_final_prices": paths[:, -1, :].mean(axis=0, dtype=np.float64).tolist(),
+        "correlation": np.round(np.atleast_2d(np.corrcoef(log_returns.to_numpy(), rowvar=False)), 4).tolist(),
+        "current_value": current_value,
+        "mean_value": mean_value,
+        "median_value": float(np.median(final_values)),
+        "percentile_5": float(np.percentile(final_values, 5)),
+        "percentile_25": float(np.percentile(final_values, 25)),
+        "percentile_75": float(np.percentile(final_values, 75)),
+        "percentile_95": float(np.percentile(final_values, 95)),
+        "annual_return": float((mean_value / current_value) ** (365 / days) - 1) * 100,
+        "model": model,
+        "as_of": pd.Timestamp(closes.index[-1]).strftime('%Y-%m-%d'),
+        "dates": _simulation_dates(days),
+        "simulations": simulations
+    }
+    result.update(summarize_paths(values))
+    return result
+
+def stream_simulation_binary(ticker, days=60, simulations=200, provider=None, dtype=np.float32, seed=None,
+                             batch_size=MONTE_CARLO_STREAM_BATCH, model='gbm'):
+    """
+    Simulate all paths as a binary stream, written batch by batch straight from the NumPy buffers
+    
+    Layout: 4-byte little-endian unsigned length of a UTF-8 JSON header, the header, then
+    simulations x days little-endian floats (row-major, one path per row) of the type named
+    by the header's "dtype" ('<f4' or '<f8')
+    
+    The history is read and the parameters estimated before returning, so errors are raised
+    here and the returned chunks only need NumPy (no application context)
+    
+    Parameters:
+        same as monte_carlo_simulation, plus batch_size (int): paths simulated per chunk
+        
+    Returns:
+        tuple: (header dict, total body length in bytes, iterator of bytes chunks)
+    """
+    current_price, mu, sigma, as_of, log_returns = _estimate_parameters(ticker, provider)
+    fill = _path_filler(model, current_price, mu, sigma, log_returns)
+    item_type = np.dtype(dtype).newbyteorder('<')
+    header = {
+        "ticker": ticker,
+        "current_price": current_price,
+        "as_of": as_of,
+        "mu": mu,
+        "sigma": sigma,
+        "model": model,
+        "dates": _simulation_dates(days),
+        "simulations": simulations,
+        "days": days,
+        "dtype": item_type.str,
+        "seed": seed
+    }
+    header_bytes = json.dumps(header).encode('utf-8')
+    length = 4 + len(header_bytes) + simulations * days * item_type.itemsize
+    
+    def chunks():
+        yield struct.pack('<I', len(header_bytes)) + header_bytes
+        for batch in _iter_batches(fill, days, simulations, batch_size, np.dtype(dtype).type, seed):
+            # No copy on little-endian machines; tobytes() writes the raw buffer
+            yield batch.astype(item_type, copy=False).tobytes()
+    
+    return header, length, chunks()
+
 # Compatibility wrapper for old API
 def get_simulation_data(ticker, days=60, simulations=200):
     """Compatibility wrapper for old API"""
-    return monte_carlo_simulation(ticker, days, simulations)
+    return monte_carlo_simulation(ticker, days, simulations, include_paths=True)
 
 # Test function
 def test_monte_carlo():
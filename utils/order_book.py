@@ -0,0 +1,239 @@
+"""
+限价单内存订单簿
+按股票代码维护所有待处理(PENDING)的限价单
+
+包含：
+1. 单只股票的订单簿（买单按价格从高到低、卖单按价格从低到高，同价按时间优先，
+   订单ID自增，因此直接用订单ID表示时间先后）
+2. 进程内的订单簿注册表，启动时从数据库加载一次，之后随订单创建/撤销增量维护
+3. 价格更新时只返回限价被穿越的订单，扫描成本为 O(被穿越订单数) 而不是 O(全部待处理订单)
+"""
+import bisect
+import threading
+import logging
+from decimal import Decimal
+from models import db, Order
+from models.enums import OrderType, OrderExecutionType, OrderStatus
+
+# 设置日志
+logger = logging.getLogger(__name__)
+
+# 用于 bisect 查找的上界（大于任何订单ID）
+_INF = float('inf')
+
+
+def _to_decimal(value):
+    """将价格统一转换为Decimal，避免float和Decimal混合比较"""
+    return value if isinstance(value, Decimal) else Decimal(str(value))
+
+
+class TickerOrderBook:
+    """
+    单只股票的限价单簿
+
+    买单键: (-限价, 订单ID)，价格越高越靠前
+    卖单键: (限价, 订单ID)，价格越低越靠前
+    两个列表始终保持有序，因此被穿越的订单总是列表的前缀
+    """
+    def __init__(self, ticker):
+        self.ticker = ticker
+        self._buy_keys = []
+        self._sell_keys = []
+        self._entries = {}  # order_id -> (side, key)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, order_id):
+        return order_id in self._entries
+
+    def add(self, order_id, order_type, order_price):
+        """
+        添加一个限价单
+
+        参数:
+            order_id (int): 订单ID，同价时ID越小越优先
+            order_type (OrderType): 买入或卖出
+            order_price (Decimal/float): 限价
+        """
+        if order_id in self._entries:
+            return
+        price = _to_decimal(order_price)
+
+        if order_type == OrderType.BUY:
+            key = (-price, order_id)
+            bisect.insort(self._buy_keys, key)
+        else:
+            key = (price, order_id)
+            bisect.insort(self._sell_keys, key)
+        self._entries[order_id] = (order_type, key)
+
+    def remove(self, order_id):
+        """
+        移除一个订单
+
+        返回:
+            bool: 订单是否存在于订单簿中
+        """
+        entry = self._entries.pop(order_id, None)
+        if entry is None:
+            return False
+        order_type, key = entry
+        keys = self._buy_keys if order_type == OrderType.BUY else self._sell_keys
+        index = bisect.bisect_left(keys, key)
+        if index < len(keys) and keys[index] == key:
+            del keys[index]
+        return True
+
+    def crossed(self, market_price):
+        """
+        返回在给定市场价格下可以执行的订单ID（按价格-时间优先级排序）
+
+        买入限价单: 市场价格 <= 限价
+        卖出限价单: 市场价格 >= 限价
+        """
+        price = _to_decimal(market_price)
+        buy_end = bisect.bisect_right(self._buy_keys, (-price, _INF))
+        sell_end = bisect.bisect_right(self._sell_keys, (price, _INF))
+        return [key[1] for key in self._buy_keys[:buy_end]] + [key[1] for key in self._sell_keys[:sell_end]]
+
+
+class OrderBook:
+    """
+    进程内订单簿注册表，按股票代码管理 TickerOrderBook
+
+    只有调用过 load() 的进程（即运行订单处理器的进程）才会跟踪订单，
+    其它进程中 add_order/remove_order 为空操作，避免订单簿无限增长
+    """
+    def __init__(self):
+        self._books = {}
+        self._order_tickers = {}  # order_id -> ticker
+        self._lock = threading.RLock()
+        self._high_water_mark = 0  # 已加载的最大订单ID，用于增量同步
+        self.loaded = False
+
+    def __len__(self):
+        return len(self._order_tickers)
+
+    def _add(self, order_id, ticker, order_type, order_price):
+        """内部添加方法（调用方需持有锁）"""
+        if order_id in self._order_tickers or order_price is None:
+            return
+        book = self._books.get(ticker)
+        if book is None:
+            book = self._books[ticker] = TickerOrderBook(ticker)
+        book.add(order_id, order_type, order_price)
+        self._order_tickers[order_id] = ticker
+        self._high_water_mark = max(self._high_water_mark, order_id)
+
+    def add_order(self, order):
+        """
+        登记一个订单（仅处理 PENDING 状态的限价单）
+
+        参数:
+            order (Order): 订单对象
+
+        返回:
+            bool: 是否加入了订单簿
+        """
+        if not self.loaded:
+            return False
+        if order.order_execution_type != OrderExecutionType.LIMIT or order.order_status != OrderStatus.PENDING:
+            return False
+        with self._lock:
+            self._add(order.order_id, order.ticker, order.order_type, order.order_price)
+        return True
+
+    def remove_order(self, order_id):
+        """
+        从订单簿中移除订单（订单执行、撤销或被拒绝后调用）
+
+        返回:
+            bool: 订单是否存在于订单簿中
+        """
+        with self._lock:
+            ticker = self._order_tickers.pop(order_id, None)
+            if ticker is None:
+                return False
+            book = self._books.get(ticker)
+            if book is not None:
+                book.remove(order_id)
+                if not book:
+                    del self._books[ticker]
+            return True
+
+    def tickers(self):
+        """返回当前有待处理限价单的股票代码列表"""
+        with self._lock:
+            return list(self._books.keys())
+
+    def crossed_orders(self, ticker, market_price):
+        """
+        返回指定股票在当前市场价格下限价被穿越的订单ID列表
+
+        参数:
+            ticker (str): 股票代码
+            market_price (float/Decimal): 当前市场价格
+
+        返回:
+            list: 订单ID列表，按价格-时间优先级排序
+        """
+        with self._lock:
+            book = self._books.get(ticker)
+            return book.crossed(market_price) if book is not None else []
+
+    def _pending_limit_query(self):
+        """只查询订单簿需要的列（均包含在 ix_orders_pending_scan 索引中），不加载完整的Order对象"""
+        return db.session.query(
+            Order.order_id, Order.ticker, Order.order_type, Order.order_price
+        ).filter(
+            Order.order_status == OrderStatus.PENDING,
+            Order.order_execution_type == OrderExecutionType.LIMIT
+        )
+
+    def load(self):
+        """
+        从数据库全量重建订单簿（需要在应用上下文中调用）
+
+        返回:
+            int: 加载的订单数
+        """
+        rows = self._pending_limit_query().all()
+        with self._lock:
+            self._books = {}
+            self._order_tickers = {}
+            self._high_water_mark = 0
+            for row in rows:
+                self._add(row.order_id, row.ticker, row.order_type, row.order_price)
+            self.loaded = True
+        logger.info(f"订单簿已加载 {len(rows)} 个待处理限价单，涉及 {len(self._books)} 只股票")
+        return len(rows)
+
+    def sync(self):
+        """
+        增量同步在其它进程中创建的限价单（订单ID大于已加载的最大ID）
+
+        返回:
+            int: 新加入的订单数
+        """
+        if not self.loaded:
+            return self.load()
+        rows = self._pending_limit_query().filter(Order.order_id > self._high_water_mark).all()
+        with self._lock:
+            for row in rows:
+                self._add(row.order_id, row.ticker, row.order_type, row.order_price)
+        if rows:
+            logger.info(f"订单簿增量同步 {len(rows)} 个限价单")
+        return len(rows)
+
+    def clear(self):
+        """清空订单簿并停止跟踪"""
+        with self._lock:
+            self._books = {}
+            self._order_tickers = {}
+            self._high_water_mark = 0
+            self.loaded = False
+
+
+# 进程内共享的订单簿实例
+order_book = OrderBook()
@@ -0,0 +1,85 @@
+"""
+订单处理器唤醒事件
+在订单创建、订单撤销/拒绝或写入新的市场数据并提交事务后唤醒订单处理器，
+使处理器不必按固定间隔轮询数据库
+
+ORM 写入通过监听 SQLAlchemy 会话事件实现，业务代码无需手动调用；
+Core 语句（如批量 upsert 行情）不经过会话事件，写入方需在提交后调用 notify_order_processor；
+只能唤醒同一进程内的处理器，跨进程的变更依靠处理器的兜底轮询
+"""
+import threading
+import logging
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from models import Order, MarketData
+from models.enums import OrderStatus
+
+# 设置日志
+logger = logging.getLogger(__name__)
+
+# 进程内的唤醒事件
+_wakeup = threading.Event()
+
+# 会话 info 中用于标记需要唤醒处理器的键
+_WAKEUP_KEY = 'order_processor_wakeup'
+
+
+def notify_order_processor():
+    """唤醒订单处理器"""
+    _wakeup.set()
+
+
+def clear_order_event():
+    """
+    清除唤醒事件，处理器在开始一轮处理之前调用
+    本轮处理开始后到达的唤醒不会被清除，下一次等待会立即返回
+    """
+    _wakeup.clear()
+
+
+def wait_for_order_event(timeout=None):
+    """
+    等待唤醒事件（不清除事件，由 clear_order_event 在处理前清除）
+
+    参数:
+        timeout (float, optional): 最长等待秒数，None 表示一直等待
+
+    返回:
+        bool: True 表示由事件唤醒，False 表示等待超时
+    """
+    return _wakeup.wait(timeout)
+
+
+def _needs_wakeup(session):
+    """判断本次 flush 的变更是否需要唤醒订单处理器"""
+    for obj in session.new:
+        if isinstance(obj, MarketData):
+            return True
+        if isinstance(obj, Order) and str(obj.order_status) == OrderStatus.PENDING.value:
+            return True
+    for obj in session.dirty:
+        if isinstance(obj, MarketData):
+            return True
+        if isinstance(obj, Order) and str(obj.order_status) in (OrderStatus.CANCELLED.value, OrderStatus.REJECTED.value):
+            return True
+    return False
+
+
+@event.listens_for(Session, 'after_flush')
+def _mark_order_wakeup(session, flush_context):
+    """flush 后记录是否有需要处理器关注的变更（此时 new/dirty 仍反映 flush 前的状态）"""
+    if not session.info.get(_WAKEUP_KEY) and _needs_wakeup(session):
+        session.info[_WAKEUP_KEY] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _notify_after_commit(session):
+    """事务提交后才唤醒处理器，保证处理器能读到已提交的数据"""
+    if session.info.pop(_WAKEUP_KEY, False):
+        notify_order_processor()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _clear_after_rollback(session):
+    """事务回滚时丢弃唤醒标记"""
+    session.info.pop(_WAKEUP_KEY, None)
@@ -12,9 +12,12 @@ from flask import current_app
 import logging
 from models import db, Order, AccountBalance, Portfolio, Transaction, MarketData
 import contextlib # 导入 contextlib
+from sqlalchemy import insert
 # 导入必要的枚举类型
 from models.enums import OrderStatus, TransactionStatus, OrderType, OrderExecutionType
 from decimal import Decimal
+from utils.order_book import order_book
+from utils.latest_quote import get_latest_quote, get_latest_quotes
 
 # 设置日志
 logger = logging.getLogger(__name__)
@@ -33,6 +36,14 @@ def order_transaction_scope():
         raise # 重新抛出异常，以便上层可以捕获
     # 不需要 finally 关闭 session，Flask-SQLAlchemy 会处理
 
+def _track_pending_order(order):
+    """将已提交且仍处于 PENDING 状态的限价单登记到内存订单簿"""
+    try:
+        order_book.add_order(order)
+    except Exception as e:
+        # 订单簿会在下一次同步时从数据库补齐，这里只记录警告
+        logger.warning(f"登记订单 #{order.order_id} 到订单簿失败: {str(e)}")
+
 def validate_order_params(user_id, ticker, order_type, order_execution_type, order_quantity, order_price=None):
     """
     验证订单参数
@@ -107,18 +118,38 @@ def get_market_price(ticker):
         tuple: (成功标志, 价格或错误信息)
     """
     try:
-        # 从数据库获取最新价格数据
-        latest_data = MarketData.query.filter_by(ticker=ticker).order_by(MarketData.date.desc()).first()
+        # 从最新行情表获取价格（按主键查询）
+        latest_quote = get_latest_quote(ticker)
         
-        if not latest_data:
+        if not latest_quote or latest_quote.close is None:
             return False, f"无法获取{ticker}的市场数据"
         
         # 使用收盘价作为市场价格
-        return True, float(latest_data.close)
+        return True, float(latest_quote.close)
     except Exception as e:
         logger.error(f"获取市场价格出错: {str(e)}")
         return False, f"获取市场价格时发生错误: {str(e)}"
 
+def get_market_prices(tickers):
+    """
+    批量获取多只股票的当前市场价格（一次查询）
+    
+    从最新行情表按主键批量读取，
+    一个处理周期内所有订单共享同一份价格快照
+    
+    参数:
+        tickers (iterable): 股票代码集合
+        
+    返回:
+        dict: {股票代码: 收盘价}，无法获取价格的股票不包含在结果中
+    """
+    try:
+        quotes = get_latest_quotes(tickers)
+        return {ticker: float(quote.close) for ticker, quote in quotes.items() if quote.close is not None}
+    except Exception as e:
+        logger.error(f"批量获取市场价格出错: {str(e)}")
+        return {}
+
 def check_account_balance(user_id, cost):
     """
     检查用户账户余额是否足够
@@ -203,6 +234,7 @@ def create_order(user_id, ticker, order_type, order_execution_type, order_quanti
         db.session.commit()
         
         logger.info(f"创建订单成功: #{order.order_id}")
+        _track_pending_order(order)
         
         return True, order, 201
     
@@ -240,8 +272,17 @@ def can_execute_immediately(order, market_price):
     
     return False
 
-def _execute_order_logic(session, order, account, portfolio, market_price, total_amount):
-    """订单执行的核心数据库操作逻辑（不包含commit）"""
+def _execute_order_logic(session, order, account, portfolio, market_price, total_amount, transaction_rows=None):
+    """
+    订单执行的核心数据库操作逻辑（不包含commit）
+    
+    参数:
+        transaction_rows (list, optional): 批量执行时传入，交易记录以字典形式追加到该列表，
+            由调用方统一批量插入，并且不在此处 flush
+    
+    返回:
+        Portfolio: 执行后的投资组合对象（持仓清零被删除时为 None）
+    """
     # 将所有价格和数量转换为Decimal类型以避免float和Decimal混合运算
     
     # 转换为Decimal类型以确保精确计算
@@ -308,6 +349,24 @@ def _execute_order_logic(session, order, account, portfolio, market_price, total
         if portfolio.quantity == 0:
             session.delete(portfolio)
             
+    # 批量执行：只记录交易数据，由调用方统一插入
+    if transaction_rows is not None:
+        transaction_rows.append({
+            'user_id': order.user_id,
+            'order_id': order.order_id,
+            'ticker': order.ticker,
+            'transaction_type': order.order_type,
+            'transaction_price': float(market_price_decimal),
+            'transaction_quantity': int(order_quantity_decimal),
+            'transaction_amount': float(total_amount_decimal),
+            'transaction_status': TransactionStatus.COMPLETED,
+            'transaction_time': datetime.now()
+        })
+        order.order_status = OrderStatus.EXECUTED
+        order.executed_at = datetime.now()
+        order.updated_at = datetime.now()
+        return portfolio if portfolio is None or portfolio.quantity > 0 else None
+    
     # 创建交易记录，并立即关联 Order 对象
     transaction = Transaction(
         user_id=order.user_id,
@@ -336,6 +395,7 @@ def _execute_order_logic(session, order, account, portfolio, market_price, total
     session.flush()
     
     logger.info(f"订单 #{order.order_id} ({order.order_type}) 核心逻辑执行完毕，等待提交")
+    return portfolio if portfolio is None or portfolio.quantity > 0 else None
 
 def execute_order(order, market_price=None):
     """执行数据库中已存在的 pending 订单 (由后台任务调用)"""
@@ -402,6 +462,88 @@ def execute_order(order, market_price=None):
         # Return failure after handling the exception
         return False, f"执行订单失败: {str(e)}"
 
+class _BatchOrderRejected(Exception):
+    """批量执行中某个订单无法执行，整个批次回退为逐单执行"""
+
+
+def execute_orders_batch(order_prices):
+    """
+    在一个事务中批量执行多个（可能属于不同用户的）待处理订单 (由后台任务调用)
+    
+    所有需要的 AccountBalance 和 Portfolio 行通过按主键排序的 SELECT ... FOR UPDATE
+    一次性加锁，避免死锁；交易记录统一批量插入，整个批次只提交一次。
+    任何一个订单无法执行或发生错误时，回滚整个批次并回退为逐单执行（execute_order）
+    
+    参数:
+        order_prices (list): [(订单对象, 执行价格), ...]，同一用户的订单按列表顺序执行
+        
+    返回:
+        list: 与输入顺序对应的 (成功标志, 信息) 列表
+    """
+    if not order_prices:
+        return []
+    if len(order_prices) == 1:
+        order, market_price = order_prices[0]
+        return [execute_order(order, market_price)]
+    
+    try:
+        with order_transaction_scope() as session:
+            user_ids = sorted({order.user_id for order, _ in order_prices})
+            tickers = sorted({order.ticker for order, _ in order_prices})
+            
+            # 按固定顺序一次性锁定所有相关行
+            accounts = {
+                account.user_id: account
+                for account in AccountBalance.query.with_for_update().filter(
+                    AccountBalance.user_id.in_(user_ids)
+                ).order_by(AccountBalance.user_id).all()
+            }
+            portfolios = {
+                (portfolio.user_id, portfolio.ticker): portfolio
+                for portfolio in Portfolio.query.with_for_update().filter(
+                    Portfolio.user_id.in_(user_ids),
+                    Portfolio.ticker.in_(tickers)
+                ).order_by(Portfolio.id).all()
+            }
+            
+            transaction_rows = []
+            for order, market_price in order_prices:
+                account = accounts.get(order.user_id)
+                if not account:
+                    raise _BatchOrderRejected(f"订单 #{order.order_id}: 用户没有账户信息")
+                
+                key = (order.user_id, order.ticker)
+                portfolio = portfolios.get(key)
+                if order.order_type == OrderType.SELL and (not portfolio or portfolio.quantity < order.order_quantity):
+                    raise _BatchOrderRejected(f"订单 #{order.order_id}: 持有股票数量不足")
+                
+                total_amount = market_price * order.order_quantity
+                portfolios[key] = _execute_order_logic(
+                    session, order, account, portfolio, market_price, total_amount, transaction_rows
+                )
+            
+            # 批量插入交易记录
+            session.flush()
+            session.execute(insert(Transaction), transaction_rows)
+            
+            logger.info(f"批量执行 {len(order_prices)} 个订单成功，单次提交")
+            return [(True, "订单执行成功")] * len(order_prices)
+    
+    except Exception as e:
+        if isinstance(e, _BatchOrderRejected):
+            logger.warning(f"批量执行中止: {str(e)}，回退为逐单执行")
+        else:
+            logger.error(f"批量执行订单时发生错误: {str(e)}，回退为逐单执行")
+    
+    # 回退：逐单执行并分别提交（订单已过期，execute_order 会重新加载最新状态）
+    results = []
+    for order, market_price in order_prices:
+        if order.order_status != OrderStatus.PENDING:
+            results.append((False, f"订单状态为 {order.order_status}，跳过执行"))
+            continue
+        results.append(execute_order(order, market_price))
+    return results
+
 def process_new_order(user_id, ticker, order_type, order_execution_type, order_quantity, order_price=None):
     """处理新订单请求 (由 API 调用)"""
     failure_reason = None # 用于记录失败原因
@@ -558,6 +700,9 @@ def process_new_order(user_id, ticker, order_type, order_execution_type, order_q
                         'error': None
                     }
         
+        # 事务已提交，登记仍在等待执行的限价单
+        _track_pending_order(order)
+        
     except Exception as e:
         logger.error(f"处理新订单请求时发生未预料的错误: {str(e)}", exc_info=True)
         # 尝试记录失败的订单（如果可能）
@@ -859,6 +1004,9 @@ def simplified_process_order(user_id, ticker, order_type, order_execution_type,
                 
             # 提交事务 (由上下文管理器处理)
             
+        # 事务已提交，登记仍在等待执行的限价单
+        _track_pending_order(order)
+            
         # 返回处理结果
         return order_data
     
@@ -871,71 +1019,107 @@ def simplified_process_order(user_id, ticker, order_type, order_execution_type,
             'error': f"处理订单时发生错误: {str(e)}"
         }
 
-def scan_pending_limit_orders():
+def _is_order_pending(order_id):
+    """
+    从数据库重新读取订单状态，判断订单是否仍为 PENDING
+    读取失败时按仍为 PENDING 处理，订单留在订单簿中
+    """
+    try:
+        db.session.rollback()
+        status = db.session.query(Order.order_status).filter(Order.order_id == order_id).scalar()
+        return status == OrderStatus.PENDING
+    except Exception as e:
+        logger.error(f"读取订单 #{order_id} 状态时发生错误: {str(e)}")
+        return True
+
+def scan_pending_limit_orders(price_snapshot=None, executor=None):
     """
-    扫描所有待处理(PENDING)状态的限价单，检查当前市场价格是否满足执行条件
+    扫描待处理(PENDING)状态的限价单，检查当前市场价格是否满足执行条件
     如果满足条件则执行订单
-    
+
+    使用内存订单簿：所有股票的价格通过一次查询获取，并且只加载限价被穿越的订单，
+    扫描成本与被穿越的订单数成正比，而不是与全部待处理订单数成正比
+
     此函数设计为由定时任务调用
+    
+    参数:
+        price_snapshot (dict, optional): 本周期的价格快照 {股票代码: 价格}
+            由调用方提供时，调用方负责事先同步订单簿；否则在此同步并批量查询价格
+        executor (callable, optional): 订单执行函数 executor(order, market_price)，
+            例如把订单提交给按用户分片的执行线程池；默认在当前线程同步执行
     """
     logger.info("开始扫描待处理的限价单...")
     
     try:
-        # 查询所有PENDING状态的限价单
-        pending_limit_orders = Order.query.filter_by(
-            order_status=OrderStatus.PENDING,
-            order_execution_type=OrderExecutionType.LIMIT
-        ).all()
+        if price_snapshot is None:
+            # 首次调用时全量加载订单簿，之后只增量同步新订单
+            order_book.sync()
         
-        if not pending_limit_orders:
+        tickers = order_book.tickers()
+        if not tickers:
             logger.info("没有待处理的限价单")
             return
             
-        logger.info(f"找到 {len(pending_limit_orders)} 个待处理的限价单")
+        logger.info(f"订单簿中共有 {len(order_book)} 个待处理的限价单，涉及 {len(tickers)} 只股票")
+        
+        if price_snapshot is None:
+            price_snapshot = get_market_prices(tickers)
         
-        # 遍历每个待处理的限价单
-        for order in pending_limit_orders:
+        for ticker in tickers:
             try:
-                # 获取当前市场价格
-                price_success, market_price = get_market_price(order.ticker)
+                # 从价格快照中获取当前市场价格
+                market_price = price_snapshot.get(ticker)
                 
-                if not price_success:
-                    logger.warning(f"无法获取 {order.ticker} 的市场价格，跳过订单 #{order.order_id}")
+                if market_price is None:
+                    logger.warning(f"无法获取 {ticker} 的市场价格，跳过该股票的限价单")
                     continue
                 
-                # 转换为Decimal类型进行精确比较
-                market_price_decimal = Decimal(str(market_price)) if not isinstance(market_price, Decimal) else market_price
-                order_price_decimal = Decimal(str(order.order_price)) if not isinstance(order.order_price, Decimal) else order.order_price
-                
-                # 检查是否满足执行条件
-                can_execute = False
-                
-                # 买入限价单: 当市场价格 <= 限价时可执行
-                if order.order_type == OrderType.BUY and market_price_decimal <= order_price_decimal:
-                    can_execute = True
-                    logger.info(f"买入限价单 #{order.order_id} 可以执行: 市场价格({market_price}) <= 限价({order.order_price})")
+                # 只取出限价被穿越的订单
+                crossed_ids = order_book.crossed_orders(ticker, market_price)
+                if not crossed_ids:
+                    continue
                 
-                # 卖出限价单: 当市场价格 >= 限价时可执行
-                elif order.order_type == OrderType.SELL and market_price_decimal >= order_price_decimal:
-                    can_execute = True
-                    logger.info(f"卖出限价单 #{order.order_id} 可以执行: 市场价格({market_price}) >= 限价({order.order_price})")
+                logger.info(f"{ticker} 当前价格 {market_price}，{len(crossed_ids)} 个限价单满足执行条件")
+                orders = {order.order_id: order for order in Order.query.filter(Order.order_id.in_(crossed_ids)).all()}
                 
-                # 如果满足执行条件，执行订单
-                if can_execute:
-                    # 使用现有的execute_order函数执行订单
-                    logger.info(f"执行限价单 #{order.order_id}, 股票: {order.ticker}, 类型: {order.order_type.value}, 价格: {market_price}")
-                    success, message = execute_order(order, market_price)
+                # 按价格-时间优先级依次执行
+                for order_id in crossed_ids:
+                    order = orders.get(order_id)
+                    # 订单离开 PENDING 状态后才从订单簿移除
+                    handled = False
+                    try:
+                        # 订单已被删除或已在其它地方处理（撤销/拒绝等）
+                        if order is None or order.order_status != OrderStatus.PENDING:
+                            handled = True
+                            continue
+                        
+                        logger.info(f"执行限价单 #{order.order_id}, 股票: {order.ticker}, 类型: {order.order_type.value}, 价格: {market_price}")
+                        if executor is not None:
+                            # 交给外部执行器异步执行；执行器可能失败而订单仍为 PENDING，
+                            # 因此订单留在订单簿中，下一轮确认状态后再移除（执行器会忽略重复提交）
+                            executor(order, market_price)
+                            continue
+                        success, message = execute_order(order, market_price)
+                        
+                        if success:
+                            handled = True
+                            logger.info(f"限价单 #{order_id} 执行成功")
+                        else:
+                            logger.error(f"限价单 #{order_id} 执行失败: {message}")
                     
-                    if success:
-                        logger.info(f"限价单 #{order.order_id} 执行成功")
-                    else:
-                        logger.error(f"限价单 #{order.order_id} 执行失败: {message}")
+                    except Exception as e:
+                        logger.error(f"处理限价单 #{order_id} 时发生错误: {str(e)}", exc_info=True)
+                        # 继续处理下一个订单
+                    finally:
+                        # 执行失败或抛出异常时订单可能仍是 PENDING（例如标记 FAILED 也失败了），
+                        # 这类订单留在订单簿中，下一轮扫描重试
+                        if handled or not _is_order_pending(order_id):
+                            order_book.remove_order(order_id)
             
             except Exception as e:
-                logger.error(f"处理限价单 #{order.order_id} 时发生错误: {str(e)}", exc_info=True)
-                # 继续处理下一个订单
+                logger.error(f"处理 {ticker} 的限价单时发生错误: {str(e)}", exc_info=True)
         
         logger.info("限价单扫描完成")
         
     except Exception as e:
-        logger.error(f"扫描限价单时发生错误: {str(e)}", exc_info=True)
\ No newline at end of file
+        logger.error(f"扫描限价单时发生错误: {str(e)}", exc_info=True)
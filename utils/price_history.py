@@ -0,0 +1,268 @@
+"""
+Price history provider module
+Pluggable source of daily OHLCV history for Monte Carlo simulation and risk analysis
+
+Providers:
+1. YFinanceHistoryProvider: downloads from yfinance through the process-wide history cache
+2. DatabaseHistoryProvider: reads the market_data table, falling back to another provider
+   only for tickers that are not stored or for date gaps at either end of the window
+3. ColumnarHistoryProvider: reads the memory-mapped columnar mirror of market_data, with the
+   same fallback behaviour as DatabaseHistoryProvider
+"""
+from datetime import datetime, timedelta
+import pandas as pd
+from flask import has_app_context
+from sqlalchemy import select
+from models import db, MarketData
+from utils.history_cache import download_history, download_histories
+from utils.columnar_store import columnar_store
+from config import COLUMNAR_STORE_ENABLED
+
+# Columns of the frames returned by all providers (same names as yfinance)
+HISTORY_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+# Gaps at the start or end of the window up to this many days are weekends/holidays, not missing data
+GAP_TOLERANCE_DAYS = 5
+
+
+def _to_datetime(value):
+    """Convert a 'YYYY-MM-DD' string, date or None to a naive Timestamp"""
+    return None if value is None else pd.Timestamp(value).tz_localize(None)
+
+
+def _normalize(frame):
+    """Keep the standard OHLCV columns with a naive DatetimeIndex"""
+    if frame is None or frame.empty:
+        return pd.DataFrame(columns=HISTORY_COLUMNS)
+    frame = frame[[column for column in HISTORY_COLUMNS if column in frame.columns]]
+    if isinstance(frame.index, pd.DatetimeIndex) and frame.index.tz is not None:
+        frame = frame.copy()
+        frame.index = frame.index.tz_localize(None)
+    return frame
+
+
+class PriceHistoryProvider:
+    """
+    Base class of price history providers
+    """
+    def get_history(self, ticker, start=None, end=None):
+        """
+        Get daily OHLCV history
+
+        Parameters:
+        ticker (str): stock code
+        start (str): start date, format 'YYYY-MM-DD', inclusive
+        end (str): end date, format 'YYYY-MM-DD', exclusive, None means up to today
+
+        Returns:
+        DataFrame: Open/High/Low/Close/Volume columns indexed by date, empty if no data
+        """
+        raise NotImplementedError
+
+    def get_histories(self, tickers, start=None, end=None):
+        """
+        Get daily OHLCV history for several tickers (providers override this to batch requests)
+
+        Parameters:
+        tickers (list): stock codes
+        start (str): start date, format 'YYYY-MM-DD', inclusive
+        end (str): end date, format 'YYYY-MM-DD', exclusive, None means up to today
+
+        Returns:
+        dict: {ticker: DataFrame}
+        """
+        return {ticker: self.get_history(ticker, start=start, end=end) for ticker in dict.fromkeys(tickers)}
+
+
+class YFinanceHistoryProvider(PriceHistoryProvider):
+    """
+    Download history from yfinance (cached process-wide)
+    """
+    def get_history(self, ticker, start=None, end=None):
+        return _normalize(download_history(ticker, start=start, end=end))
+
+    def get_histories(self, tickers, start=None, end=None):
+        # All uncached tickers are fetched in one multi-symbol download
+        frames = download_histories(list(dict.fromkeys(tickers)), start=start, end=end)
+        return {ticker: _normalize(frame) for ticker, frame in frames.items()}
+
+
+class DatabaseHistoryProvider(PriceHistoryProvider):
+    """
+    Read history from the market_data table
+
+    Must be called inside a Flask application context to use the database;
+    without one, or for tickers/windows the table does not cover, the fallback provider is used
+    """
+    def __init__(self, fallback=None):
+        """
+        Parameters:
+        fallback (PriceHistoryProvider): provider for missing tickers and date gaps,
+            default is yfinance, pass False to disable the fallback
+        """
+        self.fallback = YFinanceHistoryProvider() if fallback is None else fallback
+
+    def get_history(self, ticker, start=None, end=None):
+        if not has_app_context():
+            return self._fallback(ticker, start, end)
+
+        frame = self._query(ticker, start, end)
+        if frame.empty:
+            return self._fallback(ticker, start, end)
+        return self._fill_gaps(ticker, frame, start, end)
+
+    def get_histories(self, tickers, start=None, end=None):
+        tickers = list(dict.fromkeys(tickers))
+        if not has_app_context():
+            return self._fallback_many(tickers, start, end)
+
+        stored = self._query_many(tickers, start, end)
+        # Tickers the table does not have at all are fetched from the fallback in one batch
+        missing = [ticker for ticker in tickers if ticker not in stored]
+        fetched = self._fallback_many(missing, start, end) if missing else {}
+        return {
+            ticker: self._fill_gaps(ticker, stored[ticker], start, end) if ticker in stored else fetched[ticker]
+            for ticker in tickers
+        }
+
+    def _fill_gaps(self, ticker, frame, start, end):
+        """Fill only the uncovered ends of the window from the fallback provider"""
+        tolerance = pd.Timedelta(days=GAP_TOLERANCE_DAYS)
+        start_ts = _to_datetime(start)
+        end_ts = _to_datetime(end) if end is not None else pd.Timestamp(datetime.now().date()) + pd.Timedelta(days=1)
+        first_date, last_date = frame.index[0], frame.index[-1]
+        parts = []
+        if start_ts is not None and first_date - start_ts > tolerance:
+            parts.append(self._fallback(ticker, start, first_date.strftime('%Y-%m-%d')))
+        parts.append(frame)
+        if end_ts - last_date > tolerance:
+            gap_start = (last_date + timedelta(days=1)).strftime('%Y-%m-%d')
+            parts.append(self._fallback(ticker, gap_start, end))
+
+        parts = [part for part in parts if not part.empty]
+        if len(parts) == 1:
+            return frame
+        # The gap windows end before / start after the stored rows, so parts do not overlap
+        return pd.concat(parts).sort_index()
+
+    def _query(self, ticker, start, end):
+        """Load the window of one ticker from market_data straight into a DataFrame"""
+        return self._query_many([ticker], start, end).get(ticker, pd.DataFrame(columns=HISTORY_COLUMNS))
+
+    def _query_many(self, tickers, start, end):
+        """
+        Load the window of several tickers from market_data with one query
+
+        Returns:
+        dict: {ticker: DataFrame}, tickers without stored rows are omitted
+        """
+        stmt = select(
+            MarketData.ticker, MarketData.date, MarketData.open, MarketData.high, MarketData.low,
+            MarketData.close, MarketData.volume
+        ).where(MarketData.ticker.in_(tickers))
+        if start is not None:
+            stmt = stmt.where(MarketData.date >= _to_datetime(start).to_pydatetime())
+        if end is not None:
+            stmt = stmt.where(MarketData.date < _to_datetime(end).to_pydatetime())
+        rows = db.session.execute(stmt.order_by(MarketData.ticker, MarketData.date)).all()
+        if not rows:
+            return {}
+
+        frame = pd.DataFrame.from_records(rows, columns=['Ticker', 'Date'] + HISTORY_COLUMNS, index='Date')
+        # Daily bars: drop any time-of-day left by timezone conversion when the data was stored
+        frame.index = pd.DatetimeIndex(frame.index).normalize()
+        return {
+            ticker: group.drop(columns='Ticker').astype(float)
+            for ticker, group in frame.groupby('Ticker', sort=False)
+        }
+
+    def _fallback(self, ticker, start, end):
+        """Get history from the fallback provider, empty if there is none"""
+        if not self.fallback:
+            return pd.DataFrame(columns=HISTORY_COLUMNS)
+        return _normalize(self.fallback.get_history(ticker, start=start, end=end))
+
+    def _fallback_many(self, tickers, start, end):
+        """Get history of several tickers from the fallback provider in one batch"""
+        if not self.fallback:
+            return {ticker: pd.DataFrame(columns=HISTORY_COLUMNS) for ticker in tickers}
+        frames = self.fallback.get_histories(tickers, start=start, end=end)
+        return {ticker: _normalize(frames.get(ticker)) for ticker in tickers}
+
+
+class ColumnarHistoryProvider(DatabaseHistoryProvider):
+    """
+    Read history from the columnar store (see utils.columnar_store)
+
+    Tickers whose last stored bar differs from latest_quote are synced from market_data
+    before reading, so the store never serves older bars than the table
+    """
+    def __init__(self, fallback=None, store=None):
+        """
+        Parameters:
+        fallback (PriceHistoryProvider): same as DatabaseHistoryProvider
+        store (ColumnarStore): store to read, default the process-wide store
+        """
+        super().__init__(fallback)
+        self.store = store or columnar_store
+
+    def _query_many(self, tickers, start, end):
+        self.store.sync_stale(tickers)
+        frames = {}
+        for ticker in tickers:
+            frame = self.store.read(ticker, start, end)
+            if not frame.empty:
+                frames[ticker] = frame
+        return frames
+
+
+# Provider used when callers do not pass one
+_default_provider = ColumnarHistoryProvider() if COLUMNAR_STORE_ENABLED else DatabaseHistoryProvider()
+
+
+def get_price_history_provider():
+    """Return the default price history provider"""
+    return _default_provider
+
+
+def set_price_history_provider(provider):
+    """
+    Replace the default price history provider
+
+    Parameters:
+    provider (PriceHistoryProvider): new default provider
+    """
+    global _default_provider
+    _default_provider = provider
+
+
+def get_price_histories(tickers, start=None, end=None, provider=None):
+    """
+    Get daily OHLCV history of several tickers from the given or default provider in one batch
+
+    Parameters:
+    tickers (list): stock codes
+    start (str): start date, format 'YYYY-MM-DD', inclusive
+    end (str): end date, format 'YYYY-MM-DD', exclusive, None means up to today
+    provider (PriceHistoryProvider): provider to use, default provider if None
+
+    Returns:
+    dict: {ticker: DataFrame}
+    """
+    return (provider or _default_provider).get_histories(tickers, start=start, end=end)
+
+
+def get_price_history(ticker, start=None, end=None, provider=None):
+    """
+    Get daily OHLCV history from the given or default provider
+
+    Parameters:
+    ticker (str): stock code
+    start (str): start date, format 'YYYY-MM-DD', inclusive
+    end (str): end date, format 'YYYY-MM-DD', exclusive, None means up to today
+    provider (PriceHistoryProvider): provider to use, default provider if None
+
+    Returns:
+    DataFrame: Open/High/Low/Close/Volume columns indexed by date
+    """
+    return (provider or _default_provider).get_history(ticker, start=start, end=end)
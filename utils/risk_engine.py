@@ -0,0 +1,202 @@
+"""
+Vectorized risk engine
+Compute the risk metrics of many stocks at once from a single returns matrix
+
+All tickers and the benchmark are aligned on a common date index; each ticker keeps
+its own trading days (dates it has no price for are NaN), so every metric equals the
+one computed on that ticker's price series alone
+"""
+import warnings
+import numpy as np
+
+# Trading days per year used for annualization
+TRADING_DAYS = 252
+
+# Minimum number of returns for the information ratio and Sortino ratio
+MIN_RATIO_POINTS = 30
+
+
+def _returns_matrix(prices):
+    """
+    Simple returns of each column over its own trading days
+
+    Parameters:
+    prices (ndarray): closing prices, one column per ticker, NaN where a ticker has no price
+
+    Returns:
+    ndarray: returns, NaN on each ticker's first day and on days without a price
+    """
+    missing = np.isnan(prices)
+    # Row of the last available price at or before each row (forward fill)
+    last_row = np.where(missing, 0, np.arange(prices.shape[0])[:, None])
+    np.maximum.accumulate(last_row, axis=0, out=last_row)
+    filled = prices[last_row, np.arange(prices.shape[1])]
+
+    previous = np.empty_like(filled)
+    previous[0] = np.nan
+    previous[1:] = filled[:-1]
+    returns = prices / previous - 1
+    returns[missing] = np.nan
+    return returns
+
+
+def _nan_percentile(values, q):
+    """Column-wise percentile ignoring NaN (linear interpolation, same as np.percentile)"""
+    ordered = np.sort(values, axis=0)  # NaN sorts to the end
+    count = np.sum(~np.isnan(values), axis=0)
+    position = q / 100.0 * np.maximum(count - 1, 0)
+    lower = np.floor(position).astype(int)
+    upper = np.ceil(position).astype(int)
+    columns = np.arange(values.shape[1])
+    low_values = ordered[lower, columns]
+    high_values = ordered[upper, columns]
+    result = low_values + (high_values - low_values) * (position - lower)
+    return np.where(count > 0, result, np.nan)
+
+
+def _nan_std(values, axis=0):
+    """Sample standard deviation (ddof=1) ignoring NaN, NaN when fewer than 2 values"""
+    count = np.sum(~np.isnan(values), axis=axis)
+    mean = np.nanmean(values, axis=axis)
+    squares = np.nansum((values - mean) ** 2, axis=axis)
+    return np.where(count > 1, np.sqrt(squares / np.maximum(count - 1, 1)), np.nan)
+
+
+def _value(value):
+    """Convert a NumPy scalar to float, keeping None"""
+    return None if value is None else float(value)
+
+
+def compute_risk_metrics(prices, benchmark_prices=None, min_data_points=60):
+    """
+    Compute risk metrics for all tickers column-wise
+
+    Parameters:
+    prices (DataFrame): closing prices indexed by date, one column per ticker
+    benchmark_prices (Series): benchmark closing prices, None if unavailable
+    min_data_points (int): minimum number of data points required to calculate beta
+
+    Returns:
+    dict: {ticker: metrics dict}, with the same keys as ValuationRiskMonitor.risk_metrics
+    """
+    tickers = list(prices.columns)
+    if not tickers:
+        return {}
+
+    has_benchmark = benchmark_prices is not None and len(benchmark_prices) >= 2
+    if has_benchmark:
+        frame = prices.join(benchmark_prices.rename('__benchmark__'), how='outer').sort_index()
+        benchmark_returns = _returns_matrix(frame[['__benchmark__']].to_numpy(dtype=float))[:, 0]
+        prices = frame[tickers]
+    else:
+        prices = prices.sort_index()
+
+    price_values = prices.to_numpy(dtype=float)
+    returns = _returns_matrix(price_values)
+    valid = ~np.isnan(returns)
+    count = valid.sum(axis=0)
+    sqrt_year = np.sqrt(TRADING_DAYS)
+
+    with np.errstate(invalid='ignore', divide='ignore'), warnings.catch_warnings():
+        # Columns without negative returns or without shared dates produce empty-slice warnings
+        warnings.simplefilter('ignore', RuntimeWarning)
+        # Mean, volatility and Sharpe ratio
+        mean = np.nanmean(returns, axis=0)
+        std = _nan_std(returns)
+        volatility = std * sqrt_year
+        sharpe = np.where(std > 0, mean / std * sqrt_year, 0.0)
+
+        # Maximum drawdown on prices
+        max_drawdown = np.nanmin(price_values / np.fmax.accumulate(price_values, axis=0) - 1, axis=0)
+
+        # Historical VaR
+        var_95 = _nan_percentile(returns, 5)
+        var_99 = _nan_percentile(returns, 1)
+
+        # Skewness and excess kurtosis (biased estimators, same as scipy.stats defaults)
+        deviation = returns - mean
+        m2 = np.nanmean(deviation ** 2, axis=0)
+        m3 = np.nanmean(deviation ** 3, axis=0)
+        m4 = np.nanmean(deviation ** 4, axis=0)
+        skewness = np.where(m2 > 0, m3 / m2 ** 1.5, np.nan)
+        kurtosis = np.where(m2 > 0, m4 / m2 ** 2 - 3.0, np.nan)
+
+        # Sortino ratio: downside risk over negative returns, downside deviation over all returns
+        negative = np.where(returns < 0, returns, np.nan)
+        negative_count = np.sum(returns < 0, axis=0)
+        downside_risk = _nan_std(negative) * sqrt_year
+        sortino = mean * TRADING_DAYS / downside_risk
+        downside_deviation = np.sqrt(np.nansum(negative ** 2, axis=0) / count) * sqrt_year
+
+        # Benchmark-relative metrics on the dates shared with the benchmark
+        if has_benchmark:
+            benchmark_count = int(np.sum(~np.isnan(benchmark_returns)))
+            common = valid & ~np.isnan(benchmark_returns)[:, None]
+            common_count = common.sum(axis=0)
+            stock_common = np.where(common, returns, np.nan)
+            bench_common = np.where(common, benchmark_returns[:, None], np.nan)
+
+            stock_dev = stock_common - np.nanmean(stock_common, axis=0)
+            bench_dev = bench_common - np.nanmean(bench_common, axis=0)
+            dof = np.maximum(common_count - 1, 1)
+            covariance = np.nansum(stock_dev * bench_dev, axis=0) / dof
+            bench_variance = np.nansum(bench_dev ** 2, axis=0) / dof
+            stock_variance = np.nansum(stock_dev ** 2, axis=0) / dof
+
+            beta = covariance / bench_variance
+            r_squared = covariance ** 2 / (stock_variance * bench_variance)
+            residual_risk = _nan_std(stock_common - beta * bench_common) * sqrt_year
+            systematic_risk_pct = (beta * np.sqrt(bench_variance) / np.sqrt(stock_variance)) ** 2
+
+            excess = stock_common - bench_common
+            excess_std = _nan_std(excess)
+            information_ratio = np.nanmean(excess, axis=0) / excess_std * sqrt_year
+
+    results = {}
+    for j, ticker in enumerate(tickers):
+        n = int(count[j])
+        metrics = {
+            'data_available': True,
+            'volatility': float(volatility[j]),
+            'sharpe_ratio': float(sharpe[j]),
+            'max_drawdown': float(max_drawdown[j]),
+            'var_95': _value(var_95[j]) if n >= 5 else None,
+            'var_99': _value(var_99[j]) if n >= 5 else None,
+            'skewness': _value(skewness[j]) if n > 3 else None,
+            'kurtosis': _value(kurtosis[j]) if n > 3 else None,
+            'beta': None,
+            'r_squared': None,
+            'residual_risk': None,
+            'systematic_risk_pct': None,
+            'information_ratio': None,
+            'treynor_ratio': None,
+            'sortino_ratio': None,
+            'downside_deviation': None,
+        }
+
+        if has_benchmark:
+            if (n >= min_data_points and benchmark_count >= min_data_points
+                    and common_count[j] >= min_data_points and bench_variance[j] > 0):
+                metrics['beta'] = float(beta[j])
+                metrics['r_squared'] = float(r_squared[j])
+                metrics['residual_risk'] = float(residual_risk[j])
+                metrics['systematic_risk_pct'] = float(systematic_risk_pct[j])
+            if (n >= MIN_RATIO_POINTS and benchmark_count >= MIN_RATIO_POINTS
+                    and common_count[j] >= MIN_RATIO_POINTS and excess_std[j] > 0):
+                metrics['information_ratio'] = float(information_ratio[j])
+
+        if metrics['beta'] is not None and metrics['beta'] != 0:
+            metrics['treynor_ratio'] = float(mean[j] * TRADING_DAYS / metrics['beta'])
+
+        if n >= MIN_RATIO_POINTS:
+            if negative_count[j] == 0:
+                metrics['sortino_ratio'] = float('inf')
+                metrics['downside_deviation'] = 0.0
+            elif downside_risk[j] > 0:
+                metrics['sortino_ratio'] = float(sortino[j])
+                metrics['downside_deviation'] = float(downside_deviation[j])
+            else:
+                metrics['downside_deviation'] = 0.0
+
+        results[ticker] = metrics
+    return results
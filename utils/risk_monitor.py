@@ -2,18 +2,26 @@
 Risk monitoring module
 Used to monitor and analyze the risk and valuation of stocks
 """
+import math
 import yfinance as yf
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
-from scipy import stats
 import datetime as dt
+from concurrent.futures import ThreadPoolExecutor, wait
+from config import FUNDAMENTALS_MAX_WORKERS, FUNDAMENTALS_TIMEOUT
+from utils.price_history import get_price_histories
+from utils.risk_engine import compute_risk_metrics
+from utils.rolling_metrics import ROLLING_WINDOWS, RollingMetricsStore, get_rolling_metrics_store
+
+# yfinance Ticker attributes that make up the fundamental data, one HTTP request each
+FUNDAMENTAL_ATTRIBUTES = ('info', 'balance_sheet', 'income_stmt', 'cashflow')
 
 class ValuationRiskMonitor:
     """
     Valuation and risk monitoring system
     """
-    def __init__(self, tickers, start_date=None, end_date=None, benchmark_ticker="^GSPC", min_data_points=60):
+    def __init__(self, tickers, start_date=None, end_date=None, benchmark_ticker="^GSPC", min_data_points=60, provider=None):
         """
         Initialize the valuation and risk monitoring system
         
@@ -23,16 +31,19 @@ class ValuationRiskMonitor:
         end_date (str): end date, format 'YYYY-MM-DD'
         benchmark_ticker (str): benchmark index, default is S&P 500
         min_data_points (int): minimum number of data points required to calculate beta
+        provider (PriceHistoryProvider): price history source, default reads market_data with yfinance fallback
         """
         self.tickers = tickers if isinstance(tickers, list) else [tickers]
         self.start_date = start_date if start_date else (dt.datetime.now() - dt.timedelta(days=365*3)).strftime('%Y-%m-%d')
         self.end_date = end_date if end_date else dt.datetime.now().strftime('%Y-%m-%d')
         self.benchmark_ticker = benchmark_ticker
         self.min_data_points = min_data_points
+        self.provider = provider
         self.stock_data = {}
-        self.fundamentals = {}
+        self._fundamentals = None  # loaded lazily by the fundamentals property
         self.risk_metrics = {}
         self.valuation_metrics = {}
+        self.rolling_metrics = {}
         self.benchmark_data = None
         
     def download_data(self):
@@ -44,410 +55,169 @@ class ValuationRiskMonitor:
             print("No valid stock codes provided")
             return {}
         
-        # Download stock price data
+        # Download all stock and benchmark price data in one batch
+        try:
+            histories = get_price_histories(
+                self.tickers + [self.benchmark_ticker], start=self.start_date, end=self.end_date, provider=self.provider
+            )
+        except Exception as e:
+            print(f"Error downloading market data: {str(e)}")
+            histories = {}
+        
         for ticker in self.tickers:
-            try:
-                data = yf.download(ticker, start=self.start_date, end=self.end_date)
-                
-                # Check if data is obtained
-                if data.empty:
-                    print(f"Warning: cannot get data for {ticker}")
-                    self.stock_data[ticker] = pd.DataFrame()  # 空数据框
-                else:
-                    self.stock_data[ticker] = data
-                    print(f"Downloaded historical price data for {ticker}")
-            except Exception as e:
-                print(f"Error downloading data for {ticker}: {str(e)}")
+            data = histories.get(ticker)
+            # Check if data is obtained
+            if data is None or data.empty:
+                print(f"Warning: cannot get data for {ticker}")
                 self.stock_data[ticker] = pd.DataFrame()  # 空数据框
-        
-        # Download benchmark data
-        try:
-            self.benchmark_data = yf.download(self.benchmark_ticker, start=self.start_date, end=self.end_date)
-            if self.benchmark_data.empty:
-                print(f"Warning: cannot get data for {self.benchmark_ticker}")
             else:
-                print(f"Downloaded benchmark data for {self.benchmark_ticker}")
-        except Exception as e:
-            print(f"Error downloading benchmark data: {str(e)}")
-            self.benchmark_data = pd.DataFrame()  # 空数据框
+                self.stock_data[ticker] = data
+                print(f"Downloaded historical price data for {ticker}")
         
-        # Get fundamental data
-        self._get_fundamentals()
+        # Benchmark data
+        self.benchmark_data = histories.get(self.benchmark_ticker)
+        if self.benchmark_data is None or self.benchmark_data.empty:
+            print(f"Warning: cannot get data for {self.benchmark_ticker}")
+            self.benchmark_data = pd.DataFrame()  # 空数据框
+        else:
+            print(f"Downloaded benchmark data for {self.benchmark_ticker}")
         
         return self.stock_data
     
+    @property
+    def fundamentals(self):
+        """Fundamental data of stocks, loaded on first access"""
+        if self._fundamentals is None:
+            self._fundamentals = self._get_fundamentals()
+        return self._fundamentals
+    
+    def _fetch_fundamental(self, ticker, attribute):
+        """Fetch one fundamental attribute of a stock (one HTTP request)"""
+        # Each request uses its own Ticker object so concurrent fetches share no state
+        return getattr(yf.Ticker(ticker), attribute)
+    
     def _get_fundamentals(self):
-        """Get fundamental data of stocks"""
+        """
+        Get fundamental data of stocks
+        All info/statement requests run concurrently on a bounded thread pool;
+        requests that fail or do not finish in time are treated as missing. Requests beyond the
+        pool size queue behind the running ones, so the wait allows FUNDAMENTALS_TIMEOUT for each
+        round of max_workers requests rather than one FUNDAMENTALS_TIMEOUT for the whole batch
+        """
         print("Getting fundamental data...")
-        for ticker in self.tickers:
+        fundamentals = {}
+        if not self.tickers:
+            return fundamentals
+        
+        calls = [(ticker, attribute) for ticker in self.tickers for attribute in FUNDAMENTAL_ATTRIBUTES]
+        max_workers = min(FUNDAMENTALS_MAX_WORKERS, len(calls))
+        timeout = FUNDAMENTALS_TIMEOUT * math.ceil(len(calls) / max_workers)
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            futures = {executor.submit(self._fetch_fundamental, ticker, attribute): (ticker, attribute)
+                       for ticker, attribute in calls}
+            done, not_done = wait(futures, timeout=timeout)
+        finally:
+            # Do not block on requests that are still running after the timeout
+            executor.shutdown(wait=False, cancel_futures=True)
+        
+        results = {}
+        for future, (ticker, attribute) in futures.items():
+            if future in not_done:
+                print(f"Timed out getting {attribute} for {ticker}")
+                continue
             try:
-                stock = yf.Ticker(ticker)
-                # Get financial statements
-                try:
-                    # Get net income from income statement, replacing the deprecated earnings
-                    income_stmt = stock.income_stmt if hasattr(stock, 'income_stmt') else pd.DataFrame()
-                    net_income = None
-                    if not income_stmt.empty and 'Net Income' in income_stmt.index:
-                        net_income = income_stmt.loc['Net Income']
-                    
-                    self.fundamentals[ticker] = {
-                        'info': stock.info if hasattr(stock, 'info') else {},
-                        'balance_sheet': stock.balance_sheet if hasattr(stock, 'balance_sheet') else pd.DataFrame(),
-                        'income_stmt': income_stmt,
-                        'cash_flow': stock.cashflow if hasattr(stock, 'cashflow') else pd.DataFrame(),
-                        'net_income': net_income  # Use net income extracted from income_stmt instead of earnings
-                    }
-                    print(f"Got fundamental data for {ticker}")
-                except Exception as e:
-                    print(f"Error getting fundamental data for {ticker}: {e}")
-                    # Provide empty fundamental data structure
-                    self.fundamentals[ticker] = {
-                        'info': {},
-                        'balance_sheet': pd.DataFrame(),
-                        'income_stmt': pd.DataFrame(),
-                        'cash_flow': pd.DataFrame(),
-                        'net_income': None
-                    }
+                results[(ticker, attribute)] = future.result()
             except Exception as e:
-                print(f"Error creating Ticker object for {ticker}: {e}")
-                # Provide empty fundamental data structure
-                self.fundamentals[ticker] = {
-                    'info': {},
-                    'balance_sheet': pd.DataFrame(),
-                    'income_stmt': pd.DataFrame(),
-                    'cash_flow': pd.DataFrame(),
-                    'net_income': None
-                }
+                print(f"Error getting {attribute} for {ticker}: {e}")
+        
+        for ticker in self.tickers:
+            info = results.get((ticker, 'info'))
+            income_stmt = results.get((ticker, 'income_stmt'))
+            balance_sheet = results.get((ticker, 'balance_sheet'))
+            cash_flow = results.get((ticker, 'cashflow'))
+            income_stmt = income_stmt if isinstance(income_stmt, pd.DataFrame) else pd.DataFrame()
+            # Get net income from income statement, replacing the deprecated earnings
+            net_income = None
+            if not income_stmt.empty and 'Net Income' in income_stmt.index:
+                net_income = income_stmt.loc['Net Income']
+            
+            # Missing parts get the same empty structure as before
+            fundamentals[ticker] = {
+                'info': info if isinstance(info, dict) else {},
+                'balance_sheet': balance_sheet if isinstance(balance_sheet, pd.DataFrame) else pd.DataFrame(),
+                'income_stmt': income_stmt,
+                'cash_flow': cash_flow if isinstance(cash_flow, pd.DataFrame) else pd.DataFrame(),
+                'net_income': net_income  # Use net income extracted from income_stmt instead of earnings
+            }
+        print(f"Got fundamental data for {sum(1 for key in results if key[1] == 'info')} of {len(self.tickers)} stocks")
+        return fundamentals
     
     def calculate_risk_metrics(self):
-        """Calculate risk metrics"""
+        """
+        Calculate risk metrics
+        All tickers with enough price data are aligned into one returns matrix
+        and computed column-wise by the vectorized risk engine
+        """
         print("Calculating risk metrics...")
+        closes = {}
         for ticker in self.tickers:
-            try:
-                # Check if there is enough data
-                if ticker not in self.stock_data or self.stock_data[ticker].empty or len(self.stock_data[ticker]) < 2:
-                    print(f"Warning: {ticker} has insufficient price data, cannot calculate risk metrics")
-                    self.risk_metrics[ticker] = {
-                        'data_available': False,
-                        'error_message': 'Insufficient price data'
-                    }
-                    continue
-                
-                # Calculate returns
-                returns = self.stock_data[ticker]['Close'].pct_change().dropna()
-                
-                # Check benchmark data
-                if self.benchmark_data is None or self.benchmark_data.empty or len(self.benchmark_data) < 2:
-                    print(f"Warning: insufficient benchmark data, cannot calculate beta for {ticker}")
-                    benchmark_returns = None
-                else:
-                    benchmark_returns = self.benchmark_data['Close'].pct_change().dropna()
-                
-                # Initialize risk metrics dictionary
-                self.risk_metrics[ticker] = {
-                    'data_available': True
-                }
-                
-                # Calculate volatility
-                volatility = returns.std() * np.sqrt(252)
-                # Fix float conversion for single element Series
-                self.risk_metrics[ticker]['volatility'] = float(volatility.item()) if hasattr(volatility, 'item') else float(volatility)
-                
-                # Calculate Sharpe ratio - handle division by zero case
-                # Use .item() method to get scalar value
-                returns_std = returns.std().item() if hasattr(returns.std(), 'item') else returns.std()
-                returns_mean = returns.mean().item() if hasattr(returns.mean(), 'item') else returns.mean()
-                
-                if returns_std > 0:
-                    sharpe_ratio = (returns_mean / returns_std) * np.sqrt(252)
-                    # Fix float conversion for single element Series
-                    self.risk_metrics[ticker]['sharpe_ratio'] = float(sharpe_ratio) if isinstance(sharpe_ratio, (np.float64, np.float32)) else sharpe_ratio
-                else:
-                    print(f"Warning: {ticker} has a standard deviation of 0, cannot calculate Sharpe ratio")
-                    self.risk_metrics[ticker]['sharpe_ratio'] = 0.0
-                
-                # Calculate maximum drawdown
-                try:
-                    max_drawdown = self._calculate_max_drawdown(self.stock_data[ticker]['Close'])
-                    self.risk_metrics[ticker]['max_drawdown'] = float(max_drawdown) if max_drawdown is not None else None
-                except Exception as e:
-                    print(f"Error calculating max drawdown for {ticker}: {str(e)}")
-                    self.risk_metrics[ticker]['max_drawdown'] = None
-                
-                # Calculate VaR
-                if len(returns) >= 5:
-                    var_95 = np.percentile(returns, 5)
-                    var_99 = np.percentile(returns, 1)
-                    # Fix float conversion for single element Series
-                    self.risk_metrics[ticker]['var_95'] = float(var_95.item()) if hasattr(var_95, 'item') else float(var_95)
-                    self.risk_metrics[ticker]['var_99'] = float(var_99.item()) if hasattr(var_99, 'item') else float(var_99)
-                else:
-                    print(f"Warning: {ticker} has insufficient data, cannot calculate reliable VaR")
-                    self.risk_metrics[ticker]['var_95'] = None
-                    self.risk_metrics[ticker]['var_99'] = None
-                
-                # Calculate skewness and kurtosis
-                if len(returns) > 3:  # Need at least 4 data points
-                    skewness = stats.skew(returns)
-                    kurtosis = stats.kurtosis(returns)
-                    # Fix float conversion for single element Series
-                    self.risk_metrics[ticker]['skewness'] = float(skewness.item()) if hasattr(skewness, 'item') else float(skewness)
-                    self.risk_metrics[ticker]['kurtosis'] = float(kurtosis.item()) if hasattr(kurtosis, 'item') else float(kurtosis)
-                else:
-                    print(f"Warning: {ticker} has insufficient data, cannot calculate skewness and kurtosis")
-                    self.risk_metrics[ticker]['skewness'] = None
-                    self.risk_metrics[ticker]['kurtosis'] = None
-                
-                # Calculate beta coefficient - improved version
-                self._calculate_beta(ticker, returns, benchmark_returns)
-                
-                # Calculate information ratio
-                self._calculate_information_ratio(ticker, returns, benchmark_returns)
-                
-                # Calculate Treynor ratio
-                self._calculate_treynor_ratio(ticker, returns, benchmark_returns)
-                
-                # Calculate Sortino ratio
-                self._calculate_sortino_ratio(ticker, returns)
-                
-            except Exception as e:
-                print(f"Error calculating risk metrics for {ticker}: {str(e)}")
+            # Check if there is enough data
+            if ticker not in self.stock_data or self.stock_data[ticker].empty or len(self.stock_data[ticker]) < 2:
+                print(f"Warning: {ticker} has insufficient price data, cannot calculate risk metrics")
                 self.risk_metrics[ticker] = {
                     'data_available': False,
-                    'error_message': f'Error calculating risk metrics: {str(e)}'
+                    'error_message': 'Insufficient price data'
                 }
-                
-        return self.risk_metrics
-    
-    def _calculate_max_drawdown(self, price_series):
-        """Calculate maximum drawdown"""
-        try:
-            if price_series.empty or len(price_series) < 2:
-                print("Price series is empty or insufficient data, cannot calculate max drawdown")
-                return None
-            
-            roll_max = price_series.cummax()
-            drawdown = (price_series / roll_max - 1)
-            min_drawdown = drawdown.min()
-            # Fix float conversion for single element Series
-            return float(min_drawdown.item()) if hasattr(min_drawdown, 'item') else float(min_drawdown)
-        except Exception as e:
-            print(f"Error calculating max drawdown: {str(e)}")
-            return None
-    
-    def _calculate_beta(self, ticker, returns, benchmark_returns):
-        """
-        Calculate beta coefficient - improved version
+                continue
+            closes[ticker] = self.stock_data[ticker]['Close']
         
-        Parameters:
-        ticker (str): stock code
-        returns (Series): stock return series
-        benchmark_returns (Series): benchmark index return series
-        """
-        if benchmark_returns is None or len(returns) < self.min_data_points or len(benchmark_returns) < self.min_data_points:
-            print(f"Warning: insufficient data points, {self.min_data_points}, cannot calculate beta for {ticker}")
-            self.risk_metrics[ticker]['beta'] = None
-            self.risk_metrics[ticker]['r_squared'] = None
-            self.risk_metrics[ticker]['residual_risk'] = None
-            self.risk_metrics[ticker]['systematic_risk_pct'] = None
-            return
+        if not closes:
+            return self.risk_metrics
         
-        try:
-            # Ensure two sequences have the same index
-            common_index = returns.index.intersection(benchmark_returns.index)
-            if len(common_index) < self.min_data_points:
-                print(f"Warning: insufficient common data points, {self.min_data_points}, cannot calculate beta for {ticker}")
-                self.risk_metrics[ticker]['beta'] = None
-                self.risk_metrics[ticker]['r_squared'] = None
-                self.risk_metrics[ticker]['residual_risk'] = None
-                self.risk_metrics[ticker]['systematic_risk_pct'] = None
-                return
-            
-            # Align data
-            stock_returns_aligned = returns.loc[common_index]
-            benchmark_returns_aligned = benchmark_returns.loc[common_index]
-            
-            # Use numpy to calculate covariance and variance, avoid DataFrame and Series comparison issues
-            stock_returns_np = stock_returns_aligned.values
-            benchmark_returns_np = benchmark_returns_aligned.values
-            
-            # Calculate covariance and variance
-            cov_matrix = np.cov(stock_returns_np, benchmark_returns_np, ddof=1)
-            if cov_matrix.shape == (2, 2):
-                covariance = cov_matrix[0, 1]
-                benchmark_variance = np.var(benchmark_returns_np, ddof=1)
-                
-                # Check if variance is zero
-                if benchmark_variance > 0:
-                    beta = covariance / benchmark_variance
-                    self.risk_metrics[ticker]['beta'] = float(beta)
-                    
-                    # Calculate R-squared value (coefficient of determination)
-                    correlation = np.corrcoef(stock_returns_np, benchmark_returns_np)[0, 1]
-                    r_squared = correlation ** 2
-                    self.risk_metrics[ticker]['r_squared'] = float(r_squared)
-                    
-                    # Calculate residual risk (specific risk)
-                    predicted_returns = benchmark_returns_np * beta
-                    residual_returns = stock_returns_np - predicted_returns
-                    residual_risk = np.std(residual_returns, ddof=1) * np.sqrt(252)
-                    self.risk_metrics[ticker]['residual_risk'] = float(residual_risk)
-                    
-                    # Calculate systematic risk percentage
-                    total_risk = np.std(stock_returns_np, ddof=1) * np.sqrt(252)
-                    systematic_risk = beta * np.std(benchmark_returns_np, ddof=1) * np.sqrt(252)
-                    systematic_risk_pct = (systematic_risk / total_risk) ** 2
-                    self.risk_metrics[ticker]['systematic_risk_pct'] = float(systematic_risk_pct)
-                else:
-                    print(f"Warning: benchmark return variance is 0, cannot calculate beta for {ticker}")
-                    self.risk_metrics[ticker]['beta'] = None
-                    self.risk_metrics[ticker]['r_squared'] = None
-                    self.risk_metrics[ticker]['residual_risk'] = None
-                    self.risk_metrics[ticker]['systematic_risk_pct'] = None
-            else:
-                print(f"Warning: covariance matrix shape is incorrect, cannot calculate beta for {ticker}")
-                self.risk_metrics[ticker]['beta'] = None
-                self.risk_metrics[ticker]['r_squared'] = None
-                self.risk_metrics[ticker]['residual_risk'] = None
-                self.risk_metrics[ticker]['systematic_risk_pct'] = None
-        except Exception as e:
-            print(f"Error calculating beta for {ticker}: {str(e)}")
-            self.risk_metrics[ticker]['beta'] = None
-            self.risk_metrics[ticker]['r_squared'] = None
-            self.risk_metrics[ticker]['residual_risk'] = None
-            self.risk_metrics[ticker]['systematic_risk_pct'] = None
-    
-    def _calculate_information_ratio(self, ticker, returns, benchmark_returns):
-        """
-        Calculate information ratio
-        
-        Parameters:
-        ticker (str): stock code
-        returns (Series): stock return series
-        benchmark_returns (Series): benchmark index return series
-        """
-        if benchmark_returns is None or len(returns) < 30 or len(benchmark_returns) < 30:
-            print(f"Warning: insufficient data, cannot calculate information ratio for {ticker}")
-            self.risk_metrics[ticker]['information_ratio'] = None
-            return
+        # Check benchmark data
+        if self.benchmark_data is None or self.benchmark_data.empty or len(self.benchmark_data) < 2:
+            print("Warning: insufficient benchmark data, cannot calculate beta")
+            benchmark_prices = None
+        else:
+            benchmark_prices = self.benchmark_data['Close']
         
         try:
-            # Ensure two sequences have the same index
-            common_index = returns.index.intersection(benchmark_returns.index)
-            if len(common_index) < 30:
-                print(f"Warning: insufficient common data points, cannot calculate information ratio for {ticker}")
-                self.risk_metrics[ticker]['information_ratio'] = None
-                return
-            
-            # Align data
-            stock_returns_aligned = returns.loc[common_index]
-            benchmark_returns_aligned = benchmark_returns.loc[common_index]
-            
-            # Convert to numpy array, avoid Series comparison issues
-            stock_returns_np = stock_returns_aligned.values
-            benchmark_returns_np = benchmark_returns_aligned.values
-            
-            # Calculate excess returns
-            excess_returns = stock_returns_np - benchmark_returns_np
-            
-            # Calculate information ratio
-            excess_returns_mean = np.mean(excess_returns)
-            excess_returns_std = np.std(excess_returns, ddof=1)
-            
-            if excess_returns_std > 0:
-                information_ratio = excess_returns_mean / excess_returns_std * np.sqrt(252)
-                self.risk_metrics[ticker]['information_ratio'] = float(information_ratio)
-            else:
-                print(f"Warning: excess return standard deviation is 0, cannot calculate information ratio for {ticker}")
-                self.risk_metrics[ticker]['information_ratio'] = None
+            prices = pd.concat(closes, axis=1)
+            self.risk_metrics.update(compute_risk_metrics(prices, benchmark_prices, self.min_data_points))
         except Exception as e:
-            print(f"Error calculating information ratio for {ticker}: {str(e)}")
-            self.risk_metrics[ticker]['information_ratio'] = None
+            print(f"Error calculating risk metrics: {str(e)}")
+            for ticker in closes:
+                self.risk_metrics[ticker] = {
+                    'data_available': False,
+                    'error_message': f'Error calculating risk metrics: {str(e)}'
+                }
+                
+        return self.risk_metrics
     
-    def _calculate_treynor_ratio(self, ticker, returns, benchmark_returns):
+    def calculate_rolling_metrics(self, windows=ROLLING_WINDOWS):
         """
-        Calculate Treynor ratio
+        Calculate rolling metric series between start_date and end_date
+        Running moments are kept per ticker in a process-wide store, so only bars added
+        since the previous call are read and each new bar is an O(1) update
         
         Parameters:
-        ticker (str): stock code
-        returns (Series): stock return series
-        benchmark_returns (Series): benchmark index return series
-        """
-        if 'beta' not in self.risk_metrics[ticker] or self.risk_metrics[ticker]['beta'] is None:
-            print(f"Warning: beta coefficient is not available, cannot calculate Treynor ratio for {ticker}")
-            self.risk_metrics[ticker]['treynor_ratio'] = None
-            return
-        
-        try:
-            # Calculate risk-free rate (assumed to be 0, can be adjusted according to actual situation)
-            risk_free_rate = 0.0
-            
-            # Calculate annualized average return
-            returns_mean = returns.mean() * 252
-            
-            # Calculate Treynor ratio
-            beta = self.risk_metrics[ticker]['beta']
-            if beta != 0:
-                treynor_ratio = (returns_mean - risk_free_rate) / beta
-                self.risk_metrics[ticker]['treynor_ratio'] = float(treynor_ratio)
-            else:
-                print(f"Warning: beta coefficient is 0, cannot calculate Treynor ratio for {ticker}")
-                self.risk_metrics[ticker]['treynor_ratio'] = None
-        except Exception as e:
-            print(f"Error calculating Treynor ratio for {ticker}: {str(e)}")
-            self.risk_metrics[ticker]['treynor_ratio'] = None
-    
-    def _calculate_sortino_ratio(self, ticker, returns):
-        """
-        Calculate Sortino ratio
+        windows (iterable): window lengths in trading days, subset of ROLLING_WINDOWS
         
-        Parameters:
-        ticker (str): stock code
-        returns (Series): stock return series
+        Returns:
+        dict: {ticker: {window: {'date': [...], 'volatility': [...], ...}}}
         """
-        if len(returns) < 30:
-            print(f"Warning: insufficient data, cannot calculate Sortino ratio for {ticker}")
-            self.risk_metrics[ticker]['sortino_ratio'] = None
-            self.risk_metrics[ticker]['downside_deviation'] = None
-            return
-        
-        try:
-            # Convert to numpy array, avoid Series comparison issues
-            returns_np = returns.values
-            
-            # Calculate risk-free rate (assumed to be 0, can be adjusted according to actual situation)
-            risk_free_rate = 0.0
-            
-            # Calculate annualized average return
-            returns_mean = np.mean(returns_np) * 252
-            
-            # Calculate downside risk (only consider negative returns)
-            negative_returns = returns_np[returns_np < 0]
-            if len(negative_returns) > 0:
-                downside_risk = np.std(negative_returns, ddof=1) * np.sqrt(252)
-                
-                # Calculate Sortino ratio
-                if downside_risk > 0:
-                    sortino_ratio = (returns_mean - risk_free_rate) / downside_risk
-                    self.risk_metrics[ticker]['sortino_ratio'] = float(sortino_ratio)
-                    
-                    # Calculate downside deviation
-                    target_return = 0  # Target return, can be adjusted according to actual situation
-                    downside_returns = returns_np[returns_np < target_return]
-                    downside_deviation = np.sqrt(np.sum((downside_returns - target_return) ** 2) / len(returns_np)) * np.sqrt(252)
-                    self.risk_metrics[ticker]['downside_deviation'] = float(downside_deviation)
-                else:
-                    print(f"Warning: downside risk is 0, cannot calculate Sortino ratio for {ticker}")
-                    self.risk_metrics[ticker]['sortino_ratio'] = None
-                    self.risk_metrics[ticker]['downside_deviation'] = 0.0
-            else:
-                print(f"Warning: no negative returns, set Sortino ratio for {ticker} to infinity")
-                self.risk_metrics[ticker]['sortino_ratio'] = float('inf')
-                self.risk_metrics[ticker]['downside_deviation'] = 0.0
-        except Exception as e:
-            print(f"Error calculating Sortino ratio for {ticker}: {str(e)}")
-            self.risk_metrics[ticker]['sortino_ratio'] = None
-            self.risk_metrics[ticker]['downside_deviation'] = None
+        print("Calculating rolling metrics...")
+        if self.provider is None:
+            store = get_rolling_metrics_store(self.benchmark_ticker)
+        else:
+            # A custom price source gets its own state so it never mixes with the shared store
+            store = RollingMetricsStore(self.benchmark_ticker, provider=self.provider)
+        self.rolling_metrics = store.get_series(self.tickers, windows, start=self.start_date, end=self.end_date)
+        for ticker in self.tickers:
+            if ticker not in self.rolling_metrics:
+                print(f"Warning: {ticker} has no price data, cannot calculate rolling metrics")
+        return self.rolling_metrics
     
     # Other methods...
 
@@ -493,6 +263,181 @@ def run_analysis(tickers, start_date=None, end_date=None):
     
     return monitor
 
+def _format_risk_assessment(metrics):
+    """
+    Convert the risk metrics of one stock into the simplified, rated JSON result
+    
+    Parameters:
+    metrics (dict): risk metrics of the stock from ValuationRiskMonitor.risk_metrics
+    
+    Returns:
+    dict: JSON object containing risk analysis results
+    """
+    # Create result dictionary
+    result = {}
+    
+    # Volatility
+    volatility = metrics.get('volatility')
+    if volatility is not None:
+        result["volatility"] = round(volatility * 100, 2)  # Convert to percentage
+        # Add risk rating
+        if volatility > 0.3:
+            result["volatility_rating"] = "High"
+        elif volatility < 0.15:
+            result["volatility_rating"] = "Low"
+        else:
+            result["volatility_rating"] = "Medium"
+    
+    # Maximum drawdown
+    max_drawdown = metrics.get('max_drawdown')
+    if max_drawdown is not None:
+        result["max_drawdown"] = round(max_drawdown * 100, 2)  # Convert to percentage
+        # Add risk rating
+        if max_drawdown < -0.3:
+            result["drawdown_rating"] = "High"
+        elif max_drawdown > -0.1:
+            result["drawdown_rating"] = "Low"
+        else:
+            result["drawdown_rating"] = "Medium"
+    
+    # Beta coefficient
+    beta = metrics.get('beta')
+    if beta is not None and not np.isnan(beta):
+        result["beta"] = round(beta, 2)
+        # Add risk rating
+        if beta > 1.5:
+            result["beta_rating"] = "High"
+        elif beta < 0.5:
+            result["beta_rating"] = "Low"
+        else:
+            result["beta_rating"] = "中"
+    
+    # R方值
+    r_squared = metrics.get('r_squared')
+    if r_squared is not None:
+        result["r_squared"] = round(r_squared, 2)
+    
+    # Systematic risk percentage
+    systematic_risk_pct = metrics.get('systematic_risk_pct')
+    if systematic_risk_pct is not None:
+        result["systematic_risk_pct"] = round(systematic_risk_pct * 100, 2)
+    
+    # Residual risk
+    residual_risk = metrics.get('residual_risk')
+    if residual_risk is not None:
+        result["residual_risk"] = round(residual_risk * 100, 2)
+    
+    # Risk value (VaR)
+    var_95 = metrics.get('var_95')
+    if var_95 is not None:
+        result["var_95"] = round(var_95 * 100, 2)
+        # Add risk rating
+        if var_95 < -0.03:
+            result["var_rating"] = "High"
+        elif var_95 > -0.015:
+            result["var_rating"] = "Low"
+        else:
+            result["var_rating"] = "Medium"
+    
+    # Sharpe ratio
+    sharpe = metrics.get('sharpe_ratio')
+    if sharpe is not None:
+        result["sharpe_ratio"] = round(sharpe, 2)
+        # Add risk rating
+        if sharpe > 1:
+            result["sharpe_rating"] = "Good"
+        elif sharpe < 0:
+            result["sharpe_rating"] = "Bad"
+        else:
+            result["sharpe_rating"] = "Medium"
+    
+    # Information ratio
+    info_ratio = metrics.get('information_ratio')
+    if info_ratio is not None:
+        result["information_ratio"] = round(info_ratio, 2)
+    
+    # Treynor ratio
+    treynor = metrics.get('treynor_ratio')
+    if treynor is not None:
+        result["treynor_ratio"] = round(treynor, 2)
+    
+    # Sortino ratio
+    sortino = metrics.get('sortino_ratio')
+    if sortino is not None:
+        if sortino == float('inf'):
+            result["sortino_ratio"] = "∞"
+        else:
+            result["sortino_ratio"] = round(sortino, 2)
+            # Add risk rating
+            if sortino > 1:
+                result["sortino_rating"] = "Good"
+            elif sortino < 0:
+                result["sortino_rating"] = "Bad"
+            else:
+                result["sortino_rating"] = "Medium"
+    
+    # Downside deviation
+    downside_dev = metrics.get('downside_deviation')
+    if downside_dev is not None:
+        result["downside_deviation"] = round(downside_dev * 100, 2)
+    
+    # Skewness and kurtosis
+    skew = metrics.get('skewness')
+    kurt = metrics.get('kurtosis')
+    if skew is not None:
+        result["skewness"] = round(skew, 2)
+    if kurt is not None:
+        result["kurtosis"] = round(kurt, 2)
+    
+    # Add risk assessment summary
+    result["risk_summary"] = []
+    
+    # Overall risk level
+    if volatility is not None:
+        if volatility > 0.3:
+            result["risk_summary"].append("High volatility stock, overall risk is high")
+            result["overall_risk"] = "High"
+        elif volatility < 0.15:
+            result["risk_summary"].append("Low volatility stock, overall risk is low")
+            result["overall_risk"] = "Low"
+        else:
+            result["risk_summary"].append("Medium volatility stock, overall risk is medium")
+            result["overall_risk"] = "Medium"
+    
+    # Market correlation
+    if beta is not None and r_squared is not None:
+        if beta > 1.2 and r_squared > 0.6:
+            result["risk_summary"].append("High market correlation and amplified market volatility")
+        elif beta < 0.8 and r_squared > 0.6:
+            result["risk_summary"].append("High market correlation but low volatility")
+        elif r_squared < 0.3:
+            result["risk_summary"].append("Low market correlation, good diversification effect")
+    
+    # Risk-adjusted return
+    if sharpe is not None and sortino is not None:
+        if sharpe > 1 and sortino > 1:
+            result["risk_summary"].append("Risk-adjusted return is excellent")
+            result["risk_adjusted_return"] = "Good"
+        elif sharpe < 0 and sortino < 0:
+            result["risk_summary"].append("Risk-adjusted return is poor")
+            result["risk_adjusted_return"] = "Bad"
+        else:
+            result["risk_summary"].append("Risk-adjusted return is medium")
+            result["risk_adjusted_return"] = "Medium"
+    
+    # Extreme risk
+    if var_95 is not None and max_drawdown is not None and kurt is not None:
+        if var_95 < -0.03 and max_drawdown < -0.2 and kurt > 3:
+            result["risk_summary"].append("存在显著的极端风险，需要谨慎存在显著的极端风险，需要谨慎 ")
+            result["extreme_risk"] = "High"
+        elif var_95 > -0.015 and max_drawdown > -0.1:
+            result["risk_summary"].append("Extreme risk is relatively low")
+            result["extreme_risk"] = "Low"
+        else:
+            result["extreme_risk"] = "Medium"
+    
+    return result
+
 def run_analysis_text_only_simple(tickers, start_date=None, end_date=None):
     """
     Run simplified text analysis, return JSON format risk analysis results
@@ -525,172 +470,7 @@ def run_analysis_text_only_simple(tickers, start_date=None, end_date=None):
         if not ticker or ticker not in risk_metrics:
             return {"error": "Failed to get stock risk data"}
         
-        metrics = risk_metrics[ticker]
-        
-        # Create result dictionary
-        result = {}
-        
-        # Volatility
-        volatility = metrics.get('volatility')
-        if volatility is not None:
-            result["volatility"] = round(volatility * 100, 2)  # Convert to percentage
-            # Add risk rating
-            if volatility > 0.3:
-                result["volatility_rating"] = "High"
-            elif volatility < 0.15:
-                result["volatility_rating"] = "Low"
-            else:
-                result["volatility_rating"] = "Medium"
-        
-        # Maximum drawdown
-        max_drawdown = metrics.get('max_drawdown')
-        if max_drawdown is not None:
-            result["max_drawdown"] = round(max_drawdown * 100, 2)  # Convert to percentage
-            # Add risk rating
-            if max_drawdown < -0.3:
-                result["drawdown_rating"] = "High"
-            elif max_drawdown > -0.1:
-                result["drawdown_rating"] = "Low"
-            else:
-                result["drawdown_rating"] = "Medium"
-        
-        # Beta coefficient
-        beta = metrics.get('beta')
-        if beta is not None and not np.isnan(beta):
-            result["beta"] = round(beta, 2)
-            # Add risk rating
-            if beta > 1.5:
-                result["beta_rating"] = "High"
-            elif beta < 0.5:
-                result["beta_rating"] = "Low"
-            else:
-                result["beta_rating"] = "中"
-        
-        # R方值
-        r_squared = metrics.get('r_squared')
-        if r_squared is not None:
-            result["r_squared"] = round(r_squared, 2)
-        
-        # Systematic risk percentage
-        systematic_risk_pct = metrics.get('systematic_risk_pct')
-        if systematic_risk_pct is not None:
-            result["systematic_risk_pct"] = round(systematic_risk_pct * 100, 2)
-        
-        # Residual risk
-        residual_risk = metrics.get('residual_risk')
-        if residual_risk is not None:
-            result["residual_risk"] = round(residual_risk * 100, 2)
-        
-        # Risk value (VaR)
-        var_95 = metrics.get('var_95')
-        if var_95 is not None:
-            result["var_95"] = round(var_95 * 100, 2)
-            # Add risk rating
-            if var_95 < -0.03:
-                result["var_rating"] = "High"
-            elif var_95 > -0.015:
-                result["var_rating"] = "Low"
-            else:
-                result["var_rating"] = "Medium"
-        
-        # Sharpe ratio
-        sharpe = metrics.get('sharpe_ratio')
-        if sharpe is not None:
-            result["sharpe_ratio"] = round(sharpe, 2)
-            # Add risk rating
-            if sharpe > 1:
-                result["sharpe_rating"] = "Good"
-            elif sharpe < 0:
-                result["sharpe_rating"] = "Bad"
-            else:
-                result["sharpe_rating"] = "Medium"
-        
-        # Information ratio
-        info_ratio = metrics.get('information_ratio')
-        if info_ratio is not None:
-            result["information_ratio"] = round(info_ratio, 2)
-        
-        # Treynor ratio
-        treynor = metrics.get('treynor_ratio')
-        if treynor is not None:
-            result["treynor_ratio"] = round(treynor, 2)
-        
-        # Sortino ratio
-        sortino = metrics.get('sortino_ratio')
-        if sortino is not None:
-            if sortino == float('inf'):
-                result["sortino_ratio"] = "∞"
-            else:
-                result["sortino_ratio"] = round(sortino, 2)
-                # Add risk rating
-                if sortino > 1:
-                    result["sortino_rating"] = "Good"
-                elif sortino < 0:
-                    result["sortino_rating"] = "Bad"
-                else:
-                    result["sortino_rating"] = "Medium"
-        
-        # Downside deviation
-        downside_dev = metrics.get('downside_deviation')
-        if downside_dev is not None:
-            result["downside_deviation"] = round(downside_dev * 100, 2)
-        
-        # Skewness and kurtosis
-        skew = metrics.get('skewness')
-        kurt = metrics.get('kurtosis')
-        if skew is not None:
-            result["skewness"] = round(skew, 2)
-        if kurt is not None:
-            result["kurtosis"] = round(kurt, 2)
-        
-        # Add risk assessment summary
-        result["risk_summary"] = []
-        
-        # Overall risk level
-        if volatility is not None:
-            if volatility > 0.3:
-                result["risk_summary"].append("High volatility stock, overall risk is high")
-                result["overall_risk"] = "High"
-            elif volatility < 0.15:
-                result["risk_summary"].append("Low volatility stock, overall risk is low")
-                result["overall_risk"] = "Low"
-            else:
-                result["risk_summary"].append("Medium volatility stock, overall risk is medium")
-                result["overall_risk"] = "Medium"
-        
-        # Market correlation
-        if beta is not None and r_squared is not None:
-            if beta > 1.2 and r_squared > 0.6:
-                result["risk_summary"].append("High market correlation and amplified market volatility")
-            elif beta < 0.8 and r_squared > 0.6:
-                result["risk_summary"].append("High market correlation but low volatility")
-            elif r_squared < 0.3:
-                result["risk_summary"].append("Low market correlation, good diversification effect")
-        
-        # Risk-adjusted return
-        if sharpe is not None and sortino is not None:
-            if sharpe > 1 and sortino > 1:
-                result["risk_summary"].append("Risk-adjusted return is excellent")
-                result["risk_adjusted_return"] = "Good"
-            elif sharpe < 0 and sortino < 0:
-                result["risk_summary"].append("Risk-adjusted return is poor")
-                result["risk_adjusted_return"] = "Bad"
-            else:
-                result["risk_summary"].append("Risk-adjusted return is medium")
-                result["risk_adjusted_return"] = "Medium"
-        
-        # Extreme risk
-        if var_95 is not None and max_drawdown is not None and kurt is not None:
-            if var_95 < -0.03 and max_drawdown < -0.2 and kurt > 3:
-                result["risk_summary"].append("存在显著的极端风险，需要谨慎存在显著的极端风险，需要谨慎 ")
-                result["extreme_risk"] = "High"
-            elif var_95 > -0.015 and max_drawdown > -0.1:
-                result["risk_summary"].append("Extreme risk is relatively low")
-                result["extreme_risk"] = "Low"
-            else:
-                result["extreme_risk"] = "Medium"
-        
-        return result
+        return _format_risk_assessment(risk_metrics[ticker])
     
     except Exception as e:
         import traceback
@@ -703,6 +483,38 @@ def run_analysis_text_only_simple(tickers, start_date=None, end_date=None):
             "details": trace
         }
 
+def run_analysis_text_only_batch(tickers, start_date=None, end_date=None, provider=None):
+    """
+    Run simplified text analysis for several stocks at once
+    Prices of all stocks and the benchmark are fetched in one batch and the benchmark is shared
+    
+    Parameters:
+    tickers (list): stock code list
+    start_date (str): start date, format 'YYYY-MM-DD'
+    end_date (str): end date, format 'YYYY-MM-DD'
+    provider (PriceHistoryProvider): price history source, default reads market_data with yfinance fallback
+    
+    Returns:
+    dict: {stock code: JSON object containing risk analysis results}
+    """
+    tickers = list(dict.fromkeys(tickers))
+    monitor = ValuationRiskMonitor(tickers, start_date, end_date, provider=provider)
+    
+    monitor.download_data()
+    risk_metrics = monitor.calculate_risk_metrics()
+    
+    results = {}
+    for ticker in tickers:
+        if ticker not in risk_metrics:
+            results[ticker] = {"error": "Failed to get stock risk data"}
+            continue
+        try:
+            results[ticker] = _format_risk_assessment(risk_metrics[ticker])
+        except Exception as e:
+            print(f"Error occurred during analysis of {ticker}: {str(e)}")
+            results[ticker] = {"error": f"Error occurred during analysis: {str(e)}"}
+    return results
+
 # Test function
 def test_risk_analysis():
     """Test risk analysis functionality"""
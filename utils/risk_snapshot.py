@@ -0,0 +1,158 @@
+"""
+Risk metrics snapshot module
+Precompute risk metrics into the risk_metrics table and serve them to the analysis API
+
+Snapshots cover fixed lookback windows ending at each ticker's latest market_data date;
+requests whose date range matches a window and ends at the latest data are answered
+from the table, any other range is computed live
+"""
+import math
+import logging
+from datetime import timedelta
+from sqlalchemy import select, delete
+from models import db, RiskMetrics, Portfolio
+from config import TECH_TICKERS, RISK_SNAPSHOT_WINDOWS
+from utils.latest_quote import get_latest_quotes
+from utils.price_history import GAP_TOLERANCE_DAYS
+from utils.risk_monitor import ValuationRiskMonitor, _format_risk_assessment
+
+logger = logging.getLogger(__name__)
+
+# Date ranges within this many days of a window length use that window (leap years, inclusive end dates)
+WINDOW_TOLERANCE_DAYS = 1
+
+
+def snapshot_tickers():
+    """
+    Tickers kept precomputed: TECH_TICKERS and every ticker currently held in a portfolio
+
+    Returns:
+    list: stock codes
+    """
+    held = db.session.execute(
+        select(Portfolio.ticker).where(Portfolio.quantity > 0).distinct()
+    ).scalars().all()
+    return list(dict.fromkeys(list(TECH_TICKERS) + list(held)))
+
+
+def _is_storable(metrics):
+    """Only complete results are stored; infinite/NaN values cannot be kept in a FLOAT column"""
+    if not metrics.get('data_available'):
+        return False
+    return all(
+        metrics.get(column) is None or math.isfinite(metrics[column])
+        for column in RiskMetrics.METRIC_COLUMNS
+    )
+
+
+def compute_risk_snapshots(tickers=None, windows=None, provider=None):
+    """
+    Compute and store the risk metrics of tickers whose latest market data has no snapshot yet
+    Must be called inside a Flask application context
+
+    Parameters:
+    tickers (list): stock codes, default is snapshot_tickers()
+    windows (list): lookback windows in calendar days, default is RISK_SNAPSHOT_WINDOWS
+    provider (PriceHistoryProvider): price history source, default reads market_data with yfinance fallback
+
+    Returns:
+    int: number of snapshot rows written
+    """
+    tickers = snapshot_tickers() if tickers is None else list(dict.fromkeys(tickers))
+    windows = RISK_SNAPSHOT_WINDOWS if windows is None else windows
+
+    # Tickers without market_data rows have no as-of date and are always computed live
+    groups = {}
+    for ticker, quote in get_latest_quotes(tickers).items():
+        groups.setdefault(quote.date.date(), []).append(ticker)
+
+    written = 0
+    for as_of, group in groups.items():
+        for window in windows:
+            existing = set(db.session.execute(
+                select(RiskMetrics.ticker).where(
+                    RiskMetrics.ticker.in_(group),
+                    RiskMetrics.window_days == window,
+                    RiskMetrics.as_of_date == as_of
+                )
+            ).scalars())
+            missing = [ticker for ticker in group if ticker not in existing]
+            if not missing:
+                continue
+
+            monitor = ValuationRiskMonitor(
+                missing,
+                start_date=(as_of - timedelta(days=window)).strftime('%Y-%m-%d'),
+                end_date=(as_of + timedelta(days=1)).strftime('%Y-%m-%d'),
+                provider=provider
+            )
+            monitor.download_data()
+            if monitor.benchmark_data is None or monitor.benchmark_data.empty:
+                # Benchmark-relative metrics would be missing; retry on the next run instead of storing them
+                logger.warning(f"Skipping {window}-day risk snapshots as of {as_of}: no benchmark data")
+                continue
+            risk_metrics = monitor.calculate_risk_metrics()
+
+            stored = []
+            for ticker in missing:
+                metrics = risk_metrics.get(ticker)
+                if metrics is None or not _is_storable(metrics):
+                    continue
+                db.session.add(RiskMetrics(
+                    ticker=ticker,
+                    window_days=window,
+                    as_of_date=as_of,
+                    data_available=True,
+                    **{column: metrics.get(column) for column in RiskMetrics.METRIC_COLUMNS}
+                ))
+                stored.append(ticker)
+            if stored:
+                # Snapshots of older data are superseded by the new ones
+                db.session.execute(delete(RiskMetrics).where(
+                    RiskMetrics.ticker.in_(stored),
+                    RiskMetrics.window_days == window,
+                    RiskMetrics.as_of_date < as_of
+                ))
+            db.session.commit()
+            written += len(stored)
+    return written
+
+
+def get_precomputed_risk_assessments(tickers, start_date, end_date):
+    """
+    Get formatted risk assessments from the risk_metrics table
+    Must be called inside a Flask application context
+
+    Parameters:
+    tickers (list): stock codes
+    start_date (datetime): start of the requested range
+    end_date (datetime): end of the requested range
+
+    Returns:
+    dict: {stock code: risk assessment}, only for tickers with a snapshot matching the range
+    """
+    span = (end_date - start_date).days
+    window = next(
+        (days for days in RISK_SNAPSHOT_WINDOWS if abs(span - days) <= WINDOW_TOLERANCE_DAYS), None
+    )
+    if window is None or not tickers:
+        return {}
+
+    # The range must end at the latest market data (allowing for weekends and holidays)
+    as_of_dates = {
+        ticker: quote.date.date()
+        for ticker, quote in get_latest_quotes(tickers).items()
+        if 0 <= (end_date.date() - quote.date.date()).days <= GAP_TOLERANCE_DAYS
+    }
+    if not as_of_dates:
+        return {}
+
+    rows = RiskMetrics.query.filter(
+        RiskMetrics.ticker.in_(list(as_of_dates)),
+        RiskMetrics.window_days == window
+    ).all()
+    return {
+        row.ticker: _format_risk_assessment(row.to_metrics())
+        for row in rows
+        if row.as_of_date == as_of_dates[row.ticker]
+    }
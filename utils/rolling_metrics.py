@@ -0,0 +1,308 @@
+"""
+Rolling risk metrics module
+Incrementally maintained 20/60/252-day risk metrics for charts
+
+Each ticker keeps running moments per window (sum and sum of squares of returns,
+sums of benchmark returns and of stock x benchmark products for the covariance,
+and a monotonic queue for the running maximum price), so a new daily bar updates
+every window in O(1) and history is only read once per process
+"""
+import math
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from collections import deque
+from datetime import datetime, timedelta
+from flask import has_app_context
+from config import HISTORY_CACHE_TTL
+from utils.latest_quote import get_latest_quotes
+from utils.price_history import get_price_histories
+
+# Window lengths (trading days) kept for every ticker
+ROLLING_WINDOWS = (20, 60, 252)
+
+# Calendar days of history loaded when a ticker is first requested
+ROLLING_LOOKBACK_DAYS = 365 * 3
+
+# Trading days per year used for annualization
+TRADING_DAYS = 252
+
+# One-sided 95% quantile of the standard normal distribution (parametric VaR)
+Z_95 = 1.6448536269514722
+
+# Metrics of each point of a rolling series
+ROLLING_METRICS = ('volatility', 'sharpe_ratio', 'var_95', 'drawdown', 'beta')
+
+
+class RollingWindow:
+    """
+    Running moments of the last `size` daily returns
+    """
+    def __init__(self, size):
+        self.size = size
+        self._returns = deque()  # (stock return, benchmark return or None)
+        self._peaks = deque()  # (position, close), closes decreasing: front is the window maximum
+        self._position = 0
+        self.sum = 0.0
+        self.sum_sq = 0.0
+        self.pair_count = 0
+        self.pair_sum = 0.0
+        self.benchmark_sum = 0.0
+        self.benchmark_sum_sq = 0.0
+        self.product_sum = 0.0
+        self.close = None
+
+    def push(self, close, stock_return=None, benchmark_return=None):
+        """
+        Add one daily bar, dropping the bar that leaves the window
+
+        Parameters:
+        close (float): closing price
+        stock_return (float): return since the previous close, None for the first bar
+        benchmark_return (float): benchmark return on the same date, None if unavailable
+        """
+        self.close = close
+        while self._peaks and self._peaks[-1][1] <= close:
+            self._peaks.pop()
+        self._peaks.append((self._position, close))
+        if self._peaks[0][0] <= self._position - self.size:
+            self._peaks.popleft()
+        self._position += 1
+
+        if stock_return is None:
+            return
+        self._returns.append((stock_return, benchmark_return))
+        self._add(stock_return, benchmark_return, 1)
+        if len(self._returns) > self.size:
+            self._add(*self._returns.popleft(), -1)
+
+    def _add(self, stock_return, benchmark_return, sign):
+        """Add (sign=1) or remove (sign=-1) one return from the running sums"""
+        self.sum += sign * stock_return
+        self.sum_sq += sign * stock_return * stock_return
+        if benchmark_return is not None:
+            self.pair_count += sign
+            self.pair_sum += sign * stock_return
+            self.benchmark_sum += sign * benchmark_return
+            self.benchmark_sum_sq += sign * benchmark_return * benchmark_return
+            self.product_sum += sign * stock_return * benchmark_return
+
+    def metrics(self):
+        """
+        Metrics of the current window
+
+        Returns:
+        dict: annualized volatility, Sharpe ratio, parametric daily 95% VaR, drawdown from the
+            window high and beta (None without enough benchmark data); None until the window is full
+        """
+        n = len(self._returns)
+        if n < self.size or n < 2:
+            return None
+        mean = self.sum / n
+        # Rounding in the running sums can leave a tiny negative variance for flat prices
+        std = math.sqrt(max(self.sum_sq - self.sum * mean, 0.0) / (n - 1))
+
+        beta = None
+        m = self.pair_count
+        if m >= 2:
+            benchmark_variance = self.benchmark_sum_sq - self.benchmark_sum * self.benchmark_sum / m
+            if benchmark_variance > 1e-12:
+                covariance = self.product_sum - self.pair_sum * self.benchmark_sum / m
+                beta = covariance / benchmark_variance
+
+        return {
+            'volatility': std * math.sqrt(TRADING_DAYS),
+            'sharpe_ratio': mean / std * math.sqrt(TRADING_DAYS) if std > 0 else 0.0,
+            'var_95': mean - Z_95 * std,
+            'drawdown': self.close / self._peaks[0][1] - 1,
+            'beta': beta,
+        }
+
+
+class RollingRiskState:
+    """
+    Rolling windows and metric series of one ticker
+    """
+    def __init__(self, windows=ROLLING_WINDOWS, keep_returns=None):
+        """
+        Parameters:
+        windows (iterable): window lengths
+        keep_returns (int): number of most recent returns kept for benchmark lookups,
+            default the longest window
+        """
+        self.windows = {size: RollingWindow(size) for size in windows}
+        self.series = {size: {'date': [], **{name: [] for name in ROLLING_METRICS}} for size in windows}
+        self.returns = {}  # date -> return, looked up when this ticker is the benchmark
+        self.keep_returns = keep_returns or max(self.windows)
+        self.last_date = None
+        self.last_close = None
+        self.checked_at = 0.0
+
+    def push(self, date, close, benchmark_returns=None):
+        """
+        Add one daily bar and append the new point of every full window
+
+        Parameters:
+        date (str): bar date, format 'YYYY-MM-DD', bars at or before the last date are ignored
+        close (float): closing price
+        benchmark_returns (dict): {date: benchmark return}, None if there is no benchmark
+        """
+        if self.last_date is not None and date <= self.last_date:
+            return
+        stock_return = None
+        if self.last_close:
+            stock_return = close / self.last_close - 1
+            self.returns[date] = stock_return
+            # Dates arrive in order, so the first key is the oldest return
+            if len(self.returns) > self.keep_returns:
+                del self.returns[next(iter(self.returns))]
+        benchmark_return = benchmark_returns.get(date) if benchmark_returns else None
+        self.last_date, self.last_close = date, close
+
+        for size, window in self.windows.items():
+            window.push(close, stock_return, benchmark_return)
+            metrics = window.metrics()
+            if metrics is None:
+                continue
+            series = self.series[size]
+            series['date'].append(date)
+            for name in ROLLING_METRICS:
+                series[name].append(metrics[name])
+
+    def snapshot(self, windows, start=None, end=None):
+        """Copy of the series of the given windows between start and end (inclusive)"""
+        result = {}
+        for size in windows:
+            series = self.series[size]
+            lo = bisect_left(series['date'], start) if start else 0
+            hi = bisect_right(series['date'], end) if end else len(series['date'])
+            result[size] = {name: values[lo:hi] for name, values in series.items()}
+        return result
+
+
+class RollingMetricsStore:
+    """
+    Process-wide rolling metrics of all requested tickers
+
+    The first request of a ticker loads its history once; later requests only read bars
+    newer than the last processed date, and only when latest_quote shows a newer bar in
+    market_data (tickers not stored in market_data are re-checked after refresh_interval)
+    """
+    def __init__(self, benchmark_ticker="^GSPC", provider=None, refresh_interval=HISTORY_CACHE_TTL,
+                 lookback_days=ROLLING_LOOKBACK_DAYS):
+        """
+        Parameters:
+        benchmark_ticker (str): benchmark index used for beta
+        provider (PriceHistoryProvider): price history source, default reads market_data with yfinance fallback
+        refresh_interval (float): seconds between checks for tickers not stored in market_data
+        lookback_days (int): calendar days of history loaded for a new ticker
+        """
+        self.benchmark_ticker = benchmark_ticker
+        self.provider = provider
+        self.refresh_interval = refresh_interval
+        self.lookback_days = lookback_days
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def get_series(self, tickers, windows=ROLLING_WINDOWS, start=None, end=None):
+        """
+        Get rolling metric series, reading only the bars added since the last call
+
+        Parameters:
+        tickers (list): stock codes
+        windows (iterable): window lengths, subset of ROLLING_WINDOWS
+        start (str): first date of the series, format 'YYYY-MM-DD', None means all
+        end (str): last date of the series, format 'YYYY-MM-DD', None means all
+
+        Returns:
+        dict: {ticker: {window: {'date': [...], 'volatility': [...], ...}}}, tickers without data are omitted
+        """
+        windows = list(windows)
+        unknown = [size for size in windows if size not in ROLLING_WINDOWS]
+        if unknown:
+            raise ValueError(f"Unsupported rolling windows: {unknown}, available: {list(ROLLING_WINDOWS)}")
+        tickers = list(dict.fromkeys(tickers))
+        with self._lock:
+            self._refresh(tickers)
+            return {
+                ticker: self._states[ticker].snapshot(windows, start, end)
+                for ticker in tickers
+                if ticker in self._states and self._states[ticker].last_date is not None
+            }
+
+    def clear(self):
+        """Drop all rolling state"""
+        with self._lock:
+            self._states.clear()
+
+    def _refresh(self, tickers):
+        """
+        Push the new bars of stale tickers, the benchmark first so its returns are known
+        Bars of a ticker after the benchmark's last date are held back (not pushed) and read
+        again on a later refresh, so no bar is pushed without its benchmark return
+        """
+        names = list(dict.fromkeys([self.benchmark_ticker] + tickers))
+        quotes = get_latest_quotes(names) if has_app_context() else {}
+        now = time.monotonic()
+
+        # Tickers with the same first missing date are fetched in one batch
+        batches = {}
+        for ticker in names:
+            state = self._states.get(ticker)
+            if state is None or state.last_date is None:
+                if state is not None and now - state.checked_at < self.refresh_interval:
+                    continue
+                start = (datetime.now() - timedelta(days=self.lookback_days)).strftime('%Y-%m-%d')
+            elif not self._is_stale(state, quotes.get(ticker), now):
+                continue
+            else:
+                start = (datetime.strptime(state.last_date, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+            batches.setdefault(start, []).append(ticker)
+
+        histories = {}
+        for start, batch in batches.items():
+            histories.update(get_price_histories(batch, start=start, provider=self.provider))
+
+        benchmark = self._states.get(self.benchmark_ticker)
+        for ticker in names:
+            if ticker not in histories:
+                continue
+            state = self._states.get(ticker)
+            if state is None:
+                # The benchmark keeps returns for the whole lookback, so tickers loaded later get beta
+                # over their full history
+                keep_returns = self.lookback_days if ticker == self.benchmark_ticker else None
+                state = self._states[ticker] = RollingRiskState(keep_returns=keep_returns)
+            state.checked_at = now
+            frame = histories[ticker]
+            if frame is None or frame.empty:
+                continue
+            if ticker == self.benchmark_ticker:
+                benchmark = state
+            benchmark_returns = benchmark.returns if benchmark is not None and benchmark is not state else None
+            # Without any benchmark data every bar is pushed (beta stays None)
+            hold_after = benchmark.last_date if benchmark_returns is not None else None
+            for date, close in frame['Close'].dropna().items():
+                date = date.strftime('%Y-%m-%d')
+                if hold_after is not None and date > hold_after:
+                    break
+                state.push(date, float(close), benchmark_returns)
+
+    def _is_stale(self, state, quote, now):
+        """Whether a ticker may have bars newer than its last processed date"""
+        if quote is not None and state.last_date is not None:
+            return quote.date.strftime('%Y-%m-%d') > state.last_date
+        return now - state.checked_at >= self.refresh_interval
+
+
+# Process-wide stores, one per benchmark
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_rolling_metrics_store(benchmark_ticker="^GSPC"):
+    """Return the process-wide rolling metrics store of a benchmark"""
+    with _stores_lock:
+        if benchmark_ticker not in _stores:
+            _stores[benchmark_ticker] = RollingMetricsStore(benchmark_ticker)
+        return _stores[benchmark_ticker]
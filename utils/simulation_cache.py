@@ -0,0 +1,87 @@
+"""
+Monte Carlo result cache module
+Process-wide cache of simulation results, so reloading a chart or many users viewing
+the same stock do not re-run an identical simulation
+
+Features:
+1. Entries are keyed by the simulation parameters and the as-of date of the input history
+2. Least recently used entries are evicted once the cached results exceed a memory bound
+3. Entries of a ticker are dropped when market_data rows of that ticker are committed
+"""
+import sys
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from models import MarketData
+from utils.history_cache import HistoryCache
+from config import MONTE_CARLO_CACHE_TTL, MONTE_CARLO_CACHE_MAX_BYTES
+
+# Session info key of the tickers whose market data changed in the current transaction
+_CHANGED_TICKERS_KEY = 'simulation_cache_tickers'
+
+# Memory of one float inside a list (float object + list slot)
+_FLOAT_BYTES = sys.getsizeof(0.0) + 8
+
+
+def _result_nbytes(value):
+    """Approximate memory used by a JSON-like result (dicts, lists, floats, strings)"""
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_result_nbytes(key) + _result_nbytes(item) for key, item in value.items())
+    if isinstance(value, list):
+        if value and isinstance(value[0], float):
+            return sys.getsizeof(value) + len(value) * _FLOAT_BYTES
+        return sys.getsizeof(value) + sum(_result_nbytes(item) for item in value)
+    return sys.getsizeof(value)
+
+
+class SimulationCache(HistoryCache):
+    """
+    TTL + LRU cache of simulation result dicts bounded by their approximate memory
+    Keys are tuples whose first element is the ticker
+    """
+    def __init__(self, ttl=MONTE_CARLO_CACHE_TTL, max_bytes=MONTE_CARLO_CACHE_MAX_BYTES):
+        super().__init__(ttl=ttl, max_bytes=max_bytes)
+
+    def invalidate_tickers(self, tickers):
+        """
+        Remove the results of the given tickers
+
+        Returns:
+        int: number of removed entries
+        """
+        tickers = set(tickers)
+        return self.invalidate(lambda key: key[0] in tickers)
+
+    def _cacheable(self, value):
+        return bool(value)
+
+    def _nbytes(self, value):
+        return _result_nbytes(value)
+
+
+# Process-wide cache instance
+simulation_cache = SimulationCache()
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changed_tickers(session, flush_context):
+    """Record the tickers whose market_data rows were added, changed or deleted"""
+    tickers = {
+        obj.ticker for obj in list(session.new) + list(session.dirty) + list(session.deleted)
+        if isinstance(obj, MarketData)
+    }
+    if tickers:
+        session.info.setdefault(_CHANGED_TICKERS_KEY, set()).update(tickers)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_after_commit(session):
+    """Drop cached results of changed tickers once the new data is committed"""
+    tickers = session.info.pop(_CHANGED_TICKERS_KEY, None)
+    if tickers:
+        simulation_cache.invalidate_tickers(tickers)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _clear_after_rollback(session):
+    """Forget the changed tickers of a rolled back transaction"""
+    session.info.pop(_CHANGED_TICKERS_KEY, None)
@@ -0,0 +1,185 @@
+"""
+Simulation models module
+Price path generators used by the Monte Carlo simulation
+
+Models:
+1. GBM: constant drift and volatility (geometric Brownian motion)
+2. Bootstrap: daily log returns resampled with replacement from history
+3. GARCH(1,1): volatility that reacts to the simulated shocks, fitted to history
+4. Correlated multi-ticker paths from a Cholesky factor of the returns covariance
+   (or bootstrapped whole days of history, which keeps the cross-ticker dependence)
+
+Fillers write into a preallocated (simulations, days) array so callers can simulate
+everything at once or batch by batch with the same random stream
+"""
+import numpy as np
+
+# Search grids of the GARCH(1,1) fit (alpha = reaction to shocks, persistence = alpha + beta)
+GARCH_ALPHA_GRID = np.linspace(0.01, 0.30, 30)
+GARCH_PERSISTENCE_GRID = np.linspace(0.50, 0.995, 45)
+
+
+def fill_gbm_paths(rng, paths, current_price, mu, sigma):
+    """
+    Fill a preallocated (simulations, days) array with geometric Brownian motion price paths
+
+    Parameters:
+        rng (Generator): random generator
+        paths (ndarray): C-contiguous output array, its dtype sets the precision
+        current_price (float): price on the first day of every path
+        mu (float): mean daily log return
+        sigma (float): daily volatility of log returns
+
+    Returns:
+        ndarray: paths, filled in place
+    """
+    # Daily log returns: (mu - sigma^2 / 2) * dt + sigma * sqrt(dt) * Z, with dt = 1 day
+    # (the generator can only fill a contiguous array, so the first column is drawn and then reset)
+    rng.standard_normal(out=paths, dtype=paths.dtype.type)
+    paths *= sigma
+    paths += mu - 0.5 * sigma ** 2
+    return _log_returns_to_prices(paths, current_price)
+
+
+def fill_bootstrap_paths(rng, paths, current_price, log_returns):
+    """
+    Fill a preallocated (simulations, days) array with paths of resampled historical log returns
+
+    Parameters:
+        rng (Generator): random generator
+        paths (ndarray): output array
+        current_price (float): price on the first day of every path
+        log_returns (ndarray): historical daily log returns
+
+    Returns:
+        ndarray: paths, filled in place
+    """
+    log_returns = np.asarray(log_returns, dtype=paths.dtype)
+    np.take(log_returns, rng.integers(0, len(log_returns), size=paths.shape), out=paths)
+    return _log_returns_to_prices(paths, current_price)
+
+
+def fill_garch_paths(rng, paths, current_price, garch):
+    """
+    Fill a preallocated (simulations, days) array with GARCH(1,1) price paths
+    All shocks are drawn at once; the variance recursion runs over days, vectorized over paths
+
+    Parameters:
+        rng (Generator): random generator
+        paths (ndarray): C-contiguous output array
+        current_price (float): price on the first day of every path
+        garch (dict): parameters returned by fit_garch
+
+    Returns:
+        ndarray: paths, filled in place
+    """
+    rng.standard_normal(out=paths, dtype=paths.dtype.type)
+    omega, alpha, beta = garch['omega'], garch['alpha'], garch['beta']
+    # Variance of the first simulated day, from the last fitted shock and variance
+    variance = np.full(paths.shape[0], omega + alpha * garch['last_residual'] ** 2 + beta * garch['last_variance'])
+    for t in range(1, paths.shape[1]):
+        shock = np.sqrt(variance) * paths[:, t]
+        paths[:, t] = garch['mu'] + shock
+        variance = omega + alpha * shock ** 2 + beta * variance
+    return _log_returns_to_prices(paths, current_price)
+
+
+def _log_returns_to_prices(paths, current_price):
+    """Turn daily log returns (first column ignored) into prices, in place"""
+    paths[:, 0] = 0.0
+    np.cumsum(paths, axis=1, out=paths)
+    np.exp(paths, out=paths)
+    paths *= current_price
+    return paths
+
+
+def _garch_log_likelihood(residuals, omega, alpha, beta):
+    """
+    Gaussian log-likelihood of GARCH(1,1) for arrays of candidate parameters
+
+    Returns:
+        tuple: (log-likelihood per candidate, last conditional variance per candidate)
+    """
+    variance = np.full(np.shape(omega), residuals.var())
+    log_likelihood = np.zeros(np.shape(omega))
+    for residual in residuals:
+        log_likelihood -= 0.5 * (np.log(variance) + residual ** 2 / variance)
+        variance = omega + alpha * residual ** 2 + beta * variance
+    return log_likelihood, variance
+
+
+def fit_garch(log_returns):
+    """
+    Fit GARCH(1,1) to daily log returns by maximum likelihood
+    The long-run variance is targeted to the sample variance and (alpha, beta) are
+    chosen on a grid, evaluating all candidates in one vectorized recursion
+
+    Parameters:
+        log_returns (ndarray): historical daily log returns
+
+    Returns:
+        dict: mu, omega, alpha, beta, plus last_variance and last_residual of the fitted recursion
+    """
+    log_returns = np.asarray(log_returns, dtype=float)
+    if len(log_returns) < 30:
+        raise ValueError("At least 30 daily returns are required to fit GARCH(1,1)")
+    mu = log_returns.mean()
+    residuals = log_returns - mu
+    sample_variance = residuals.var()
+
+    alpha, persistence = np.meshgrid(GARCH_ALPHA_GRID, GARCH_PERSISTENCE_GRID)
+    valid = alpha < persistence
+    alpha, persistence = alpha[valid], persistence[valid]
+    beta = persistence - alpha
+    omega = sample_variance * (1 - persistence)
+
+    log_likelihood, last_variance = _garch_log_likelihood(residuals, omega, alpha, beta)
+    best = int(np.argmax(log_likelihood))
+    return {
+        'mu': float(mu),
+        'omega': float(omega[best]),
+        'alpha': float(alpha[best]),
+        'beta': float(beta[best]),
+        'last_variance': float(last_variance[best]),
+        'last_residual': float(residuals[-1]),
+    }
+
+
+def simulate_correlated_paths(current_prices, log_returns, days, simulations, dtype=np.float64, seed=None,
+                              bootstrap=False):
+    """
+    Simulate correlated price paths of several tickers in one vectorized batch
+
+    Parameters:
+        current_prices (ndarray): price of each ticker on the first day
+        log_returns (ndarray): historical daily log returns on common dates, shape (history days, tickers)
+        days (int): number of days in each path, including the first day
+        simulations (int): number of paths
+        dtype: np.float64 or np.float32
+        seed (int): seed of the random generator
+        bootstrap (bool): resample whole historical days instead of drawing correlated normal shocks
+
+    Returns:
+        ndarray: price paths, shape (simulations, days, tickers)
+    """
+    rng = np.random.default_rng(seed)
+    log_returns = np.asarray(log_returns, dtype=float)
+    tickers = log_returns.shape[1]
+    if bootstrap:
+        # Each simulated day is one historical day for all tickers, keeping their joint moves
+        paths = log_returns.astype(dtype)[rng.integers(0, len(log_returns), size=(simulations, days))]
+    else:
+        mean = log_returns.mean(axis=0)
+        covariance = np.atleast_2d(np.cov(log_returns, rowvar=False))
+        # Tiny ridge so that perfectly collinear tickers still have a Cholesky factor
+        factor = np.linalg.cholesky(covariance + np.eye(tickers) * 1e-12)
+        shocks = np.empty((simulations, days, tickers), dtype=dtype)
+        rng.standard_normal(out=shocks, dtype=shocks.dtype.type)
+        paths = np.matmul(shocks, factor.T.astype(dtype), out=shocks)
+        paths += (mean - 0.5 * np.diag(covariance)).astype(dtype)
+
+    paths[:, 0, :] = 0.0
+    np.cumsum(paths, axis=1, out=paths)
+    np.exp(paths, out=paths)
+    paths *= np.asarray(current_prices, dtype=dtype)
+    return paths
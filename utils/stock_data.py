@@ -1,180 +1,463 @@
 """
 Stock data collection module
 Use Yahoo Finance API to get and store financial data of major tech stocks
+Market data is loaded incrementally: only bars from the latest stored date onwards are
+fetched and upserted, so a refresh keeps the ORM-defined tables and writes a few rows per ticker.
+Prices are split and dividend adjusted; when the new bars include a dividend or split, the
+ticker's full history is fetched again so the earlier stored bars are re-adjusted too
 """
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import yfinance as yf
 import pandas as pd
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, select, insert, delete
 from datetime import datetime
-from config import DB_CONFIG, TECH_TICKERS
+from config import (
+    DB_CONFIG, TECH_TICKERS, STOCK_HISTORY_START, STOCK_FETCH_MAX_WORKERS, STOCK_FETCH_RATE, STOCK_FETCH_RETRIES,
+    STOCK_FETCH_BACKOFF
+)
+from models import MarketData, LatestQuote, FundamentalData, BalanceSheet, IncomeStatement, IngestionCheckpoint
+from utils.latest_quote import refresh_latest_quotes
+from utils.order_events import notify_order_processor
+from utils.simulation_cache import simulation_cache
+from utils.data_loader import get_latest_dates, upsert_frame, reload_table
 
-def fetch_stock_data():
+# Tables written by save_to_database, created from the models if missing
+STOCK_DATA_TABLES = [MarketData.__table__, LatestQuote.__table__, FundamentalData.__table__,
+                     BalanceSheet.__table__, IncomeStatement.__table__]
+
+def _create_engine():
+    """Create an engine of the MySQL database from DB_CONFIG"""
+    connection_string = f"mysql+mysqlconnector://{DB_CONFIG['user']}:{DB_CONFIG['password']}@{DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['database']}?charset=utf8mb4"
+    return create_engine(connection_string, echo=False)
+
+def get_fetch_start_dates(engine, tickers=TECH_TICKERS):
+    """
+    Get the first date to fetch for each ticker
+    Stored tickers restart from their latest stored date (inclusive, so a bar saved before
+    the close is corrected by the upsert); other tickers start from STOCK_HISTORY_START
+    
+    Parameters:
+        engine (Engine): database engine
+        tickers (list): stock codes
+        
+    Returns:
+        dict: {ticker: 'YYYY-MM-DD'}
+    """
+    MarketData.__table__.create(engine, checkfirst=True)
+    with engine.connect() as connection:
+        latest_dates = get_latest_dates(connection, tickers=tickers)
+    return {
+        ticker: latest_dates[ticker].strftime('%Y-%m-%d') if ticker in latest_dates else STOCK_HISTORY_START
+        for ticker in tickers
+    }
+
+class RateLimiter:
+    """
+    Space calls evenly so that at most `rate` calls per second start, across all threads
+    """
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._lock = threading.Lock()
+        self._next_time = time.monotonic()
+    
+    def acquire(self):
+        """Block until the next call may start"""
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_time - now
+            self._next_time = max(now, self._next_time) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+def _call_with_retry(func, limiter, description, retries=STOCK_FETCH_RETRIES, backoff=STOCK_FETCH_BACKOFF):
+    """
+    Call func under the rate limiter, retrying failures with exponential backoff and jitter
+    
+    Parameters:
+        func (callable): call without arguments
+        limiter (RateLimiter): shared rate limiter
+        description (str): name of the call for log messages
+        retries (int): retries after the first failure
+        backoff (float): delay before the first retry (seconds), doubled for each further retry
+    """
+    for attempt in range(retries + 1):
+        limiter.acquire()
+        try:
+            return func()
+        except Exception as e:
+            if attempt == retries:
+                raise
+            delay = backoff * 2 ** attempt * (1 + random.random())
+            print(f"{description} failed ({str(e)}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+def _make_call(rate, retries, backoff):
+    """Return call(func, description) running yfinance calls under one shared rate limiter, with retries"""
+    limiter = RateLimiter(rate)
+    
+    def call(func, description):
+        return _call_with_retry(func, limiter, description, retries=retries, backoff=backoff)
+    return call
+
+def _has_corporate_action(hist):
+    """Whether a Ticker.history frame contains a dividend or a stock split"""
+    return any(
+        column in hist.columns and (hist[column].fillna(0) != 0).any()
+        for column in ('Dividends', 'Stock Splits')
+    )
+
+def _fetch_ticker(ticker, start, current_time, call):
+    """
+    Get the data of one stock
+    
+    Parameters:
+        ticker (str): stock code
+        start (str): first date of market data to fetch, 'YYYY-MM-DD'
+        current_time (datetime): data acquisition timestamp
+        call (callable): call(func, description) running one yfinance call with rate limiting and retries
+        
+    Returns:
+        tuple: (market data DataFrame, fundamental row, balance sheet row, income statement row),
+            rows are None when unavailable; None if the stock has no historical data at all
+    """
+    stock = yf.Ticker(ticker)
+    
+    def fetch(attribute, *args, **kwargs):
+        value = getattr(stock, attribute)
+        return value(*args, **kwargs) if callable(value) else value
+    
+    # Get historical price data (only bars not stored yet), split and dividend adjusted
+    hist = call(lambda: fetch('history', start=start, auto_adjust=True), f"{ticker} history")
+    if start != STOCK_HISTORY_START and _has_corporate_action(hist):
+        # A dividend or split re-adjusts every earlier bar, so the stored history is replaced
+        # with a full fetch instead of only appending the new bars
+        print(f"Corporate action found for {ticker}, fetching its full history")
+        hist = call(lambda: fetch('history', start=STOCK_HISTORY_START, auto_adjust=True), f"{ticker} full history")
+    if hist.empty and start == STOCK_HISTORY_START:
+        print(f"Warning: Unable to get historical data for {ticker}")
+        return None
+    
+    # Get financial data
+    info = call(lambda: fetch('info'), f"{ticker} info")
+    financials = call(lambda: fetch('financials'), f"{ticker} financials")
+    balance_sheet = call(lambda: fetch('balance_sheet'), f"{ticker} balance sheet")
+    cash_flow = call(lambda: fetch('cashflow'), f"{ticker} cash flow")
+    
+    # Market data table (OHLCV)
+    ticker_market_data = pd.DataFrame({
+        'ticker': ticker,
+        'date': hist.index,
+        'open': hist['Open'],
+        'high': hist['High'],
+        'low': hist['Low'],
+        'close': hist['Close'],
+        'volume': hist['Volume'],
+        'data_collected_at': current_time
+    })
+    
+    # Fundamental data table
+    fundamental_row = {
+        'ticker': ticker,
+        'date': current_time,
+        'market_cap': info.get('marketCap', None),
+        'pe_ratio': info.get('trailingPE', None),
+        'pb_ratio': info.get('priceToBook', None),
+        'dividend_yield': info.get('dividendYield', None),
+        'data_collected_at': current_time
+    }
+    
+    # Add income and net income data (if available)
+    if not financials.empty and 'Total Revenue' in financials.index:
+        fundamental_row['revenue'] = financials.loc['Total Revenue'].values[0]
+    else:
+        fundamental_row['revenue'] = None
+        
+    if not financials.empty and 'Net Income' in financials.index:
+        fundamental_row['net_income'] = financials.loc['Net Income'].values[0]
+    else:
+        fundamental_row['net_income'] = None
+        
+    if not cash_flow.empty and 'Operating Cash Flow' in cash_flow.index:
+        fundamental_row['operating_cash_flow'] = cash_flow.loc['Operating Cash Flow'].values[0]
+    else:
+        fundamental_row['operating_cash_flow'] = None
+    
+    # Balance sheet data
+    balance_sheet_row = None
+    if not balance_sheet.empty:
+        balance_sheet_row = {
+            'ticker': ticker,
+            'date': balance_sheet.columns[0] if len(balance_sheet.columns) > 0 else current_time,
+            'current_assets': balance_sheet.loc['Total Current Assets'].values[0] if 'Total Current Assets' in balance_sheet.index else None,
+            'non_current_assets': balance_sheet.loc['Total Non Current Assets'].values[0] if 'Total Non Current Assets' in balance_sheet.index else None,
+            'current_liabilities': balance_sheet.loc['Total Current Liabilities'].values[0] if 'Total Current Liabilities' in balance_sheet.index else None,
+            'non_current_liabilities': balance_sheet.loc['Total Non Current Liabilities'].values[0] if 'Total Non Current Liabilities' in balance_sheet.index else None,
+            'data_collected_at': current_time
+        }
+    
+    # Income statement data
+    income_statement_row = None
+    if not financials.empty:
+        income_statement_row = {
+            'ticker': ticker,
+            'date': financials.columns[0] if len(financials.columns) > 0 else current_time,
+            'revenue': financials.loc['Total Revenue'].values[0] if 'Total Revenue' in financials.index else None,
+            'cost_of_revenue': financials.loc['Cost Of Revenue'].values[0] if 'Cost Of Revenue' in financials.index else None,
+            'operating_income': financials.loc['Operating Income'].values[0] if 'Operating Income' in financials.index else None,
+            'income_before_tax': financials.loc['Income Before Tax'].values[0] if 'Income Before Tax' in financials.index else None,
+            'net_income': financials.loc['Net Income'].values[0] if 'Net Income' in financials.index else None,
+            'data_collected_at': current_time
+        }
+    
+    return ticker_market_data, fundamental_row, balance_sheet_row, income_statement_row
+
+def fetch_stock_data(tickers=TECH_TICKERS, start_dates=None, max_workers=STOCK_FETCH_MAX_WORKERS,
+                     rate=STOCK_FETCH_RATE, retries=STOCK_FETCH_RETRIES, backoff=STOCK_FETCH_BACKOFF):
     """
     Get all stock codes data and organize it into structured DataFrames
+    Tickers are fetched concurrently on a bounded worker pool; all yfinance calls share one
+    rate limiter and failed calls are retried with backoff. Per-ticker results are collected
+    in lists and concatenated once at the end
+    
+    Parameters:
+        tickers (list): stock codes, default TECH_TICKERS
+        start_dates (dict): {ticker: 'YYYY-MM-DD'} first date of market data to fetch,
+            tickers not in it start from STOCK_HISTORY_START
+        max_workers (int): maximum number of tickers fetched at the same time
+        rate (float): maximum yfinance calls started per second, across all workers
+        retries (int): retries of a failed yfinance call
+        backoff (float): delay before the first retry (seconds), doubled for each further retry
     
     Returns:
         tuple: Four DataFrames,It includes market data, fundamental data, 
         balance sheet data and income statement data respectively
     """
-    # Create empty DataFrames to store different types of data
-    market_data = pd.DataFrame()
-    fundamental_data = pd.DataFrame()
-    balance_sheet_data = pd.DataFrame()
-    income_statement_data = pd.DataFrame()
-    
     # Get current time as data acquisition timestamp
     current_time = datetime.now()
+    start_dates = start_dates or {}
+    call = _make_call(rate, retries, backoff)
     
-    for ticker in TECH_TICKERS:
-        print(f"Getting data for {ticker}...")
-        
-        try:
-            # Get stock information
-            stock = yf.Ticker(ticker)
-            
-            # Get historical price data (from 2018)
-            hist = stock.history(start="2018-01-01")
-            if hist.empty:
-                print(f"Warning: Unable to get historical data for {ticker}")
+    market_frames, fundamental_rows, balance_sheet_rows, income_statement_rows = [], [], [], []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(tickers)))) as executor:
+        futures = {
+            executor.submit(_fetch_ticker, ticker, start_dates.get(ticker, STOCK_HISTORY_START), current_time,
+                            call): ticker
+            for ticker in tickers
+        }
+        # Collect in ticker order so the output does not depend on completion order
+        for future, ticker in futures.items():
+            print(f"Getting data for {ticker}...")
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"Error getting data for {ticker}: {str(e)}")
                 continue
-            
-            # Get financial data
-            info = stock.info
-            financials = stock.financials
-            balance_sheet = stock.balance_sheet
-            cash_flow = stock.cashflow
-            
-            # Market data table (OHLCV)
-            ticker_market_data = pd.DataFrame({
-                'ticker': ticker,
-                'date': hist.index,
-                'open': hist['Open'],
-                'high': hist['High'],
-                'low': hist['Low'],
-                'close': hist['Close'],
-                'volume': hist['Volume'],
-                'data_collected_at': current_time
-            })
-            market_data = pd.concat([market_data, ticker_market_data], ignore_index=True)
-            
-            # Fundamental data table
-            fundamental_row = {
-                'ticker': ticker,
-                'date': current_time,
-                'market_cap': info.get('marketCap', None),
-                'pe_ratio': info.get('trailingPE', None),
-                'pb_ratio': info.get('priceToBook', None),
-                'dividend_yield': info.get('dividendYield', None),
-                'data_collected_at': current_time
-            }
-            
-            # Add income and net income data (if available)
-            if not financials.empty and 'Total Revenue' in financials.index:
-                fundamental_row['revenue'] = financials.loc['Total Revenue'].values[0]
-            else:
-                fundamental_row['revenue'] = None
-                
-            if not financials.empty and 'Net Income' in financials.index:
-                fundamental_row['net_income'] = financials.loc['Net Income'].values[0]
-            else:
-                fundamental_row['net_income'] = None
-                
-            if not cash_flow.empty and 'Operating Cash Flow' in cash_flow.index:
-                fundamental_row['operating_cash_flow'] = cash_flow.loc['Operating Cash Flow'].values[0]
-            else:
-                fundamental_row['operating_cash_flow'] = None
-                
-            fundamental_data = pd.concat([fundamental_data, pd.DataFrame([fundamental_row])], ignore_index=True)
-            
-            # Balance sheet data
-            if not balance_sheet.empty:
-                balance_sheet_row = {
-                    'ticker': ticker,
-                    'date': balance_sheet.columns[0] if len(balance_sheet.columns) > 0 else current_time,
-                    'current_assets': balance_sheet.loc['Total Current Assets'].values[0] if 'Total Current Assets' in balance_sheet.index else None,
-                    'non_current_assets': balance_sheet.loc['Total Non Current Assets'].values[0] if 'Total Non Current Assets' in balance_sheet.index else None,
-                    'current_liabilities': balance_sheet.loc['Total Current Liabilities'].values[0] if 'Total Current Liabilities' in balance_sheet.index else None,
-                    'non_current_liabilities': balance_sheet.loc['Total Non Current Liabilities'].values[0] if 'Total Non Current Liabilities' in balance_sheet.index else None,
-                    'data_collected_at': current_time
-                }
-                balance_sheet_data = pd.concat([balance_sheet_data, pd.DataFrame([balance_sheet_row])], ignore_index=True)
-            
-            # Income statement data
-            if not financials.empty:
-                income_statement_row = {
-                    'ticker': ticker,
-                    'date': financials.columns[0] if len(financials.columns) > 0 else current_time,
-                    'revenue': financials.loc['Total Revenue'].values[0] if 'Total Revenue' in financials.index else None,
-                    'cost_of_revenue': financials.loc['Cost Of Revenue'].values[0] if 'Cost Of Revenue' in financials.index else None,
-                    'operating_income': financials.loc['Operating Income'].values[0] if 'Operating Income' in financials.index else None,
-                    'income_before_tax': financials.loc['Income Before Tax'].values[0] if 'Income Before Tax' in financials.index else None,
-                    'net_income': financials.loc['Net Income'].values[0] if 'Net Income' in financials.index else None,
-                    'data_collected_at': current_time
-                }
-                income_statement_data = pd.concat([income_statement_data, pd.DataFrame([income_statement_row])], ignore_index=True)
-        
-        except Exception as e:
-            print(f"Error getting data for {ticker}: {str(e)}")
+            if result is None:
+                continue
+            ticker_market_data, fundamental_row, balance_sheet_row, income_statement_row = result
+            market_frames.append(ticker_market_data)
+            fundamental_rows.append(fundamental_row)
+            if balance_sheet_row is not None:
+                balance_sheet_rows.append(balance_sheet_row)
+            if income_statement_row is not None:
+                income_statement_rows.append(income_statement_row)
+    
+    market_data = pd.concat(market_frames, ignore_index=True) if market_frames else pd.DataFrame()
+    return (market_data, pd.DataFrame(fundamental_rows), pd.DataFrame(balance_sheet_rows),
+            pd.DataFrame(income_statement_rows))
+
+def _market_data_committed(tickers):
+    """
+    Run the hooks of committed market data writes
+    Core statements bypass the ORM session events, so the listeners are called explicitly
     
-    return market_data, fundamental_data, balance_sheet_data, income_statement_data
+    Parameters:
+        tickers (iterable): stock codes whose bars were written, None for all tickers
+    """
+    # Cached simulations of these tickers were run on the old history
+    if tickers is None:
+        simulation_cache.clear()
+    else:
+        simulation_cache.invalidate_tickers(tickers)
+    # New bars can make limit orders executable
+    notify_order_processor()
 
-def save_to_database(market_data, fundamental_data, balance_sheet_data, income_statement_data):
+def save_to_database(market_data, fundamental_data, balance_sheet_data, income_statement_data, engine=None,
+                     full_reload=False):
     """
     Save all collected data to MySQL database
+    Rows are upserted by (ticker, date) in batched chunks, so existing rows are updated,
+    new rows are inserted and the tables keep their primary keys and indexes
+    With full_reload, each table is instead rebuilt in a staging table and swapped in with an
+    atomic RENAME TABLE, so quotes and order execution keep reading the old rows until the swap
     
     Parameters:
         market_data (DataFrame): Market price and transaction volume data
         fundamental_data (DataFrame): Key financial indicators
         balance_sheet_data (DataFrame): Balance sheet information
         income_statement_data (DataFrame): Income statement information
+        engine (Engine): database engine, default the MySQL database of DB_CONFIG
+        full_reload (bool): replace all rows of each non-empty table with the given data
     """
-    # Create database connection string
-    connection_string = f"mysql+mysqlconnector://{DB_CONFIG['user']}:{DB_CONFIG['password']}@{DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['database']}?charset=utf8mb4"
+    def write(table, frame):
+        if full_reload:
+            return reload_table(engine, table, [frame])
+        with engine.begin() as connection:
+            return upsert_frame(connection, table, frame)
     
     try:
         # Create database engine
-        engine = create_engine(connection_string, echo=False)
+        engine = engine or _create_engine()
+        for table in STOCK_DATA_TABLES:
+            table.create(engine, checkfirst=True)
         
         # Check if there is data to save
         if not market_data.empty:
-            market_data.to_sql(name='market_data', con=engine, if_exists='replace', index=False)
-            print(f"Saved {len(market_data)} market data records")
+            count = write(MarketData.__table__, market_data)
+            # Core statements bypass the ORM session events, so refresh the latest quotes explicitly
+            with engine.begin() as connection:
+                quote_count = refresh_latest_quotes(connection, None if full_reload else market_data['ticker'].unique())
+            _market_data_committed(None if full_reload else market_data['ticker'].unique())
+            print(f"Saved {count} market data records")
+            print(f"Refreshed latest quotes for {quote_count} tickers")
         else:
             print("No market data to save")
             
-        if not fundamental_data.empty:
-            fundamental_data.to_sql(name='fundamental_data', con=engine, if_exists='replace', index=False)
-            print(f"Saved {len(fundamental_data)} fundamental data records")
-        else:
-            print("No fundamental data to save")
-            
-        if not balance_sheet_data.empty:
-            balance_sheet_data.to_sql(name='balance_sheet', con=engine, if_exists='replace', index=False)
-            print(f"Saved {len(balance_sheet_data)} balance sheet data records")
-        else:
-            print("No balance sheet data to save")
-            
-        if not income_statement_data.empty:
-            income_statement_data.to_sql(name='income_statement', con=engine, if_exists='replace', index=False)
-            print(f"Saved {len(income_statement_data)} income statement data records")
-        else:
-            print("No income statement data to save")
+        for frame, table, label in [
+            (fundamental_data, FundamentalData.__table__, 'fundamental data'),
+            (balance_sheet_data, BalanceSheet.__table__, 'balance sheet data'),
+            (income_statement_data, IncomeStatement.__table__, 'income statement data'),
+        ]:
+            if not frame.empty:
+                count = write(table, frame)
+                print(f"Saved {count} {label} records")
+            else:
+                print(f"No {label} to save")
             
         print("All data has been successfully written to the MySQL database!")
         
     except Exception as e:
         print(f"Error saving data to database: {str(e)}")
 
+def _save_ticker(engine, ticker, result, run_id):
+    """
+    Write the data of one stock fetched by _fetch_ticker and record its checkpoint, in one transaction
+    A stock without any historical data (result None) only gets its checkpoint
+    
+    Returns:
+        int: number of market data rows written
+    """
+    checkpoint = insert(IngestionCheckpoint.__table__)
+    if result is None:
+        with engine.begin() as connection:
+            connection.execute(checkpoint.values(run_id=run_id, ticker=ticker, market_rows=0))
+        return 0
+    ticker_market_data, fundamental_row, balance_sheet_row, income_statement_row = result
+    with engine.begin() as connection:
+        count = upsert_frame(connection, MarketData.__table__, ticker_market_data)
+        if count:
+            refresh_latest_quotes(connection, [ticker])
+        for row, table in [
+            (fundamental_row, FundamentalData.__table__),
+            (balance_sheet_row, BalanceSheet.__table__),
+            (income_statement_row, IncomeStatement.__table__),
+        ]:
+            if row is not None:
+                upsert_frame(connection, table, pd.DataFrame([row]))
+        connection.execute(checkpoint.values(run_id=run_id, ticker=ticker, market_rows=count))
+    if count:
+        _market_data_committed([ticker])
+    return count
+
+def _finish_run(engine):
+    """
+    Delete the checkpoints once a run is complete, so the next run (even on the same day
+    with the default run_id) fetches every ticker again; older runs' checkpoints go too
+    """
+    with engine.begin() as connection:
+        connection.execute(delete(IngestionCheckpoint.__table__))
+
+def stream_stock_data_collection(tickers=TECH_TICKERS, engine=None, run_id=None, max_workers=STOCK_FETCH_MAX_WORKERS,
+                                 rate=STOCK_FETCH_RATE, retries=STOCK_FETCH_RETRIES, backoff=STOCK_FETCH_BACKOFF):
+    """
+    Collect and store stock data ticker by ticker with bounded memory
+    Each ticker is written in its own transaction as soon as it is fetched, together with a
+    checkpoint row; at most 2 x max_workers fetched tickers are held in memory at any time.
+    Running again with the same run_id after a failure skips the tickers already checkpointed;
+    the checkpoints are deleted once every ticker is stored
+    
+    Parameters:
+        tickers (list): stock codes, default TECH_TICKERS
+        engine (Engine): database engine, default the MySQL database of DB_CONFIG
+        run_id (str): run identifier used for the checkpoints, default today's date, so a
+            run interrupted today resumes when started again
+        max_workers, rate, retries, backoff: same as fetch_stock_data
+        
+    Returns:
+        dict: run_id, written (tickers stored by this call), skipped (already checkpointed),
+            failed (tickers that could not be fetched or written) and market_rows
+    """
+    engine = engine or _create_engine()
+    run_id = run_id or datetime.now().strftime('%Y-%m-%d')
+    for table in STOCK_DATA_TABLES + [IngestionCheckpoint.__table__]:
+        table.create(engine, checkfirst=True)
+    
+    checkpoint = IngestionCheckpoint.__table__
+    with engine.connect() as connection:
+        finished = set(connection.execute(
+            select(checkpoint.c.ticker).where(checkpoint.c.run_id == run_id)
+        ).scalars())
+    pending = [ticker for ticker in tickers if ticker not in finished]
+    summary = {'run_id': run_id, 'written': [], 'skipped': sorted(finished & set(tickers)), 'failed': [],
+               'market_rows': 0}
+    if summary['skipped']:
+        print(f"Resuming run {run_id}: {len(summary['skipped'])} tickers already stored")
+    if not pending:
+        _finish_run(engine)
+        return summary
+    
+    start_dates = get_fetch_start_dates(engine, pending)
+    current_time = datetime.now()
+    call = _make_call(rate, retries, backoff)
+    queue = iter(pending)
+    
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(pending)))) as executor:
+        def submit_next():
+            ticker = next(queue, None)
+            if ticker is not None:
+                futures[executor.submit(_fetch_ticker, ticker, start_dates[ticker], current_time, call)] = ticker
+        
+        # Keep a bounded window of fetches in flight, refilled as results are written
+        futures = {}
+        for _ in range(2 * max_workers):
+            submit_next()
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                ticker = futures.pop(future)
+                try:
+                    summary['market_rows'] += _save_ticker(engine, ticker, future.result(), run_id)
+                    summary['written'].append(ticker)
+                    print(f"Stored data for {ticker}")
+                except Exception as e:
+                    print(f"Error collecting data for {ticker}: {str(e)}")
+                    summary['failed'].append(ticker)
+                submit_next()
+    
+    if not summary['failed']:
+        _finish_run(engine)
+    return summary
+
 def clear_database():
     """
     Clear all stock data tables in the database
     """
-    # Create database connection string
-    connection_string = f"mysql+mysqlconnector://{DB_CONFIG['user']}:{DB_CONFIG['password']}@{DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['database']}?charset=utf8mb4"
-    
     try:
         # Create database engine
-        engine = create_engine(connection_string, echo=False)
+        engine = _create_engine()
         
         # Clear each table
         with engine.connect() as connection:
@@ -229,12 +512,32 @@ def print_data_samples(market_data, fundamental_data, balance_sheet_data, income
     print("\n=====================================================")
 
 # Test function
-def run_stock_data_collection():
-    """Run the stock data collection and storage process"""
+def run_stock_data_collection(tickers=TECH_TICKERS, engine=None, stream=False, run_id=None, full_reload=False):
+    """
+    Run the stock data collection and storage process
+    
+    Parameters:
+        tickers (list): stock codes, default TECH_TICKERS
+        engine (Engine): database engine, default the MySQL database of DB_CONFIG
+        stream (bool): write each ticker as soon as it is fetched, with checkpoints
+            (see stream_stock_data_collection), for large universes
+        run_id (str): checkpoint run identifier of the streaming mode
+        full_reload (bool): fetch the full history of every ticker and swap it in through a
+            staging table instead of loading incrementally (not combined with stream)
+    """
     print("Starting to get stock data...")
+    engine = engine or _create_engine()
+    
+    if stream:
+        summary = stream_stock_data_collection(tickers, engine=engine, run_id=run_id)
+        print(f"\nStored {summary['market_rows']} market data records for {len(summary['written'])} tickers "
+              f"({len(summary['skipped'])} already stored, {len(summary['failed'])} failed)")
+        print("\nData collection and storage completed!")
+        return summary
     
-    # Get all stock data
-    market_data, fundamental_data, balance_sheet_data, income_statement_data = fetch_stock_data()
+    # Get the stock data not stored yet (everything for a full reload)
+    start_dates = {} if full_reload else get_fetch_start_dates(engine, tickers)
+    market_data, fundamental_data, balance_sheet_data, income_statement_data = fetch_stock_data(tickers, start_dates)
     
     # Display the record count of each dataset
     print(f"\nGot {len(market_data)} market data records")
@@ -245,7 +548,16 @@ def run_stock_data_collection():
     # Print sample data for verification
     print_data_samples(market_data, fundamental_data, balance_sheet_data, income_statement_data)
     
+    if full_reload:
+        fetched = set(market_data['ticker']) if not market_data.empty else set()
+        missing = [ticker for ticker in tickers if ticker not in fetched]
+        if missing:
+            # Swapping in the reload would drop the stored history of these tickers
+            print(f"Warning: no data fetched for {', '.join(missing)}, loading incrementally instead of a full reload")
+            full_reload = False
+    
     # Save all data to database
-    save_to_database(market_data, fundamental_data, balance_sheet_data, income_statement_data)
+    save_to_database(market_data, fundamental_data, balance_sheet_data, income_statement_data, engine=engine,
+                     full_reload=full_reload)
     
     print("\nData collection and storage completed!") 
\ No newline at end of file